@@ -1,7 +1,289 @@
 # -*- coding: utf-8 -*-
-import os, sys, json, re, urllib.parse as up, urllib.request as ur
+"""
+DMM アフィリエイト API（ItemList）で CID 1件を引いて正規化する。
+
+ライブラリとして（プロセスを起動せずに何件でも引ける）:
+  import api_fetch_by_cid as api
+  d = api.lookup("sweet101")              # 見つからなければ None
+  d = api.search_by_cid(aid, aff, cid)    # キーを自分で渡す場合
+  m = api.lookup_many(["a", "b", ...])    # 新着一覧を1回走査してまとめて引く
+
+CLI（従来どおり JSON を stdout へ）:
+  python fanza/api_fetch_by_cid.py --cid sweet101
+  python fanza/api_fetch_by_cid.py --cids sweet101,mfcs185
+
+HTTP は ApiClient が api.dmm.com への接続を keep-alive で使い回し、
+レスポンスは ApiCache（out/api_cache.sqlite3）に種類ごとの TTL でキャッシュする。
+"""
+import os, sys, json, re, time, queue, sqlite3, hashlib, threading, zlib, http.client, urllib.parse as up
+from contextlib import nullcontext
+from pathlib import Path
 
 API_HOST = "https://api.dmm.com/affiliate/v3/ItemList"
+_API = up.urlsplit(API_HOST)
+
+# レスポンスキャッシュ（DMM_API_CACHE=off で無効、パスを入れればその場所）
+CACHE_PATH = Path(__file__).resolve().parent.parent / "out" / "api_cache.sqlite3"
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 種類ごとの (新鮮とみなす秒数, 期限切れ後に古い値を返しつつ裏で取り直す秒数)
+#   listing : 新着一覧（sort=date のページ）。毎時の実行で新着を取りこぼさないよう短め
+#   keyword : keyword=cid の検索。作品情報はほぼ変わらない
+CACHE_TTLS = {
+    "listing": (300, 300),
+    "keyword": (6 * 3600, 24 * 3600),
+}
+
+class ApiError(RuntimeError):
+    pass
+
+def _endpoint(params):
+    return "keyword" if params.get("keyword") else "listing"
+
+class ApiCache:
+    """
+    ItemList レスポンスのディスクキャッシュ（SQLite 1ファイル）。
+    - キーは正規化したクエリ（空のパラメータを除いてソート）の sha1
+    - 種類ごとの TTL。期限切れでも stale 窓の中なら古い値を返し、裏で取り直す
+    - 取得に失敗したときは期限切れの値でも返す
+    - 合計サイズが max_bytes を超えたら最終アクセスの古い順に捨てる（LRU）
+    """
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttls=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS api_cache ("
+            " key TEXT PRIMARY KEY, endpoint TEXT, body BLOB, size INTEGER,"
+            " etag TEXT, last_modified TEXT, fetched_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS api_cache_accessed ON api_cache (accessed_at)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "revalidated": 0,
+                         "not_modified": 0, "stale_on_error": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls):
+        v = os.environ.get("DMM_API_CACHE", "")
+        if v.lower() in ("off", "0", "false", "no"):
+            return None
+        try:
+            return cls(v or CACHE_PATH)
+        except Exception as e:
+            print(f"[WARN] API キャッシュを開けません: {e}", file=sys.stderr)
+            return None
+
+    @staticmethod
+    def key(params):
+        norm = sorted((str(k), str(v)) for k, v in params.items() if v not in (None, ""))
+        return hashlib.sha1(up.urlencode(norm).encode("utf-8")).hexdigest()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        """(body, etag, last_modified, age 秒) or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM api_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE api_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        body, etag, lm, fetched_at = row
+        return zlib.decompress(body), etag, lm, time.time() - fetched_at
+
+    def put(self, key, endpoint, body, etag=None, last_modified=None):
+        blob = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO api_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, blob, len(blob), etag, last_modified, now, now),
+            )
+            self._db.commit()
+        self._evict()
+
+    def touch(self, key):
+        """304 で中身が変わっていなかったとき：取得時刻だけ進める"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE api_cache SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key)
+            )
+            self._db.commit()
+
+    def _evict(self):
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM api_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            target = int(self.max_bytes * 0.9)
+            rows = self._db.execute("SELECT key, size FROM api_cache ORDER BY accessed_at").fetchall()
+            drop = []
+            for k, size in rows:
+                if total <= target:
+                    break
+                drop.append((k,))
+                total -= size
+            self._db.executemany("DELETE FROM api_cache WHERE key = ?", drop)
+            self._db.commit()
+            self.counters["evicted"] += len(drop)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+class ApiClient:
+    """
+    api.dmm.com への HTTPS 接続プール（+ ApiCache）。
+    接続は使い終わったらプールへ戻して次のリクエストで再利用する（TLS ハンドシェイクは接続ごとに1回）。
+    複数スレッドから同時に使ってよい。
+    """
+    def __init__(self, pool_size=4, timeout=20, cache=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache = cache
+        self._pool = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.requests = 0      # 送ったリクエスト数
+        self.connections = 0   # 張った接続数
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            with self._lock:
+                self.connections += 1
+            return http.client.HTTPSConnection(_API.netloc, timeout=self.timeout), False
+
+    def _release(self, conn):
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(conn)
+        else:
+            conn.close()
+
+    def _fetch(self, params, etag=None, last_modified=None):
+        """(status, body, headers)。304 はそのまま返す"""
+        path = _API.path + "?" + up.urlencode({k: v for k, v in params.items() if v is not None})
+        headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused:
+                    continue  # サーバ側で切れていた keep-alive 接続なら張り直して再送
+                raise
+            with self._lock:
+                self.requests += 1
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if resp.status >= 400:
+                raise ApiError(f"HTTP {resp.status} {resp.reason}")
+            return resp.status, body, resp.headers
+
+    def _fetch_and_store(self, params, key, cached=None):
+        etag = lm = None
+        if cached is not None:
+            etag, lm = cached[1], cached[2]
+        status, body, headers = self._fetch(params, etag, lm)
+        if status == 304 and cached is not None:
+            self.cache.touch(key)
+            self.cache.count("not_modified")
+            return cached[0]
+        self.cache.put(key, _endpoint(params), body, headers.get("ETag"), headers.get("Last-Modified"))
+        return body
+
+    def _revalidate(self, params, key, cached):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def work():
+            try:
+                self._fetch_and_store(params, key, cached)
+                self.cache.count("revalidated")
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def get_json(self, params, use_cache=True):
+        cache = self.cache if use_cache else None
+        if cache is None:
+            return json.loads(self._fetch(params)[1].decode("utf-8", "replace"))
+
+        key = cache.key(params)
+        fresh, stale = cache.ttls.get(_endpoint(params), (0, 0))
+        cached = cache.get(key)
+        if cached is not None:
+            age = cached[3]
+            if age < fresh:
+                cache.count("hits")
+                return json.loads(cached[0].decode("utf-8", "replace"))
+            if age < fresh + stale:
+                cache.count("stale_hits")
+                self._revalidate(params, key, cached)
+                return json.loads(cached[0].decode("utf-8", "replace"))
+
+        cache.count("misses")
+        try:
+            body = self._fetch_and_store(params, key, cached)
+        except Exception:
+            if cached is None:
+                raise
+            cache.count("stale_on_error")
+            body = cached[0]
+        return json.loads(body.decode("utf-8", "replace"))
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            s = {"requests": self.requests, "connections": self.connections}
+        if self.cache is not None:
+            s.update(("cache_" + k, v) for k, v in self.cache.stats().items())
+        return s
+
+    def summary(self):
+        """実行サマリ用の1行"""
+        return " ".join(f"{k}={v}" for k, v in self.stats().items())
+
+_default_client = None
+_default_lock = threading.Lock()
+
+def default_client():
+    """プロセス内で共有するクライアント（キャッシュは DMM_API_CACHE に従う）"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = ApiClient(cache=ApiCache.from_env())
+        return _default_client
 
 def get_api_keys():
     aid = os.environ.get("API_ID") or os.environ.get("DMM_API_ID")
@@ -11,11 +293,8 @@ def get_api_keys():
         sys.exit(2)
     return aid, aff
 
-def call_itemlist(params):
-    url = API_HOST + "?" + up.urlencode(params)
-    with ur.urlopen(url, timeout=25) as resp:
-        body = resp.read().decode("utf-8", "replace")
-    return json.loads(body)
+def call_itemlist(params, client=None):
+    return (client or default_client()).get_json(params)
 
 def extract_items(j):
     res = j.get("result") if isinstance(j, dict) else None
@@ -118,7 +397,8 @@ def normalize_item(it):
         "date": date, "price": price, "source": "api",
     }
 
-def search_by_cid(aid, aff, cid, max_pages=5, hits=100):
+def search_by_cid(aid, aff, cid, max_pages=5, hits=100, client=None):
+    client = client or default_client()
     # 1) keyword=cid で情報が最も豊富な個体を優先
     variants = [
         {"site":"FANZA","service":"digital"},
@@ -136,9 +416,7 @@ def search_by_cid(aid, aff, cid, max_pages=5, hits=100):
                 "hits": hits, "offset": 1, "output": "json",
                 "keyword": cid,
             }
-            url = API_HOST + "?" + up.urlencode({k:v for k,v in params.items() if v})
-            with ur.urlopen(url, timeout=20) as resp:
-                j = json.loads(resp.read().decode("utf-8","replace"))
+            j = client.get_json({k:v for k,v in params.items() if v})
         except Exception:
             continue
         for it in extract_items(j):
@@ -169,7 +447,7 @@ def search_by_cid(aid, aff, cid, max_pages=5, hits=100):
             "floor": "videoc", "sort": "date",
             "hits": hits, "offset": offset, "output": "json",
         }
-        j = call_itemlist(params)
+        j = call_itemlist(params, client)
         items = extract_items(j)
         if not items:
             break
@@ -183,12 +461,101 @@ def search_by_cid(aid, aff, cid, max_pages=5, hits=100):
                 return normalize_item(it)
     return None
 
+def resolve_many(aid, aff, cids, max_pages=5, hits=100, client=None, stats=None, host_slot=None):
+    """
+    複数 CID をまとめて引く。{cid: 正規化 dict（見つからなければ None）} を返す。
+    1) videoc フロアの新着一覧（date 順）を1回だけ走査し、見えた CID をまとめて埋める
+       （全部そろったらその時点で止める）
+    2) 一覧に無かった残りだけ CID ごとの keyword 検索（一覧の再走査はしない）
+    stats に dict を渡すと API 呼び出し数などを書き込む。
+    host_slot(host) を渡すと、一覧1ページ・CID 1件ごとにその中で引く（呼び出し側のホスト予算に従う）。
+    """
+    client = client or default_client()
+    slot = (lambda: host_slot(_API.netloc)) if host_slot else nullcontext
+    stats = stats if stats is not None else {}
+    before = client.stats()["requests"]
+
+    wanted = {}
+    for c in cids:
+        if c and c.lower() not in wanted:
+            wanted[c.lower()] = c
+    out = {c: None for c in wanted.values()}
+    left = dict(wanted)
+
+    listing_calls = 0
+    for page in range(max_pages):
+        if not left:
+            break
+        params = {
+            "api_id": aid, "affiliate_id": aff,
+            "site": "FANZA", "service": "digital",
+            "floor": "videoc", "sort": "date",
+            "hits": hits, "offset": page * hits + 1, "output": "json",
+        }
+        try:
+            with slot():
+                items = extract_items(call_itemlist(params, client))
+        except Exception:
+            break
+        finally:
+            listing_calls += 1
+        if not items:
+            break
+        for it in items:
+            cand = it.get("cid")
+            if not cand:
+                u = it.get("URL") or it.get("url") or ""
+                m = re.search(r"[?&]id=([a-z0-9_]+)", u, re.I)
+                cand = m.group(1) if m else None
+            if cand and cand.lower() in left:
+                out[left.pop(cand.lower())] = normalize_item(it)
+    from_listing = len(wanted) - len(left)
+
+    for c in left.values():
+        with slot():
+            out[c] = search_by_cid(aid, aff, c, max_pages=0, client=client)
+
+    stats.update(
+        cids=len(wanted),
+        from_listing=from_listing,
+        from_keyword=sum(1 for c in left.values() if out[c]),
+        not_found=sum(1 for v in out.values() if not v),
+        listing_calls=listing_calls,
+        api_calls=client.stats()["requests"] - before,
+    )
+    return out
+
+def _env_keys():
+    aid = os.environ.get("API_ID") or os.environ.get("DMM_API_ID")
+    aff = os.environ.get("AFFILIATE_ID") or os.environ.get("DMM_AFFILIATE_ID")
+    if not aid or not aff:
+        raise ApiError("API_ID / AFFILIATE_ID が未設定")
+    return aid, aff
+
+def lookup_many(cids, client=None, stats=None, host_slot=None):
+    """環境変数のキーで複数 CID をまとめて引く（resolve_many）"""
+    aid, aff = _env_keys()
+    return resolve_many(aid, aff, cids, client=client, stats=stats, host_slot=host_slot)
+
+def lookup(cid, client=None):
+    """環境変数のキーで CID を引く（見つからなければ None）"""
+    aid, aff = _env_keys()
+    return search_by_cid(aid, aff, cid, client=client)
+
 def main():
     import argparse
     ap = argparse.ArgumentParser()
-    ap.add_argument("--cid", required=True)
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--cid")
+    g.add_argument("--cids", help="カンマ区切りでまとめて引く（{cid: item} を出力）")
     args = ap.parse_args()
     aid, aff = get_api_keys()
+    if args.cids:
+        stats = {}
+        res = resolve_many(aid, aff, [c.strip() for c in args.cids.split(",") if c.strip()], stats=stats)
+        print(json.dumps(res, ensure_ascii=False))
+        print("[API] " + " ".join(f"{k}={v}" for k, v in stats.items()), file=sys.stderr)
+        sys.exit(0)
     d = search_by_cid(aid, aff, args.cid)
     if not d:
         print(json.dumps({"error":"not_found","cid":args.cid}, ensure_ascii=False)); sys.exit(0)
@@ -70,5 +70,63 @@ STATICFILES_DIRS = [
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# 画像の manifest（data_getter/fanza/asset_store.py）。派生画像の srcset に使う（posts.images）
+ASSET_MANIFEST = MEDIA_ROOT.resolve().parent / 'asset_store' / 'manifest.sqlite3'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 閲覧数のまとめ書き（posts.view_counter）
+VIEW_COUNTER_FLUSH_INTERVAL = 60   # 秒
+VIEW_COUNTER_FLUSH_SIZE = 200      # 件
+VIEW_COUNTER_FLUSH_REQUEST = BASE_DIR / 'view_counter.flush'
+
+# 一覧をカーソル方式でページングする（posts.cursor）
+# 有効にすると ?page=N は POST_LIST_MAX_PAGE_NUMBER までになる
+POST_LIST_CURSOR_PAGINATION = os.environ.get('POST_LIST_CURSOR_PAGINATION', '0') == '1'
+POST_LIST_MAX_PAGE_NUMBER = 10
+
+# 記事詳細のフラグメントキャッシュ（posts.fragment_cache）
+#   POST_CACHE_BACKEND = locmem（既定） / file / redis
+_POST_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'post-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'post_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('POST_CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'post_fragments': {
+        **_POST_CACHE_BACKENDS[os.environ.get('POST_CACHE_BACKEND', 'locmem')],
+        'TIMEOUT': 60 * 60 * 24,
+    },
+}
+# 取り込み後に touch され、関連枠キャッシュの世代になる
+POST_CACHE_STAMP = BASE_DIR / 'post_cache.stamp'
+
+# 静的サイト書き出し（posts.static_export）。有効なら取り込みのたびに変わったページを書き出す
+STATIC_EXPORT_ENABLED = os.environ.get('STATIC_EXPORT', '0') == '1'
+STATIC_EXPORT_DIR = BASE_DIR / 'static_site'
+STATIC_EXPORT_MANIFEST = BASE_DIR / 'static_export.sqlite3'
+# canonical / og:url / sitemap に使う公開 URL
+STATIC_EXPORT_BASE_URL = os.environ.get('STATIC_EXPORT_BASE_URL', 'http://163.44.115.192')
+# 新着枠・他メーカー枠・人気ランキングだけが変わったページを描き直す間隔（秒）と1回の上限
+STATIC_EXPORT_SOFT_MAX_AGE = 6 * 60 * 60
+STATIC_EXPORT_SOFT_BATCH = 500
+# 描画プールの起動方式。スレッドの動いているプロセス（ingest_daemon）から呼ぶときは forkserver にする
+STATIC_EXPORT_START_METHOD = os.environ.get('STATIC_EXPORT_START_METHOD', 'fork')
+
+# manage.py sync_sizes_from_history が history.jsonl をどこまで読んだか
+SIZES_SYNC_CHECKPOINT = BASE_DIR / 'sizes_sync.checkpoint.json'
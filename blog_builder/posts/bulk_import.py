@@ -0,0 +1,331 @@
+"""
+JSONL の一括取り込み（auto_populate_content / auto_hourly_publish の --bulk）
+
+1行ずつ exists() → save() していたのをやめて、
+
+- JSONL は1行ずつ読みながら chunk_size 件ごとに区切る（ファイル全体を読み込まない）
+- 既存 CID は1チャンクにつき1回の cid IN (...) で引く
+- 新規分は1チャンク1トランザクションで bulk_create し、
+  ジャンル索引・検索索引もチャンク単位でまとめて作る
+
+にする。history.jsonl のような大きいファイルのバックフィル向け。
+チャンクの保存に失敗したときは、そのチャンクだけ1件ずつ保存し直して
+壊れた行を特定する。
+
+upsert()（--upsert）は既存 CID も更新する。取り込む値の dict の sha256 を
+Post.content_hash と比べ、同じなら何もしない。違えば値を比べて変わった
+フィールドだけを bulk_update し、変わった記事の CID だけを返す
+（キャッシュ無効化・静的書き出しはその CID だけに効く）。
+"""
+import hashlib
+import json
+import re
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .genres import sync_post_genres
+from .models import Post
+from .rendering import RENDERED_FIELDS, render_review_fields
+from . import search
+
+DEFAULT_CHUNK_SIZE = 500
+
+# 変わったら表示用フィールド（RENDERED_FIELDS）を計算し直すフィールド
+RENDER_SOURCES = {"review", "review_body", "name", "title"}
+# 変わったら検索索引を作り直すフィールド
+SEARCH_SOURCES = set(search.COLUMNS) | {"review_body"}
+
+
+def parse_sizes_to_bwh(sizes_text):
+    if not sizes_text:
+        return None, None, None
+    s = str(sizes_text)
+    m_b = re.search(r"B(\d+)", s)
+    m_w = re.search(r"W(\d+)", s)
+    m_h = re.search(r"H(\d+)", s)
+    b = int(m_b.group(1)) if m_b else None
+    w = int(m_w.group(1)) if m_w else None
+    h = int(m_h.group(1)) if m_h else None
+    return b, w, h
+
+
+def content_hash(fields):
+    """取り込む値の dict（record_fields の戻り値）のハッシュ"""
+    raw = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def iter_records(path, warn=None, bad=None):
+    """
+    JSONL を1行ずつ読んで (行番号, dict) を返す。
+    読めない行は warn に渡して飛ばし、bad（list）があれば行番号を足す
+    """
+    with open(path, encoding="utf-8") as f:
+        for idx, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                if warn:
+                    warn(f"[WARN] {idx} 行目の JSON パースに失敗: {e}")
+                if bad is not None:
+                    bad.append(idx)
+                continue
+            if not isinstance(data, dict):
+                continue
+            yield idx, data
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def existing_cids(cids):
+    """cids のうち登録済みのもの（1回の IN クエリ）"""
+    return set(Post.objects.filter(cid__in=list(cids)).values_list("cid", flat=True))
+
+
+def _save_chunk(posts):
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        sync_post_genres(posts)
+        search.index_posts(posts)
+
+
+def _finish(stats, started):
+    """経過秒と行/秒を入れる（行/秒は丸める前の経過時間から出す）"""
+    elapsed = time.monotonic() - started
+    stats["sec"] = round(elapsed, 2)
+    stats["rows_per_sec"] = round(stats["rows"] / elapsed, 1) if elapsed > 0 else float(stats["rows"])
+
+
+def import_new(path, build, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, warn=None, progress=None):
+    """
+    path の JSONL のうち未登録の CID を bulk_create する。
+
+    build(data) は保存前の Post（render_review_fields 済み）を返す。None なら飛ばす。
+    件数と作成した記事の maker / cid を dict で返す。
+    """
+    stats = {
+        "rows": 0, "created": 0, "skipped": 0, "errors": 0,
+        "sec": 0.0, "rows_per_sec": 0.0, "makers": set(), "cids": [],
+    }
+    chunk_size = max(1, chunk_size)
+    started = time.monotonic()
+    bad = []
+
+    for chunk in chunked(iter_records(path, warn, bad), chunk_size):
+        stats["rows"] += len(chunk)
+        by_cid = {}
+        for idx, data in chunk:
+            cid = str(data.get("cid") or "").strip()
+            if not cid:
+                stats["errors"] += 1
+                if warn:
+                    warn(f"[WARN] {idx} 行目: cid が無いためスキップ")
+                continue
+            if cid in by_cid:
+                # 同じ CID が続けて出てきたら先の行を使う（1件ずつ取り込む場合と同じ）
+                stats["skipped"] += 1
+                continue
+            data["cid"] = cid
+            by_cid[cid] = (idx, data)
+
+        known = existing_cids(by_cid)
+        stats["skipped"] += len(known)
+
+        posts = []
+        for cid, (idx, data) in by_cid.items():
+            if cid in known:
+                continue
+            try:
+                post = build(data)
+            except Exception as e:
+                stats["errors"] += 1
+                if warn:
+                    warn(f"[ERROR] {idx} 行目 cid={cid} の変換に失敗しました: {e}")
+                continue
+            if post is not None:
+                posts.append(post)
+
+        if posts and not dry_run:
+            try:
+                _save_chunk(posts)
+            except Exception:
+                # どの行が悪いか分からないので、このチャンクだけ1件ずつ保存し直す
+                saved = []
+                for post in posts:
+                    post.pk = None
+                    post._state.adding = True
+                    try:
+                        _save_chunk([post])
+                        saved.append(post)
+                    except Exception as e:
+                        stats["errors"] += 1
+                        if warn:
+                            warn(f"[ERROR] cid={post.cid} の保存に失敗しました: {e}")
+                posts = saved
+
+        stats["created"] += len(posts)
+        stats["makers"].update(p.maker for p in posts)
+        stats["cids"].extend(p.cid for p in posts)
+        if progress:
+            elapsed = time.monotonic() - started
+            progress(f"[..] {stats['rows']} 行 / created={stats['created']}"
+                     f"（{stats['rows'] / elapsed if elapsed else 0:.0f} 行/秒）")
+
+    stats["errors"] += len(bad)
+    stats["rows"] += len(bad)
+    _finish(stats, started)
+    return stats
+
+
+def _write(created, updated, hash_only):
+    """
+    1チャンクぶんを1トランザクションで書く。
+    updated は [(post, 変わったフィールドの tuple)]。
+    """
+    with transaction.atomic():
+        if created:
+            Post.objects.bulk_create(created)
+        groups = defaultdict(list)
+        for post, fields in updated:
+            groups[fields].append(post)
+        for fields, posts in groups.items():
+            Post.objects.bulk_update(posts, [*fields, "content_hash"])
+        if hash_only:
+            Post.objects.bulk_update(hash_only, ["content_hash"])
+
+        sync_post_genres(created + [p for p, fields in updated if "genres" in fields])
+        search.index_posts(created + [p for p, fields in updated if SEARCH_SOURCES.intersection(fields)])
+
+
+def upsert(path, fields_of, build, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, warn=None, progress=None):
+    """
+    path の JSONL を取り込み、未登録の CID は作成、登録済みは変わったフィールドだけ更新する。
+
+    fields_of(data) は Post に入れる値の dict、build(data) は新規作成用の Post を返す
+    （build は content_hash もセットすること）。同じ CID が何度も出てきたら後の行を使う。
+    件数・触ったメーカー・作成/更新した CID・フィールドごとの更新数を dict で返す。
+    """
+    stats = {
+        "rows": 0, "created": 0, "updated": 0, "unchanged": 0, "errors": 0,
+        "sec": 0.0, "rows_per_sec": 0.0, "makers": set(), "cids": [], "fields": Counter(),
+    }
+    chunk_size = max(1, chunk_size)
+    started = time.monotonic()
+    bad = []
+
+    for chunk in chunked(iter_records(path, warn, bad), chunk_size):
+        stats["rows"] += len(chunk)
+        incoming = {}
+        for idx, data in chunk:
+            cid = str(data.get("cid") or "").strip()
+            if not cid:
+                stats["errors"] += 1
+                if warn:
+                    warn(f"[WARN] {idx} 行目: cid が無いためスキップ")
+                continue
+            data["cid"] = cid
+            try:
+                fields = fields_of(data)
+            except Exception as e:
+                stats["errors"] += 1
+                if warn:
+                    warn(f"[ERROR] {idx} 行目 cid={cid} の変換に失敗しました: {e}")
+                continue
+            if cid in incoming:
+                stats["unchanged"] += 1
+            incoming[cid] = (idx, data, fields, content_hash(fields))
+
+        # ハッシュが同じ行はここで終わり（記事本体は読まない）
+        stored = dict(Post.objects.filter(cid__in=list(incoming)).values_list("cid", "content_hash"))
+        changed = [cid for cid in incoming if cid in stored and stored[cid] != incoming[cid][3]]
+        stats["unchanged"] += len(stored) - len(changed)
+
+        created, updated, hash_only = [], [], []
+        for cid, (idx, data, fields, h) in incoming.items():
+            if cid in stored:
+                continue
+            try:
+                post = build(data)
+            except Exception as e:
+                stats["errors"] += 1
+                if warn:
+                    warn(f"[ERROR] {idx} 行目 cid={cid} の変換に失敗しました: {e}")
+                continue
+            if post is not None:
+                created.append(post)
+
+        for post in Post.objects.filter(cid__in=changed) if changed else ():
+            fields, h = incoming[post.cid][2], incoming[post.cid][3]
+            old_maker = post.maker
+            diff = [f for f, v in fields.items() if getattr(post, f) != v]
+            for f in diff:
+                setattr(post, f, fields[f])
+            if RENDER_SOURCES.intersection(diff):
+                before = [getattr(post, f) for f in RENDERED_FIELDS]
+                render_review_fields(post)
+                diff += [f for f, old in zip(RENDERED_FIELDS, before) if getattr(post, f) != old]
+            post.content_hash = h
+            if diff:
+                updated.append((post, tuple(sorted(diff))))
+                stats["makers"].add(old_maker)
+                stats["fields"].update(diff)
+            else:
+                # ハッシュ未保存の旧データなど、値は同じでハッシュだけ違うもの
+                hash_only.append(post)
+                stats["unchanged"] += 1
+
+        if not dry_run and (created or updated or hash_only):
+            try:
+                _write(created, updated, hash_only)
+            except Exception:
+                # どの行が悪いか分からないので、このチャンクだけ1件ずつ書き直す
+                ok_created, ok_updated = [], []
+                for post in created:
+                    post.pk = None
+                    post._state.adding = True
+                    try:
+                        _write([post], [], [])
+                        ok_created.append(post)
+                    except Exception as e:
+                        stats["errors"] += 1
+                        if warn:
+                            warn(f"[ERROR] cid={post.cid} の保存に失敗しました: {e}")
+                for item in updated + [(p, ()) for p in hash_only]:
+                    try:
+                        _write([], [item] if item[1] else [], [] if item[1] else [item[0]])
+                        if item[1]:
+                            ok_updated.append(item)
+                    except Exception as e:
+                        stats["errors"] += 1
+                        if warn:
+                            warn(f"[ERROR] cid={item[0].cid} の更新に失敗しました: {e}")
+                created, updated = ok_created, ok_updated
+
+        stats["created"] += len(created)
+        stats["updated"] += len(updated)
+        for post in created + [p for p, _ in updated]:
+            stats["makers"].add(post.maker)
+            stats["cids"].append(post.cid)
+        if progress:
+            elapsed = time.monotonic() - started
+            progress(f"[..] {stats['rows']} 行 / created={stats['created']} updated={stats['updated']}"
+                     f"（{stats['rows'] / elapsed if elapsed else 0:.0f} 行/秒）")
+
+    stats["errors"] += len(bad)
+    stats["rows"] += len(bad)
+    _finish(stats, started)
+    return stats
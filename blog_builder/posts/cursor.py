@@ -0,0 +1,84 @@
+"""
+一覧のカーソル（キーセット）ページング
+
+並び順は (-release_date, -id)。ページの先頭／末尾の (release_date, id) を
+トークンにして、次ページは「その行より後ろ」を WHERE で取る。
+OFFSET も COUNT(*) も使わないので、深いページでも速さが変わらない。
+
+release_date が NULL の記事は SQLite の降順どおり末尾に並ぶ前提。
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import F, Q
+
+
+def encode_cursor(post):
+    rd = post.release_date.isoformat() if post.release_date else ""
+    raw = f"{rd}|{post.pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """トークン → (release_date or None, id)。不正なら ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        rd, pk = raw.rsplit("|", 1)
+        return (datetime.fromisoformat(rd) if rd else None), int(pk)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {token!r}") from e
+
+
+def _after_q(rd, pk):
+    if rd is None:
+        return Q(release_date__isnull=True, id__lt=pk)
+    return Q(release_date__lt=rd) | Q(release_date=rd, id__lt=pk) | Q(release_date__isnull=True)
+
+
+def _before_q(rd, pk):
+    if rd is None:
+        return Q(release_date__isnull=False) | Q(release_date__isnull=True, id__gt=pk)
+    return Q(release_date__gt=rd) | Q(release_date=rd, id__gt=pk)
+
+
+def keyset_page(qs, per_page, after=None, before=None, page=1):
+    """
+    qs は (-release_date, -id) 順のクエリセット。
+    after / before はトークン、どちらも無ければ page 番号（浅いページ用に OFFSET）。
+    テンプレート用の dict を返す。
+    """
+    if before:
+        rd, pk = decode_cursor(before)
+        rows = list(
+            qs.filter(_before_q(rd, pk))
+            .order_by(F("release_date").asc(nulls_first=True), "id")[:per_page + 1]
+        )
+        if not rows:
+            # 先頭より前を指された場合は1ページ目を返す
+            return keyset_page(qs, per_page)
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    elif after:
+        rd, pk = decode_cursor(after)
+        rows = list(qs.filter(_after_q(rd, pk))[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = True
+    else:
+        offset = (page - 1) * per_page
+        rows = list(qs[offset:offset + per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = page > 1
+
+    if not rows:
+        has_next = has_previous = False
+
+    return {
+        "object_list": rows,
+        "has_next": has_next,
+        "has_previous": has_previous,
+        "next_token": encode_cursor(rows[-1]) if has_next else "",
+        "prev_token": encode_cursor(rows[0]) if has_previous else "",
+    }
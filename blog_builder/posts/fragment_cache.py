@@ -0,0 +1,103 @@
+"""
+記事詳細のフラグメントキャッシュ
+
+post_detail で毎回やっていた Markdown 変換・抜粋・ジャンル組み合わせ・関連枠の
+クエリ結果を cid ごとにキャッシュする。バックエンドは settings.CACHES の
+"post_fragments"（locmem / file / redis を POST_CACHE_BACKEND で切り替え）。
+
+- 本文系（content）: キーに Post.updated_at を含める。取り込みで save() されれば
+  自動的に別キーになる。save() しない更新は invalidate() で updated_at を進める。
+- 関連枠（related）: 他の記事の追加でも変わるので、POST_CACHE_STAMP の mtime を
+  世代としてキーに含める。invalidate() がこのファイルを touch する。
+
+どちらも DB / ファイル経由なので、取り込みコマンド（別プロセス）からの無効化が
+Web プロセスの locmem キャッシュにも効く。
+"""
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import Post
+
+CACHE_ALIAS = "post_fragments"
+# 関連枠の有効期限（おすすめの選び方が1時間ごとに変わるので、それより長くしない）
+RELATED_TIMEOUT = 60 * 60
+
+_last_stamp_check = 0.0
+_stamp = 0
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _stamp_path():
+    p = getattr(settings, "POST_CACHE_STAMP", None)
+    return Path(p) if p else Path(settings.BASE_DIR) / "post_cache.stamp"
+
+
+def _generation():
+    """関連枠の世代（スタンプファイルの mtime。stat は1秒に1回まで）"""
+    global _last_stamp_check, _stamp
+    now = time.monotonic()
+    if now - _last_stamp_check >= 1.0:
+        _last_stamp_check = now
+        try:
+            _stamp = _stamp_path().stat().st_mtime_ns
+        except OSError:
+            _stamp = 0
+    return _stamp
+
+
+def content_key(post):
+    version = post.updated_at.timestamp() if post.updated_at else 0
+    return f"post:{post.cid}:content:{version:.6f}"
+
+
+def related_key(post):
+    return f"post:{post.cid}:related:{_generation()}:{timezone.now():%Y%m%d%H}"
+
+
+def _get_or_build(key, build, post, timeout=None):
+    cache = _cache()
+    data = cache.get(key)
+    if data is None:
+        data = build(post)
+        if timeout is None:
+            cache.set(key, data)
+        else:
+            cache.set(key, data, timeout)
+    return data
+
+
+def get_content(post, build):
+    """本文系フラグメント（無ければ build(post) で作って保存）"""
+    return _get_or_build(content_key(post), build, post)
+
+
+def get_related(post, build):
+    """関連枠フラグメント（無ければ build(post) で作って保存）"""
+    return _get_or_build(related_key(post), build, post, RELATED_TIMEOUT)
+
+
+def invalidate(cids=None):
+    """
+    取り込み後に呼ぶ。
+    - cids の記事は updated_at を進めて本文系のキーを切り替える
+      （save() 済みの記事を渡しても害はない）
+    - 関連枠は全記事ぶん世代を進める
+    """
+    global _last_stamp_check
+    updated = 0
+    cids = [c for c in (cids or []) if c]
+    for i in range(0, len(cids), 500):
+        updated += Post.objects.filter(cid__in=cids[i:i + 500]).update(updated_at=timezone.now())
+
+    path = _stamp_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    _last_stamp_check = 0.0
+    return updated
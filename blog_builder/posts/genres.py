@@ -0,0 +1,54 @@
+from django.db import transaction
+
+from .models import Post, PostGenre
+
+
+def to_list(genres):
+    """Post.genres（list / 区切り文字列）をジャンル名のリストにする"""
+    if isinstance(genres, list):
+        return [g for g in genres if isinstance(g, str)]
+    if isinstance(genres, str):
+        return [g.strip() for g in genres.split('/') if g.strip()] \
+            or [g.strip() for g in genres.split('、') if g.strip()] \
+            or [g.strip() for g in genres.split(',') if g.strip()]
+    return []
+
+
+def sync_post_genres(posts):
+    """
+    渡された記事の PostGenre 行を Post.genres に合わせて作り直す。
+    取り込みコマンドから save() の後に呼ぶ。
+    """
+    posts = [p for p in posts if p.pk]
+    if not posts:
+        return 0
+
+    rows = []
+    for p in posts:
+        seen = set()
+        for name in to_list(p.genres):
+            name = name.strip()[:100]
+            if not name or name in seen:
+                continue
+            seen.add(name)
+            rows.append(PostGenre(post_id=p.pk, name=name))
+
+    with transaction.atomic():
+        PostGenre.objects.filter(post_id__in=[p.pk for p in posts]).delete()
+        PostGenre.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def rebuild_genre_index(chunk_size=1000):
+    """全記事ぶんの索引を作り直す（初回導入・不整合時用）"""
+    total = 0
+    qs = Post.objects.only("id", "genres").order_by("id")
+    chunk = []
+    for p in qs.iterator(chunk_size=chunk_size):
+        chunk.append(p)
+        if len(chunk) >= chunk_size:
+            total += sync_post_genres(chunk)
+            chunk = []
+    if chunk:
+        total += sync_post_genres(chunk)
+    return total
@@ -0,0 +1,97 @@
+"""
+記事画像の派生版（縮小版・WebP/AVIF）の参照
+
+data_getter の fanza/image_variants.py が content/asset_store/manifest.sqlite3 に
+記録した派生画像を読み、<picture> / srcset 用の URL と幅・高さを組み立てる。
+manifest が無い・派生画像がまだの画像は、従来どおり /media/{cid}_{slot}.jpg だけを返す。
+
+manifest は別プロセス（取り込み側）が書くので、ここでは読み取り専用で開く。
+"""
+import sqlite3
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+MIME = {"avif": "image/avif", "webp": "image/webp", "jpg": "image/jpeg"}
+# <source> に並べる順（先に書いたものをブラウザが優先する）
+SOURCE_ORDER = ("avif", "webp")
+
+_local = threading.local()
+
+
+def _manifest_path():
+    p = getattr(settings, "ASSET_MANIFEST", None)
+    return Path(p) if p else Path(settings.MEDIA_ROOT).resolve().parent / "asset_store" / "manifest.sqlite3"
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        path = _manifest_path()
+        if not path.exists():
+            return None
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+        except sqlite3.Error:
+            return None
+        _local.conn = conn
+    return conn
+
+
+def _url(path):
+    return f"{settings.MEDIA_URL.rstrip('/')}/{path}"
+
+
+def lookup(cid, slot):
+    """
+    (原寸の URL, 幅, 高さ, [(fmt, width, URL), ...]) を返す。manifest に無ければ None。
+    """
+    conn = _conn()
+    if conn is None:
+        return None
+    try:
+        rows = conn.execute(
+            "SELECT a.path, b.width, b.height, v.fmt, v.width, v.path FROM assets a"
+            " JOIN blobs b ON b.hash = a.hash"
+            " LEFT JOIN variants v ON v.hash = a.hash"
+            " WHERE a.cid = ? AND a.slot = ? ORDER BY v.width",
+            (cid, slot),
+        ).fetchall()
+    except sqlite3.Error:
+        _local.conn = None
+        return None
+    if not rows:
+        return None
+    path, width, height = rows[0][:3]
+    variants = [(fmt, w, _url(p)) for _, _, _, fmt, w, p in rows if fmt]
+    return _url(path), width, height, variants
+
+
+def picture(cid, slot="01"):
+    """
+    テンプレート用の dict。
+      src / width / height : <img> の原寸
+      srcset               : jpg の縮小版＋原寸（<img srcset>）
+      sources              : [{"type": "image/avif", "srcset": ...}, ...]（<source>）
+    """
+    fallback = {"src": _url(f"{cid}_{slot}.jpg"), "width": None, "height": None,
+                "srcset": "", "sources": []}
+    found = lookup(cid, slot)
+    if not found:
+        return fallback
+    src, width, height, variants = found
+    by_fmt = {}
+    for fmt, w, url in variants:
+        by_fmt.setdefault(fmt, []).append(f"{url} {w}w")
+    jpg = by_fmt.get("jpg", [])
+    return {
+        "src": src,
+        "width": width,
+        "height": height,
+        "srcset": ", ".join(jpg + ([f"{src} {width}w"] if jpg and width else [])),
+        "sources": [
+            {"type": MIME[fmt], "srcset": ", ".join(by_fmt[fmt])}
+            for fmt in SOURCE_ORDER if fmt in by_fmt
+        ],
+    }
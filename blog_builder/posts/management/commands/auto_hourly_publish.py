@@ -5,29 +5,125 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.apps import apps
 
+from posts.genres import sync_post_genres
+from posts.recommend import refresh_maker_rings
+from posts import bulk_import, fragment_cache, search, static_export
+from posts.rendering import render_review_fields
+
 
 JSONL_PATH = Path("/root/eroblog/data_getter/out/videoc_latest_enriched.jsonl")
 
 
+def record_fields(item):
+    """JSONL の1レコードのうち、モデルにあって None でない値の dict（--upsert の比較に使う）"""
+    Post = apps.get_model("posts", "Post")
+    model_fields = {f.name for f in Post._meta.get_fields()}
+
+    # よく使うキーだけ、モデルに存在するものだけ入れる
+    mapping = {
+        "title": item.get("title"),
+        "description": item.get("description"),
+        "affiliate_url": item.get("affiliate_url"),
+        "poster_url": item.get("poster_url"),
+        "sample_movie_url": item.get("sample_movie_url"),
+        "sample_images": item.get("sample_images"),
+        "review": item.get("review") or item.get("review_body"),
+        "review_body": item.get("review_body"),
+        "name": item.get("name"),
+        "label": item.get("label"),
+        "maker": item.get("maker"),
+        "series": item.get("series"),
+        "genres": item.get("genres"),
+        "performers": item.get("performers"),
+        "date": item.get("date"),
+        "price": item.get("price"),
+        "review_count": item.get("review_count"),
+        "review_average": item.get("review_average"),
+        "bust": item.get("bust"),
+        "waist": item.get("waist"),
+        "hip": item.get("hip"),
+    }
+    return {k: v for k, v in mapping.items() if k in model_fields and v is not None}
+
+
+def build_post(item):
+    """JSONL の1レコードから保存前の Post を作る（1件ずつ・--bulk の両方で使う）"""
+    Post = apps.get_model("posts", "Post")
+    model_fields = {f.name for f in Post._meta.get_fields()}
+    fields = record_fields(item)
+    p = Post(cid=(item.get("cid") or "").strip(), content_hash=bulk_import.content_hash(fields))
+    for k, v in fields.items():
+        setattr(p, k, v)
+
+    # 本文HTML・抜粋はここで計算して保存する
+    render_review_fields(p)
+
+    # 「公開」フラグがモデルにあれば立てる（無ければDB追加=公開扱い）
+    if "is_published" in model_fields:
+        setattr(p, "is_published", True)
+    if "published_at" in model_fields:
+        setattr(p, "published_at", timezone.now())
+    if "status" in model_fields:
+        try:
+            setattr(p, "status", "published")
+        except Exception:
+            pass
+    return p
+
+
 class Command(BaseCommand):
     help = "Publish all new CIDs found in videoc_latest_enriched.jsonl (multi-line supported)."
 
+    def add_arguments(self, parser):
+        parser.add_argument("--jsonl", default=str(JSONL_PATH), help="input JSONL (default: %(default)s)")
+        parser.add_argument("--bulk", action="store_true",
+                            help="stream the file and bulk_create new posts in chunks (for large backfills)")
+        parser.add_argument("--chunk-size", type=int, default=bulk_import.DEFAULT_CHUNK_SIZE,
+                            help="rows per transaction with --bulk / --upsert")
+        parser.add_argument("--upsert", action="store_true",
+                            help="also update existing CIDs, writing only the fields that changed")
+
     def handle(self, *args, **options):
         Post = apps.get_model("posts", "Post")
+        jsonl_path = Path(options["jsonl"])
+
+        if not jsonl_path.exists():
+            self.stdout.write(self.style.WARNING(f"SKIP: jsonl not found: {jsonl_path}"))
+            return
+
+        if options["upsert"]:
+            stats = bulk_import.upsert(
+                jsonl_path, record_fields, build_post, chunk_size=options["chunk_size"],
+                warn=lambda msg: self.stdout.write(self.style.WARNING(msg)), progress=self.stdout.write,
+            )
+            self._after_import(stats["makers"], stats["cids"])
+            self.stdout.write(self.style.SUCCESS(
+                f"done: created={stats['created']}, updated={stats['updated']}, unchanged={stats['unchanged']},"
+                f" errors={stats['errors']} ({stats['rows']} rows in {stats['sec']}s, {stats['rows_per_sec']} rows/sec)"
+            ))
+            return
 
-        if not JSONL_PATH.exists():
-            self.stdout.write(self.style.WARNING(f"SKIP: jsonl not found: {JSONL_PATH}"))
+        if options["bulk"]:
+            stats = bulk_import.import_new(
+                jsonl_path, build_post, chunk_size=options["chunk_size"],
+                warn=lambda msg: self.stdout.write(self.style.WARNING(msg)), progress=self.stdout.write,
+            )
+            self._after_import(stats["makers"], stats["cids"])
+            self.stdout.write(self.style.SUCCESS(
+                f"done: created={stats['created']}, skipped_existing={stats['skipped']}, errors={stats['errors']}"
+                f" ({stats['rows']} rows in {stats['sec']}s, {stats['rows_per_sec']} rows/sec)"
+            ))
             return
 
-        raw = JSONL_PATH.read_text(encoding="utf-8").strip()
+        raw = jsonl_path.read_text(encoding="utf-8").strip()
         if not raw:
             self.stdout.write(self.style.WARNING("SKIP: jsonl is empty"))
             return
 
-        model_fields = {f.name for f in Post._meta.get_fields()}
-
         created = 0
         skipped = 0
+        touched_makers = set()
+        created_cids = []
 
         for line in raw.splitlines():
             line = line.strip()
@@ -49,49 +145,22 @@ class Command(BaseCommand):
                 skipped += 1
                 continue
 
-            p = Post(cid=cid)
-
-            # よく使うキーだけ、モデルに存在するものだけ入れる
-            mapping = {
-                "title": item.get("title"),
-                "description": item.get("description"),
-                "affiliate_url": item.get("affiliate_url"),
-                "poster_url": item.get("poster_url"),
-                "sample_movie_url": item.get("sample_movie_url"),
-                "sample_images": item.get("sample_images"),
-                "review": item.get("review"),
-                "review_html": item.get("review_html"),
-                "name": item.get("name"),
-                "label": item.get("label"),
-                "maker": item.get("maker"),
-                "series": item.get("series"),
-                "genres": item.get("genres"),
-                "performers": item.get("performers"),
-                "date": item.get("date"),
-                "price": item.get("price"),
-                "review_count": item.get("review_count"),
-                "review_average": item.get("review_average"),
-                "bust": item.get("bust"),
-                "waist": item.get("waist"),
-                "hip": item.get("hip"),
-            }
-
-            for k, v in mapping.items():
-                if k in model_fields and v is not None:
-                    setattr(p, k, v)
-
-            # 「公開」フラグがモデルにあれば立てる（無ければDB追加=公開扱い）
-            if "is_published" in model_fields:
-                setattr(p, "is_published", True)
-            if "published_at" in model_fields:
-                setattr(p, "published_at", timezone.now())
-            if "status" in model_fields:
-                try:
-                    setattr(p, "status", "published")
-                except Exception:
-                    pass
+            p = build_post(item)
 
             p.save()
+            sync_post_genres([p])
+            search.index_posts([p])
+            touched_makers.add(p.maker)
+            created_cids.append(cid)
             created += 1
 
+        self._after_import(touched_makers, created_cids)
         self.stdout.write(self.style.SUCCESS(f"done: created={created}, skipped_existing={skipped}"))
+
+    def _after_import(self, touched_makers, created_cids):
+        if touched_makers:
+            refresh_maker_rings(touched_makers)
+        if created_cids:
+            fragment_cache.invalidate(created_cids)
+            if static_export.enabled():
+                static_export.export(stdout=self.stdout)
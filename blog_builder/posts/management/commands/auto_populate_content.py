@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import json
-import re
 from pathlib import Path
 from datetime import datetime
 
@@ -10,33 +9,11 @@ from django.db import transaction
 from django.utils import timezone
 
 from posts.models import Post
-
-
-def safe_assign(instance, field_name, value):
-    if value is None:
-        return
-    model = instance.__class__
-    try:
-        field = model._meta.get_field(field_name)
-    except FieldDoesNotExist:
-        return
-    from django.db.models.fields.related import ManyToManyField
-    if isinstance(field, ManyToManyField):
-        return
-    setattr(instance, field_name, value)
-
-
-def parse_sizes_to_bwh(sizes_text):
-    if not sizes_text:
-        return None, None, None
-    s = str(sizes_text)
-    m_b = re.search(r"B(\d+)", s)
-    m_w = re.search(r"W(\d+)", s)
-    m_h = re.search(r"H(\d+)", s)
-    b = int(m_b.group(1)) if m_b else None
-    w = int(m_w.group(1)) if m_w else None
-    h = int(m_h.group(1)) if m_h else None
-    return b, w, h
+from posts.genres import sync_post_genres
+from posts.recommend import refresh_maker_rings
+from posts import bulk_import, fragment_cache, search, static_export
+from posts.rendering import render_review_fields
+from posts.bulk_import import parse_sizes_to_bwh
 
 
 def normalize_genres(raw):
@@ -77,12 +54,101 @@ def parse_dt_loose(s):
         return None
 
 
+def _model_field(field_name):
+    try:
+        field = Post._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return False
+    from django.db.models.fields.related import ManyToManyField
+    return not isinstance(field, ManyToManyField)
+
+
+def record_fields(data):
+    """
+    JSONL の1レコードを Post に入れる値の dict にする（None とモデルに無い
+    フィールドは入れない）。upsert の比較とハッシュはこの dict で行う
+    """
+    fields = {}
+
+    def put(field_name, value):
+        if value is not None and _model_field(field_name):
+            fields[field_name] = value
+
+    cid = data.get("cid")
+    put("title", data.get("title") or cid)
+
+    name = data.get("name")
+    if not name:
+        performers = data.get("performers") or []
+        if performers:
+            first = performers[0]
+            if isinstance(first, dict):
+                name = first.get("name") or first.get("title")
+            else:
+                name = str(first)
+    put("name", name)
+
+    review = data.get("review_body") or data.get("review") or data.get("description")
+    put("review_body", review)
+    put("review", review)
+
+    put("maker", data.get("maker"))
+    put("label", data.get("label"))
+    put("series", data.get("series"))
+
+    put("affiliate_url", data.get("affiliate_url"))
+    put("sample_movie_url", data.get("sample_movie_url"))
+    put("poster_url", data.get("poster_url"))
+
+    imgs = data.get("sample_images") or []
+    if isinstance(imgs, list) and imgs:
+        put("sample_images", imgs[:10])
+
+    genres = normalize_genres(data.get("genres"))
+    if genres:
+        put("genres", genres)
+        put("genre", ", ".join(genres))
+        put("genre_text", ", ".join(genres))
+
+    sizes_text = data.get("sizes") or data.get("sizes_text")
+    if sizes_text:
+        put("sizes", sizes_text)
+        b, w, h = parse_sizes_to_bwh(sizes_text)
+        put("bust", b)
+        put("waist", w)
+        put("hip", h)
+
+    # 日付が無いレコードは新規作成時だけ現在時刻にする（upsert で既存の日付を潰さない）
+    put("release_date", parse_dt_loose(data.get("date")) or parse_dt_loose(data.get("release_date")))
+    return fields
+
+
+def build_post(data):
+    """JSONL の1レコードから保存前の Post を作る（1件ずつ・--bulk の両方で使う）"""
+    fields = record_fields(data)
+    post = Post(cid=data.get("cid"), content_hash=bulk_import.content_hash(fields))
+    for field_name, value in fields.items():
+        setattr(post, field_name, value)
+    if post.release_date is None:
+        post.release_date = timezone.now()
+
+    # 本文HTML・抜粋はここで計算して保存する（表示時には変換しない）
+    render_review_fields(post)
+    return post
+
+
 class Command(BaseCommand):
     help = "FANZA enriched JSONL から Post モデルにデータを登録する"
 
     def add_arguments(self, parser):
         parser.add_argument("--jsonl", required=True, help="入力となる JSONL ファイルへのパス")
         parser.add_argument("--dry-run", action="store_true", help="DB には書き込まず、内容だけ表示する")
+        parser.add_argument("--bulk", action="store_true",
+                            help="チャンク単位の bulk_create で取り込む（history.jsonl などの大きいファイル向け）")
+        parser.add_argument("--chunk-size", type=int, default=bulk_import.DEFAULT_CHUNK_SIZE,
+                            help="--bulk / --upsert で1トランザクションにまとめる行数")
+        parser.add_argument("--upsert", action="store_true",
+                            help="登録済みの CID も、内容が変わっていれば変わったフィールドだけ更新する（チャンク単位）")
 
     def handle(self, *args, **options):
         jsonl_path = Path(options["jsonl"])
@@ -91,6 +157,35 @@ class Command(BaseCommand):
         if not jsonl_path.exists():
             raise CommandError(f"JSONL ファイルが見つかりません: {jsonl_path}")
 
+        if options["upsert"]:
+            stats = bulk_import.upsert(
+                jsonl_path, record_fields, build_post, chunk_size=options["chunk_size"], dry_run=dry_run,
+                warn=self.stderr.write, progress=self.stdout.write,
+            )
+            if stats["fields"]:
+                self.stdout.write("[INFO] 更新したフィールド: " + ", ".join(
+                    f"{name}={n}" for name, n in stats["fields"].most_common()))
+            if not dry_run:
+                self._after_import(stats["makers"], stats["cids"])
+            self.stdout.write(self.style.SUCCESS(
+                f"完了: created={stats['created']}, updated={stats['updated']}, unchanged={stats['unchanged']},"
+                f" errors={stats['errors']}（{stats['rows']} 行 / {stats['sec']} 秒 / {stats['rows_per_sec']} 行/秒）"
+            ))
+            return
+
+        if options["bulk"]:
+            stats = bulk_import.import_new(
+                jsonl_path, build_post, chunk_size=options["chunk_size"], dry_run=dry_run,
+                warn=self.stderr.write, progress=self.stdout.write,
+            )
+            if not dry_run:
+                self._after_import(stats["makers"], stats["cids"])
+            self.stdout.write(self.style.SUCCESS(
+                f"完了: created={stats['created']}, skipped_existing={stats['skipped']}, errors={stats['errors']}"
+                f"（{stats['rows']} 行 / {stats['sec']} 秒 / {stats['rows_per_sec']} 行/秒）"
+            ))
+            return
+
         lines = [ln.strip() for ln in jsonl_path.read_text(encoding="utf-8").splitlines() if ln.strip()]
         if not lines:
             self.stdout.write(self.style.WARNING("JSONL が空のため、何も行いません"))
@@ -99,6 +194,8 @@ class Command(BaseCommand):
         created = 0
         skipped = 0
         errors = 0
+        touched_makers = set()
+        created_cids = []
 
         for idx, line in enumerate(lines, 1):
             try:
@@ -119,52 +216,7 @@ class Command(BaseCommand):
                 self.stdout.write(f"[SKIP] cid={cid} は既に登録済み")
                 continue
 
-            post = Post(cid=cid)
-
-            safe_assign(post, "title", data.get("title") or cid)
-
-            name = data.get("name")
-            if not name:
-                performers = data.get("performers") or []
-                if performers:
-                    first = performers[0]
-                    if isinstance(first, dict):
-                        name = first.get("name") or first.get("title")
-                    else:
-                        name = str(first)
-            safe_assign(post, "name", name)
-
-            review = data.get("review_body") or data.get("review") or data.get("description")
-            safe_assign(post, "review_html", review)
-
-            safe_assign(post, "maker", data.get("maker"))
-            safe_assign(post, "label", data.get("label"))
-            safe_assign(post, "series", data.get("series"))
-
-            safe_assign(post, "affiliate_url", data.get("affiliate_url"))
-            safe_assign(post, "sample_movie_url", data.get("sample_movie_url"))
-            safe_assign(post, "poster_url", data.get("poster_url"))
-
-            imgs = data.get("sample_images") or []
-            if isinstance(imgs, list) and imgs:
-                safe_assign(post, "sample_images", imgs[:10])
-
-            genres = normalize_genres(data.get("genres"))
-            if genres:
-                safe_assign(post, "genres", genres)
-                safe_assign(post, "genre", ", ".join(genres))
-                safe_assign(post, "genre_text", ", ".join(genres))
-
-            sizes_text = data.get("sizes") or data.get("sizes_text")
-            if sizes_text:
-                safe_assign(post, "sizes", sizes_text)
-                b, w, h = parse_sizes_to_bwh(sizes_text)
-                safe_assign(post, "bust", b)
-                safe_assign(post, "waist", w)
-                safe_assign(post, "hip", h)
-
-            dt = parse_dt_loose(data.get("date")) or parse_dt_loose(data.get("release_date")) or timezone.now()
-            safe_assign(post, "release_date", dt)
+            post = build_post(data)
 
             if dry_run:
                 self.stdout.write(f"[DRY-RUN] cid={cid} title={getattr(post, 'title', '')}")
@@ -173,10 +225,24 @@ class Command(BaseCommand):
             try:
                 with transaction.atomic():
                     post.save()
+                    sync_post_genres([post])
+                    search.index_posts([post])
                 created += 1
+                touched_makers.add(post.maker)
+                created_cids.append(cid)
                 self.stdout.write(self.style.SUCCESS(f"[OK] created cid={cid} id={post.id} title={post.title}"))
             except Exception as e:
                 errors += 1
                 self.stderr.write(f"[ERROR] cid={cid} の保存に失敗しました: {e}")
 
+        self._after_import(touched_makers, created_cids)
         self.stdout.write(self.style.SUCCESS(f"完了: created={created}, skipped_existing={skipped}, errors={errors}"))
+
+    def _after_import(self, touched_makers, created_cids):
+        if touched_makers:
+            n = refresh_maker_rings(touched_makers)
+            self.stdout.write(f"[INFO] メーカー別おすすめを更新: {n} メーカー")
+        if created_cids:
+            fragment_cache.invalidate(created_cids)
+            if static_export.enabled():
+                static_export.export(stdout=self.stdout)
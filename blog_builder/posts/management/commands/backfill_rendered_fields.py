@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post
+from posts.rendering import RENDERED_FIELDS, render_review_fields
+
+
+class Command(BaseCommand):
+    help = "既存記事の review_html・抜粋・meta_description をまとめて計算して保存する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="1トランザクションで更新する件数")
+        parser.add_argument("--all", action="store_true", help="計算済みの記事も計算し直す")
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+
+        qs = Post.objects.only("id", "cid", "name", "title", "review", "review_body", *RENDERED_FIELDS)
+        if not options["all"]:
+            qs = qs.filter(meta_description="")
+
+        started = time.monotonic()
+        done = 0
+        last_id = 0
+        while True:
+            rows = list(qs.filter(id__gt=last_id).order_by("id")[:chunk_size])
+            if not rows:
+                break
+            for p in rows:
+                render_review_fields(p)
+            with transaction.atomic():
+                Post.objects.bulk_update(rows, RENDERED_FIELDS)
+            done += len(rows)
+            last_id = rows[-1].id
+            self.stdout.write(f"[..] {done} 件")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"完了: {done} 件を更新（{elapsed:.1f} 秒）"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import static_export
+
+
+class Command(BaseCommand):
+    help = "記事詳細・一覧・ジャンル一覧・sitemap を静的ファイルに書き出す（変わったページだけ）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="全ページを描き直す（テンプレート変更時など）")
+        parser.add_argument("--workers", type=int, default=None, help="描画するプロセス数")
+        parser.add_argument("--which", metavar="CID", help="この cid を表示しているファイルを一覧する")
+
+    def handle(self, *args, **options):
+        if options["which"]:
+            for path in static_export.pages_for_cid(options["which"]):
+                self.stdout.write(path)
+            return
+        stats = static_export.export(full=options["full"], workers=options["workers"], stdout=self.stdout)
+        style = self.style.WARNING if stats["failed"] else self.style.SUCCESS
+        self.stdout.write(style(f"書き出し完了: {stats['rendered']} ページ描画 / {stats['written']} ファイル更新"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import view_counter
+
+
+class Command(BaseCommand):
+    help = "閲覧数バッファの flush を要求する（各ワーカーは次のリクエストで DB に書き込む）"
+
+    def handle(self, *args, **options):
+        written = view_counter.flush()
+        path = view_counter.request_flush()
+        self.stdout.write(self.style.SUCCESS(
+            f"flush を要求しました: {path}（このプロセスで書き込んだ閲覧数: {written}）"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.genres import rebuild_genre_index
+
+
+class Command(BaseCommand):
+    help = "Post.genres から PostGenre（ジャンル索引）を全件作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="1回に処理する記事数")
+
+    def handle(self, *args, **options):
+        total = rebuild_genre_index(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"ジャンル索引を再作成しました: {total} 行"))
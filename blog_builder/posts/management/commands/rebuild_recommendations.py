@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.recommend import refresh_maker_rings
+
+
+class Command(BaseCommand):
+    help = "メーカー別おすすめ（MakerRing）を全メーカーぶん作り直す"
+
+    def handle(self, *args, **options):
+        n = refresh_maker_rings()
+        self.stdout.write(self.style.SUCCESS(f"メーカー別おすすめを再作成しました: {n} メーカー"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "全文検索の索引（posts_post_fts）を全件作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="1回に処理する記事数")
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError(f"{search.FTS_TABLE} がありません（SQLite の FTS5 / trigram が必要です）")
+        total = search.rebuild(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"全文検索の索引を再作成しました: {total} 件"))
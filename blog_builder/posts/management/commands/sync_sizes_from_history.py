@@ -1,48 +1,166 @@
+import hashlib
 import json
+import time
 from pathlib import Path
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from posts.models import Post
+from posts import fragment_cache
+from posts.bulk_import import DEFAULT_CHUNK_SIZE, chunked, parse_sizes_to_bwh
+
+# チェックポイントが同じファイルのものか確かめるために読む先頭のバイト数
+HEAD_BYTES = 4096
+
+
+def _head_digest(f, length):
+    f.seek(0)
+    return hashlib.sha256(f.read(min(length, HEAD_BYTES))).hexdigest()
+
+
+def load_checkpoint(path, src):
+    """
+    前回どこまで読んだかと、読んだがまだ Post が無かった {cid: sizes} を返す。
+    ファイルが差し替え・切り詰められていたら (0, {})（先頭から読み直す）
+    """
+    try:
+        cp = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return 0, {}
+    st = src.stat()
+    offset = int(cp.get("offset") or 0)
+    if cp.get("path") != str(src.resolve()) or cp.get("inode") != st.st_ino or offset > st.st_size:
+        return 0, {}
+    with src.open("rb") as f:
+        if _head_digest(f, offset) != cp.get("head"):
+            return 0, {}
+    return offset, dict(cp.get("pending") or {})
+
+
+def save_checkpoint(path, src, offset, pending=None):
+    with src.open("rb") as f:
+        head = _head_digest(f, offset)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({
+        "path": str(src.resolve()), "inode": src.stat().st_ino, "offset": offset, "head": head,
+        "pending": pending or {},
+    }, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+
+
+def fill_sizes(sizes_by_cid):
+    """
+    {cid: sizes} を空の sizes / bust・waist・hip に入れる。
+    (更新した Post のリスト, Post が見つかった cid の集合) を返す
+    """
+    rows = []
+    found = set()
+    if not sizes_by_cid:
+        return rows, found
+    posts = Post.objects.filter(cid__in=list(sizes_by_cid)).only(
+        "id", "cid", "sizes", "bust", "waist", "hip")
+    for post in posts:
+        found.add(post.cid)
+        changed = False
+        # すでに sizes が入っているものは上書きしない
+        if not post.sizes:
+            post.sizes = sizes_by_cid[post.cid]
+            changed = True
+        bwh = parse_sizes_to_bwh(post.sizes)
+        for field, value in zip(("bust", "waist", "hip"), bwh):
+            if getattr(post, field) is None and value is not None:
+                setattr(post, field, value)
+                changed = True
+        if changed:
+            rows.append(post)
+    if rows:
+        Post.objects.bulk_update(rows, ["sizes", "bust", "waist", "hip"])
+    return rows, found
+
+
+def iter_sizes(src, offset):
+    """
+    offset から1行ずつ読んで (その行の終わりの offset, cid, sizes) を返す。
+    書きかけの最終行（改行で終わっていない行）は読まずに止める
+    """
+    with src.open("rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            offset += len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            yield offset, data.get("cid"), data.get("sizes") or data.get("sizes_text")
 
 
 class Command(BaseCommand):
-    help = "data_getter/out/history.jsonl から Post.sizes を埋める（空のものだけ）"
+    help = "data_getter/out/history.jsonl から Post.sizes と bust/waist/hip を埋める（空のものだけ）"
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
         # manage.py を実行するディレクトリが blog_builder/ 前提
-        src = Path("..") / "data_getter" / "out" / "history.jsonl"
+        parser.add_argument("--history", default=str(Path("..") / "data_getter" / "out" / "history.jsonl"))
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="1回の IN クエリ・1トランザクションで扱う行数")
+        parser.add_argument("--full", action="store_true", help="チェックポイントを無視して先頭から読み直す")
+
+    def handle(self, *args, **options):
+        src = Path(options["history"])
         if not src.exists():
             self.stderr.write(self.style.ERROR(f"{src} が見つかりません"))
             return
+        checkpoint = settings.SIZES_SYNC_CHECKPOINT
+        offset, pending = (0, {}) if options["full"] else load_checkpoint(checkpoint, src)
+        chunk_size = max(1, options["chunk_size"])
 
+        started = time.monotonic()
         updated = 0
         total = 0
+        updated_cids = []
 
-        with src.open(encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                total += 1
-                data = json.loads(line)
-                cid = data.get("cid")
-                sizes = data.get("sizes") or data.get("sizes_text")
-                if not cid or not sizes:
-                    continue
-
-                try:
-                    post = Post.objects.get(cid=cid)
-                except Post.DoesNotExist:
-                    continue
-
-                # すでに sizes が入っているものは上書きしない
-                if post.sizes:
-                    continue
-
-                post.sizes = sizes
-                post.save(update_fields=["sizes"])
-                updated += 1
-
-        self.stdout.write(
-            self.style.SUCCESS(f"history.jsonl を {total} 件走査、sizes を埋めた件数: {updated}")
-        )
+        # 前回まだ Post が無かった CID（その後に取り込まれていれば、ここで埋まる）
+        retry = list(pending.items())
+        for i in range(0, len(retry), chunk_size):
+            rows, found = fill_sizes(dict(retry[i:i + chunk_size]))
+            for cid in found:
+                pending.pop(cid, None)
+            updated += len(rows)
+            updated_cids.extend(p.cid for p in rows)
+        if retry:
+            save_checkpoint(checkpoint, src, offset, pending)
+
+        for chunk in chunked(iter_sizes(src, offset), chunk_size):
+            total += len(chunk)
+            # 同じ CID が何度も出てきたら先の行を使う（sizes は空のものだけ埋めるので）
+            sizes_by_cid = {}
+            for _, cid, sizes in chunk:
+                if cid and sizes and cid not in sizes_by_cid:
+                    sizes_by_cid[cid] = str(sizes)
+
+            rows, found = fill_sizes(sizes_by_cid)
+            # Post がまだ無い CID はチェックポイントに残し、次回に回す
+            for cid, sizes in sizes_by_cid.items():
+                if cid not in found:
+                    pending.setdefault(cid, sizes)
+            save_checkpoint(checkpoint, src, chunk[-1][0], pending)
+            updated += len(rows)
+            updated_cids.extend(p.cid for p in rows)
+
+        # bulk_update だと updated_at が進まないので、キャッシュは明示的に無効化する
+        if updated_cids:
+            fragment_cache.invalidate(updated_cids)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"history.jsonl を {total} 件走査（{offset} バイト目から）、sizes / bust・waist・hip を埋めた件数: {updated}"
+            f"（Post 未登録で次回に回す CID: {len(pending)} / {elapsed:.1f} 秒）"
+        ))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_genres(apps, schema_editor):
+    # 既存記事の Post.genres から索引を作る（posts.genres.to_list と同じ分割規則）
+    Post = apps.get_model('posts', 'Post')
+    PostGenre = apps.get_model('posts', 'PostGenre')
+
+    def to_list(genres):
+        if isinstance(genres, list):
+            return [g for g in genres if isinstance(g, str)]
+        if isinstance(genres, str):
+            return [g.strip() for g in genres.split('/') if g.strip()] \
+                or [g.strip() for g in genres.split('、') if g.strip()] \
+                or [g.strip() for g in genres.split(',') if g.strip()]
+        return []
+
+    rows = []
+    for post_id, genres in Post.objects.values_list('id', 'genres').iterator():
+        seen = set()
+        for name in to_list(genres):
+            name = name.strip()[:100]
+            if name and name not in seen:
+                seen.add(name)
+                rows.append(PostGenre(post_id=post_id, name=name))
+    PostGenre.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_post_view_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostGenre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='ジャンル名', max_length=100)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='genre_links', to='posts.post')),
+            ],
+            options={
+                'verbose_name': 'ジャンル索引',
+                'verbose_name_plural': 'ジャンル索引',
+                'unique_together': {('name', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_genres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+RING_SIZE = 24
+
+
+def backfill_rings(apps, schema_editor):
+    # 既存記事からメーカー別リングを作る（posts.recommend.refresh_maker_rings と同じ内容）
+    Post = apps.get_model('posts', 'Post')
+    MakerRing = apps.get_model('posts', 'MakerRing')
+
+    rings = {}
+    rows = (
+        Post.objects.exclude(maker='')
+        .order_by('maker', '-release_date', '-id')
+        .values_list('maker', 'id', 'release_date')
+    )
+    for maker, post_id, release_date in rows.iterator():
+        maker = (maker or '').strip()
+        if not maker:
+            continue
+        ring = rings.setdefault(maker, MakerRing(maker=maker, post_ids=[], latest_release=release_date))
+        if len(ring.post_ids) < RING_SIZE:
+            ring.post_ids.append(post_id)
+    MakerRing.objects.bulk_create(rings.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_postgenre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MakerRing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('maker', models.CharField(help_text='メーカー名', max_length=100, unique=True)),
+                ('post_ids', models.JSONField(blank=True, default=list)),
+                ('latest_release', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'メーカー別おすすめ',
+                'verbose_name_plural': 'メーカー別おすすめ',
+            },
+        ),
+        migrations.RunPython(backfill_rings, migrations.RunPython.noop),
+    ]
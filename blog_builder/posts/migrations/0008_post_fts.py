@@ -0,0 +1,59 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+FTS_TABLE = 'posts_post_fts'
+COLUMNS = ('title', 'name', 'maker', 'label', 'genres', 'review')
+
+
+def create_fts(apps, schema_editor):
+    # SQLite 以外 / FTS5・trigram が無い SQLite では作らない（検索は icontains にフォールバック）
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5({', '.join(COLUMNS)}, tokenize='trigram')"
+        )
+    except OperationalError:
+        return
+
+    # 既存記事を投入（posts.search._document と同じ内容）
+    Post = apps.get_model('posts', 'Post')
+
+    def to_list(genres):
+        if isinstance(genres, list):
+            return [g for g in genres if isinstance(g, str)]
+        if isinstance(genres, str):
+            return [g.strip() for g in genres.split('/') if g.strip()] \
+                or [g.strip() for g in genres.split('、') if g.strip()] \
+                or [g.strip() for g in genres.split(',') if g.strip()]
+        return []
+
+    rows = []
+    for p in Post.objects.all().iterator():
+        rows.append((
+            p.id, p.title or '', p.name or '', p.maker or '', p.label or '',
+            ' / '.join(to_list(p.genres)), (p.review or p.review_body or '').strip(),
+        ))
+    with schema_editor.connection.cursor() as cur:
+        cur.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_release_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
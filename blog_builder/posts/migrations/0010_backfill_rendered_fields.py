@@ -0,0 +1,33 @@
+from django.db import migrations
+
+RENDERED_FIELDS = ('review_html', 'excerpt_short', 'excerpt_long', 'meta_description')
+
+
+def backfill_rendered_fields(apps, schema_editor):
+    # 0006 で足した列は空のまま入るので、既存記事ぶんをここで計算して埋める
+    # （manage.py backfill_rendered_fields と同じ処理。markdown の変換は複製せず posts.rendering を使う）
+    from posts.rendering import render_review_fields
+
+    Post = apps.get_model('posts', 'Post')
+    qs = Post.objects.only('id', 'cid', 'name', 'title', 'review', 'review_body', *RENDERED_FIELDS) \
+        .filter(meta_description='')
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id).order_by('id')[:500])
+        if not rows:
+            break
+        for p in rows:
+            render_review_fields(p)
+        Post.objects.bulk_update(rows, RENDERED_FIELDS)
+        last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rendered_fields, migrations.RunPython.noop),
+    ]
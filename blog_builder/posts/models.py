@@ -83,11 +83,69 @@ class Post(models.Model):
     hip   = models.IntegerField(null=True, blank=True)
     # レビュー本文
     review = models.TextField(blank=True, default="")
+
+    # --- 取り込み時に計算して保存する表示用フィールド（posts.rendering）---
+    # レビュー本文を Markdown → HTML にしたもの
+    review_html = models.TextField(blank=True, default="")
+    # 一覧カード用の抜粋（本文を1行にしたもの）
+    excerpt_short = models.CharField(max_length=255, blank=True, default="")
+    # 詳細ページの「レビュー」抜粋
+    excerpt_long = models.CharField(max_length=255, blank=True, default="")
+    # <meta name="description">
+    meta_description = models.CharField(max_length=255, blank=True, default="")
+
+    # 取り込んだ JSONL レコード（正規化後）の sha256。upsert で変更の無い行を飛ばすのに使う
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+
     def __str__(self):
         return f"[{self.cid}] {self.title}"
 
     class Meta:
         ordering = ['-release_date'] # 新しい順に並べる
+        indexes = [
+            # 一覧の並び (-release_date, -id) とカーソルページング用
+            models.Index(fields=["release_date", "id"], name="post_release_id_idx"),
+        ]
         verbose_name = "記事"
         verbose_name_plural = "記事"
 
+
+
+class PostGenre(models.Model):
+    """
+    ジャンル → 記事 の索引（genre_list をDB側で絞り込む／ページングするため）
+    Post.genres（JSON）を正として、取り込み時に sync_post_genres() で同期する。
+    """
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="genre_links")
+    name = models.CharField(max_length=100, help_text="ジャンル名")
+
+    def __str__(self):
+        return f"{self.name} -> {self.post_id}"
+
+    class Meta:
+        # (name, post) の複合ユニーク索引がそのまま「ジャンル名で引く」索引になる
+        unique_together = [("name", "post")]
+        verbose_name = "ジャンル索引"
+        verbose_name_plural = "ジャンル索引"
+
+
+class MakerRing(models.Model):
+    """
+    メーカーごとの「最近の記事ID」リング（post_detail の他メーカー枠用）
+    取り込み後に posts.recommend.refresh_maker_rings() で作り直す。
+    """
+
+    maker = models.CharField(max_length=100, unique=True, help_text="メーカー名")
+    # 新しい順の記事IDリスト（最大 RING_SIZE 件）
+    post_ids = models.JSONField(default=list, blank=True)
+    # このメーカーの最新作の配信日（「最近動きのあるメーカー」を選ぶため）
+    latest_release = models.DateTimeField(null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.maker} ({len(self.post_ids)})"
+
+    class Meta:
+        verbose_name = "メーカー別おすすめ"
+        verbose_name_plural = "メーカー別おすすめ"
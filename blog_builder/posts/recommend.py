@@ -0,0 +1,77 @@
+import random
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MakerRing, Post
+
+# 1メーカーあたり保持する記事数
+RING_SIZE = 24
+# 他メーカー枠の候補にする「最近動きのあるメーカー」の数
+MAKER_POOL = 30
+
+
+def refresh_maker_rings(makers=None):
+    """
+    指定メーカー（None なら全メーカー）のリングを作り直す。
+    取り込みコマンドの最後に、その回で触ったメーカーを渡して呼ぶ。
+    """
+    if makers is None:
+        makers = Post.objects.exclude(maker="").values_list("maker", flat=True).distinct()
+    makers = {(m or "").strip() for m in makers}
+    makers.discard("")
+
+    refreshed = 0
+    with transaction.atomic():
+        for maker in makers:
+            rows = list(
+                Post.objects.filter(maker=maker)
+                .order_by("-release_date", "-id")
+                .values_list("id", "release_date")[:RING_SIZE]
+            )
+            if not rows:
+                MakerRing.objects.filter(maker=maker).delete()
+                continue
+            MakerRing.objects.update_or_create(
+                maker=maker,
+                defaults={
+                    "post_ids": [pk for pk, _ in rows],
+                    "latest_release": rows[0][1],
+                },
+            )
+            refreshed += 1
+    return refreshed
+
+
+def other_maker_blocks(post, blocks=3, per_block=6):
+    """
+    post 以外のメーカーから blocks 個 × 最大 per_block 件を選ぶ。
+    選び方は (記事ID, 時間帯) をシードにした乱数で、同じ時間帯なら同じ結果になる。
+    """
+    rng = random.Random(f"{post.pk}:{timezone.now():%Y%m%d%H}")
+
+    pool = list(
+        MakerRing.objects.exclude(maker=post.maker or "")
+        .order_by("-latest_release")
+        .values_list("id", flat=True)[:MAKER_POOL]
+    )
+    picked = rng.sample(pool, min(blocks, len(pool)))
+    if not picked:
+        return []
+
+    rings = MakerRing.objects.in_bulk(picked)
+    chosen = []
+    for ring_id in picked:
+        ids = [i for i in rings[ring_id].post_ids if i != post.pk]
+        chosen.append((rings[ring_id].maker, rng.sample(ids, min(per_block, len(ids)))))
+
+    posts = Post.objects.only("id", "cid", "name", "title", "maker").in_bulk(
+        [i for _, ids in chosen for i in ids]
+    )
+
+    out = []
+    for maker, ids in chosen:
+        posts_for_maker = [posts[i] for i in ids if i in posts]
+        if posts_for_maker:
+            out.append({"maker": maker, "posts": posts_for_maker})
+    return out
@@ -0,0 +1,67 @@
+import html as _html
+import re as _re
+import threading
+
+import markdown
+
+from .templatetags.post_filters import review_excerpt
+
+# 取り込み時に計算して保存するフィールド
+RENDERED_FIELDS = ["review_html", "excerpt_short", "excerpt_long", "meta_description"]
+
+# 一覧カードの抜粋として保存する長さ（表示側で 62 / 38 文字に切る）
+EXCERPT_SHORT_LEN = 120
+
+_local = threading.local()
+
+
+def _markdown(text):
+    """
+    markdown.markdown() と同じ結果。拡張の組み立てが変換より重いので、
+    Markdown インスタンスをスレッドごとに1つ作って reset() で使い回す（一括取り込み用）
+    """
+    md = getattr(_local, "md", None)
+    if md is None:
+        md = _local.md = markdown.Markdown(extensions=["extra"])
+    return md.reset().convert(text)
+
+
+def raw_review(post):
+    return (post.review or post.review_body or "").strip()
+
+
+def build_review_excerpt_html(body_html: str, length: int = 250) -> str:
+    if not body_html:
+        return ""
+    m = _re.search(r"<h2>レビュー</h2>\s*<p>(.*?)</p>", body_html, _re.S)
+    if m:
+        text_html = m.group(1)
+    else:
+        m2 = _re.search(r"<p>(.*?)</p>", body_html, _re.S)
+        text_html = m2.group(1) if m2 else body_html
+    text = _re.sub(r"<[^>]+>", "", text_html)
+    text = _html.unescape(text)
+    text = " ".join(text.split())
+    return text[:length]
+
+
+def render_review_fields(post):
+    """
+    post.review / review_body から RENDERED_FIELDS を計算して post にセットする。
+    save() はしないので、呼び出し側で保存する。
+    """
+    raw = raw_review(post)
+
+    review_html = _markdown(raw) if raw else ""
+
+    if raw:
+        meta_description = "".join(raw.splitlines())[:120]
+    else:
+        actress_label = post.name or post.title or post.cid
+        meta_description = f"{actress_label} の素人ハメ撮り作品レビューです。"
+
+    post.review_html = review_html
+    post.excerpt_short = review_excerpt(raw, limit=len(raw))[:EXCERPT_SHORT_LEN] if raw else ""
+    post.excerpt_long = build_review_excerpt_html(review_html)
+    post.meta_description = meta_description[:255]
+    return post
@@ -0,0 +1,208 @@
+"""
+記事の全文検索（SQLite FTS5）
+
+posts_post_fts（rowid = Post.id）に title / name / maker / label / genres / review を
+trigram トークナイザで入れておき、post_index の ?q= をここで引く。
+trigram は日本語でも単語区切りなしで部分一致でき、3文字以上の語は索引で引ける。
+2文字以下の語（「巨乳」など）は同じテーブルへの LIKE で絞る。
+
+- 取り込みコマンドは save() の後に index_posts() を呼ぶ
+- manage.py rebuild_search_index で全件作り直し
+- SQLite 以外、または FTS5 / trigram が使えない環境では is_available() が False になり、
+  呼び出し側は従来の title__icontains にフォールバックする
+"""
+from django.db import connection
+
+FTS_TABLE = "posts_post_fts"
+COLUMNS = ("title", "name", "maker", "label", "genres", "review")
+# bm25 の列ごとの重み（COLUMNS と同じ順）
+WEIGHTS = (10.0, 5.0, 3.0, 2.0, 3.0, 1.0)
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f"USING fts5({', '.join(COLUMNS)}, tokenize='trigram')"
+)
+DROP_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+# search_ids() で一度に返す件数の既定値（post_index は SearchResults でページごとに引く）
+SEARCH_LIMIT = 1000
+
+_available = None
+
+
+def is_available():
+    global _available
+    if _available is None:
+        _available = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available
+
+
+def _document(post):
+    from .genres import to_list
+
+    review = (post.review or post.review_body or "").strip()
+    return (
+        post.title or "",
+        post.name or "",
+        post.maker or "",
+        post.label or "",
+        " / ".join(to_list(post.genres)),
+        review,
+    )
+
+
+def index_posts(posts):
+    """渡された記事の索引行を作り直す（save() 済みであること）"""
+    posts = [p for p in posts if p.pk]
+    if not posts or not is_available():
+        return 0
+    placeholders = ", ".join(["%s"] * (len(COLUMNS) + 1))
+    with connection.cursor() as cur:
+        remove_posts([p.pk for p in posts], cursor=cur)
+        cur.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+            [(p.pk, *_document(p)) for p in posts],
+        )
+    return len(posts)
+
+
+def remove_posts(ids, cursor=None):
+    ids = list(ids)
+    if not ids or not is_available():
+        return
+    if cursor is None:
+        with connection.cursor() as cur:
+            return remove_posts(ids, cursor=cur)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})",
+            chunk,
+        )
+
+
+def rebuild(chunk_size=1000):
+    """全記事ぶんの索引を作り直す"""
+    from .models import Post
+
+    if not is_available():
+        return 0
+    with connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {FTS_TABLE}")
+
+    total = 0
+    last_id = 0
+    fields = ("id", "title", "name", "maker", "label", "genres", "review", "review_body")
+    while True:
+        rows = list(Post.objects.only(*fields).filter(id__gt=last_id).order_by("id")[:chunk_size])
+        if not rows:
+            break
+        total += index_posts(rows)
+        last_id = rows[-1].id
+    with connection.cursor() as cur:
+        cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def _like_escape(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _conditions(query):
+    """
+    検索語 → (WHERE 句のリスト, params, MATCH を使うか)。空白区切りの語はすべて AND。
+    3文字以上は MATCH、2文字以下は LIKE で絞る。
+    """
+    terms = [t for t in (query or "").split() if t]
+    long_terms = [t for t in terms if len(t) >= 3]
+    short_terms = [t for t in terms if len(t) < 3]
+
+    where, params = [], []
+    if long_terms:
+        where.append(f"{FTS_TABLE} MATCH %s")
+        params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+    for t in short_terms:
+        like = f"%{_like_escape(t)}%"
+        where.append("(" + " OR ".join(f"{c} LIKE %s ESCAPE '\\'" for c in COLUMNS) + ")")
+        params.extend([like] * len(COLUMNS))
+    return where, params, bool(long_terms)
+
+
+def build_query(query, limit=SEARCH_LIMIT, offset=0):
+    """検索語 → (SQL, params)。MATCH があれば bm25 順、無ければ新しい順"""
+    where, params, ranked = _conditions(query)
+    if not where:
+        return None, []
+
+    if ranked:
+        order = f"bm25({FTS_TABLE}, {', '.join(str(w) for w in WEIGHTS)}), rowid DESC"
+    else:
+        order = "rowid DESC"
+    sql = (
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {' AND '.join(where)} "
+        f"ORDER BY {order} LIMIT %s OFFSET %s"
+    )
+    return sql, params + [limit, offset]
+
+
+def build_count_query(query):
+    """検索語 → 件数を数える (SQL, params)"""
+    where, params, _ = _conditions(query)
+    if not where:
+        return None, []
+    return f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {' AND '.join(where)}", params
+
+
+def search_ids(query, limit=SEARCH_LIMIT, offset=0):
+    """関連度順の Post.id リスト（検索できない環境なら None）"""
+    if not is_available():
+        return None
+    sql, params = build_query(query, limit, offset)
+    if sql is None:
+        return []
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return [row[0] for row in cur.fetchall()]
+
+
+class SearchResults:
+    """
+    Paginator にそのまま渡せる検索結果。
+    件数は COUNT(*)、各ページは LIMIT / OFFSET で引くので、件数に上限は無い。
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            sql, params = build_count_query(self.query)
+            if sql is None:
+                self._count = 0
+            else:
+                with connection.cursor() as cur:
+                    cur.execute(sql, params)
+                    self._count = cur.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("SearchResults はスライスでだけ引ける")
+        start, stop, _ = key.indices(self.count())
+        if stop <= start:
+            return []
+        return search_ids(self.query, limit=stop - start, offset=start)
+
+
+def search_results(query):
+    """post_index 用の SearchResults（検索できない環境なら None）"""
+    if not is_available():
+        return None
+    return SearchResults(query)
@@ -0,0 +1,385 @@
+"""
+静的サイト書き出し（publish-to-static）
+
+記事詳細・一覧（ページごと）・ジャンル一覧・sitemap.xml を HTML / XML ファイルに
+書き出し、nginx から直接配信できるようにする。記事が変わるのは取り込みのときだけなので、
+取り込みコマンドの最後に export() を呼ぶ（STATIC_EXPORT_ENABLED のとき）。
+
+出力（STATIC_EXPORT_DIR 以下）
+    index.html / page/N/index.html                 … /  /?page=N
+    genre/<名前>/index.html / genre/<名前>/page/N/  … /genre/<名前>/?page=N
+    posts/<cid>/index.html                         … /posts/<cid>/
+    sitemap.xml, contact/, privacy/
+
+差分の判定はマニフェスト（STATIC_EXPORT_MANIFEST, SQLite）で行う。
+ページごとに「どの cid を表示しているか」と、その内容から作ったダイジェストを持ち、
+ダイジェストが変わったページだけを描き直す。
+- hard: 記事自身・同じメーカー枠・一覧ページの顔ぶれ（id と updated_at）。変われば必ず描き直す
+- soft: 新着枠・他メーカー枠（1時間ごとに入れ替わる）・人気ランキング。
+        変わっていても STATIC_EXPORT_SOFT_MAX_AGE 秒たつまでは描き直さず、
+        1回に描き直すのは古い順に STATIC_EXPORT_SOFT_BATCH 件まで（負荷をならす）
+描画は fork したプロセスのプールで並列に行い、中身が同じならファイルは書き換えない。
+（STATIC_EXPORT_START_METHOD=forkserver / spawn なら子プロセスで django.setup() し直す）
+
+nginx 側は「クエリが無い（または page=N だけの）GET」をファイルに向け、無ければ Django へ:
+    location = /sitemap.xml { try_files /static_site/sitemap.xml @django; }
+    location / {
+        set $static $uri;
+        if ($args ~ "^page=(\\d+)$") { set $static "${uri}page/$1/"; }
+        if ($args !~ "^(page=\\d+)?$") { set $static "/-"; }
+        try_files /static_site${static}index.html @django;
+    }
+静的に配信した記事詳細は閲覧数（view_counter）に数えられないので、
+必要なら nginx の mirror で Django 側にも流す。
+
+  python manage.py export_static            # 変わったページだけ
+  python manage.py export_static --full     # 全部（テンプレートを変えたとき）
+  python manage.py export_static --which <cid>
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+
+from .models import MakerRing, Post, PostGenre
+
+# 一覧の人気ランキング（サイドバー）と新着枠の件数（views と同じ）
+POPULAR_SIZE = 30
+LATEST_SIZE = 6
+SAME_MAKER_SIZE = 9
+# 1プロセスに一度に渡すページ数
+RENDER_CHUNK = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    path        TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    arg         TEXT NOT NULL,
+    page        INTEGER NOT NULL,
+    hard        TEXT NOT NULL,
+    soft        TEXT NOT NULL,
+    sha1        TEXT,
+    rendered_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS page_cids (
+    path TEXT NOT NULL,
+    cid  TEXT NOT NULL,
+    PRIMARY KEY (path, cid)
+);
+CREATE INDEX IF NOT EXISTS page_cids_cid ON page_cids (cid);
+"""
+
+
+def enabled():
+    return getattr(settings, "STATIC_EXPORT_ENABLED", False)
+
+
+def _out_dir():
+    p = getattr(settings, "STATIC_EXPORT_DIR", None)
+    return Path(p) if p else Path(settings.BASE_DIR) / "static_site"
+
+
+def _manifest_path():
+    p = getattr(settings, "STATIC_EXPORT_MANIFEST", None)
+    return Path(p) if p else Path(settings.BASE_DIR) / "static_export.sqlite3"
+
+
+def _soft_max_age():
+    return getattr(settings, "STATIC_EXPORT_SOFT_MAX_AGE", 6 * 60 * 60)
+
+
+def _soft_batch():
+    return getattr(settings, "STATIC_EXPORT_SOFT_BATCH", 500)
+
+
+def _start_method():
+    return getattr(settings, "STATIC_EXPORT_START_METHOD", "fork")
+
+
+def _per_page():
+    from .views import PER_PAGE
+    return PER_PAGE
+
+
+def _max_pages():
+    if getattr(settings, "POST_LIST_CURSOR_PAGINATION", False):
+        return getattr(settings, "POST_LIST_MAX_PAGE_NUMBER", 10)
+    return None
+
+
+def _digest(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _open_manifest():
+    path = _manifest_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+# ---------------------------------------------------------------------------
+# ページ一覧とダイジェスト（描画せずに DB だけで求める）
+# ---------------------------------------------------------------------------
+
+def page_path(kind, arg="", page=1):
+    """出力ファイルの相対パス"""
+    if kind == "detail":
+        return f"posts/{arg}/index.html"
+    if kind == "sitemap":
+        return "sitemap.xml"
+    if kind in ("contact", "privacy"):
+        return f"{kind}/index.html"
+    base = "" if kind == "index" else f"genre/{arg}/"
+    return f"{base}index.html" if page == 1 else f"{base}page/{page}/index.html"
+
+
+def _pages_of(ids, per_page, max_pages):
+    n = max(1, -(-len(ids) // per_page))
+    if max_pages:
+        n = min(n, max_pages)
+    return n
+
+
+def plan():
+    """
+    今あるべきページを {path: (kind, arg, page, hard, soft, cids)} で返す。
+    記事は (id, cid, maker, updated_at) を1回読むだけで、残りは Python 側で組む。
+    """
+    per_page, max_pages = _per_page(), _max_pages()
+    rows = list(
+        Post.objects.order_by("-release_date", "-id").values_list("id", "cid", "maker", "updated_at")
+    )
+    info = {pk: (cid, maker, str(updated)) for pk, cid, maker, updated in rows}
+    order = [pk for pk, *_ in rows]
+    position = {pk: i for i, pk in enumerate(order)}
+
+    by_maker = defaultdict(list)
+    for pk in order:
+        by_maker[info[pk][1]].append(pk)
+
+    latest = [info[pk][0] for pk in order[:LATEST_SIZE + 1]]
+    popular = list(Post.objects.order_by("-view_total", "-id").values_list("cid", flat=True)[:POPULAR_SIZE])
+    rings = list(MakerRing.objects.order_by("maker").values_list("maker", "updated_at"))
+    hour_bucket = time.strftime("%Y%m%d%H")
+
+    out = {}
+
+    def add(kind, arg, page, hard, soft, cids):
+        out[page_path(kind, arg, page)] = (kind, arg, page, _digest(hard), _digest(soft), cids)
+
+    # 記事詳細: 自分 ＋ 同じメーカーの新しい順（自分を除く 9 件が出る）
+    for pk in order:
+        cid, maker, updated = info[pk]
+        mates = [m for m in by_maker[maker] if m != pk][:SAME_MAKER_SIZE]
+        add("detail", cid, 1,
+            hard=[updated, [(info[m][0], info[m][2]) for m in mates]],
+            soft=[latest, rings, hour_bucket],
+            cids=[cid] + [info[m][0] for m in mates])
+
+    # 一覧: ページごとの顔ぶれ（id と updated_at）とページ数
+    def add_listing(kind, arg, ids):
+        n = _pages_of(ids, per_page, max_pages)
+        for page in range(1, n + 1):
+            members = ids[(page - 1) * per_page: page * per_page]
+            add(kind, arg, page,
+                hard=[n, [(info[m][0], info[m][2]) for m in members]],
+                soft=[popular],
+                cids=[info[m][0] for m in members])
+
+    add_listing("index", "", order)
+    genres = defaultdict(list)
+    for name, pk in PostGenre.objects.values_list("name", "post_id"):
+        if pk in position:
+            genres[name].append(pk)
+    for name, ids in genres.items():
+        if "/" in name or name.strip() in ("", ".", ".."):
+            continue
+        ids.sort(key=position.__getitem__)
+        add_listing("genre", name, ids)
+
+    add("sitemap", "", 1, hard=[order, [info[pk][2] for pk in order], sorted(genres)], soft=[], cids=[])
+    for kind in ("contact", "privacy"):
+        add(kind, "", 1, hard=[], soft=[], cids=[])
+    return out
+
+
+# ---------------------------------------------------------------------------
+# 描画（ワーカープロセス）
+# ---------------------------------------------------------------------------
+
+def _request(path, page):
+    base = urlsplit(getattr(settings, "STATIC_EXPORT_BASE_URL", "") or "http://localhost")
+    rf = RequestFactory(HTTP_HOST=base.netloc)
+    req = rf.get(path, {"page": page} if page > 1 else {}, secure=base.scheme == "https")
+    # 書き出し用のリクエストは閲覧数に数えない（views.post_detail）
+    req.static_export = True
+    return req
+
+
+def _render_html(kind, arg, page):
+    from . import views
+    if kind == "detail":
+        return views.post_detail(_request(f"/posts/{quote(arg)}/", 1), arg).content
+    if kind == "index":
+        return views.post_index(_request("/", page)).content
+    if kind == "genre":
+        return views.genre_list(_request(f"/genre/{quote(arg)}/", page), arg).content
+    if kind == "contact":
+        return views.contact(_request("/contact/", 1)).content
+    if kind == "privacy":
+        return views.privacy(_request("/privacy/", 1)).content
+    if kind == "sitemap":
+        return render_sitemap()
+    raise ValueError(kind)
+
+
+def render_sitemap():
+    base = (getattr(settings, "STATIC_EXPORT_BASE_URL", "") or "http://localhost").rstrip("/")
+    urls = [(f"{base}/", None)]
+    for cid, updated in Post.objects.order_by("-release_date", "-id").values_list("cid", "updated_at"):
+        urls.append((f"{base}/posts/{quote(cid)}/", updated))
+    for name in PostGenre.objects.values_list("name", flat=True).distinct().order_by("name"):
+        urls.append((f"{base}/genre/{quote(name)}/", None))
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    for loc, lastmod in urls:
+        mod = f"<lastmod>{lastmod:%Y-%m-%d}</lastmod>" if lastmod else ""
+        lines.append(f"<url><loc>{escape(loc)}</loc>{mod}</url>")
+    lines.append("</urlset>")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _write_atomic(dest, data):
+    """中身が同じなら書かない。書いたら True"""
+    try:
+        if dest.stat().st_size == len(data) and dest.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dest)
+    return True
+
+
+def _init_worker():
+    """fork 以外で起動した子プロセスは Django の初期化から"""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def _render_chunk(jobs):
+    """[(path, kind, arg, page)] を描いて [(path, sha1, written, error)] を返す"""
+    out_dir = _out_dir()
+    results = []
+    for path, kind, arg, page in jobs:
+        try:
+            data = _render_html(kind, arg, page)
+            written = _write_atomic(out_dir / path, data)
+            results.append((path, hashlib.sha1(data).hexdigest(), written, None))
+        except Exception as e:
+            results.append((path, None, False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 書き出し
+# ---------------------------------------------------------------------------
+
+def export(full=False, workers=None, stdout=None, now=None):
+    """
+    変わったページだけを描き直して書き出す。件数の dict を返す。
+    full=True なら全ページを描き直す。
+    """
+    now = now or time.time()
+    log = stdout.write if stdout else print
+    out_dir = _out_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    db = _open_manifest()
+    t0 = time.time()
+
+    want = plan()
+    have = {row[0]: row[1:] for row in db.execute("SELECT path, hard, soft, rendered_at FROM pages")}
+    soft_cutoff = now - _soft_max_age()
+
+    todo, soft_stale = [], []
+    for path, (kind, arg, page, hard, soft, _cids) in want.items():
+        prev = have.get(path)
+        if full or prev is None or prev[0] != hard or not (out_dir / path).exists():
+            todo.append((path, kind, arg, page))
+        elif prev[1] != soft and prev[2] < soft_cutoff:
+            soft_stale.append((prev[2], (path, kind, arg, page)))
+    soft_stale.sort(key=lambda x: x[0])
+    todo += [job for _, job in soft_stale[:_soft_batch()]]
+
+    stats = {"pages": len(want), "rendered": 0, "written": 0, "removed": 0, "failed": 0}
+    workers = workers or min(os.cpu_count() or 1, 8)
+    chunks = [todo[i:i + RENDER_CHUNK] for i in range(0, len(todo), RENDER_CHUNK)]
+    if workers > 1 and len(chunks) > 1:
+        # fork 先で DB 接続を共有しないよう、親の接続を閉じてから分ける
+        connections.close_all()
+        method = _start_method()
+        ctx = multiprocessing.get_context(method)
+        init = None if method == "fork" else _init_worker
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init) as ex:
+            results = [r for batch in ex.map(_render_chunk, chunks) for r in batch]
+    else:
+        results = [r for chunk in chunks for r in _render_chunk(chunk)]
+
+    db.execute("BEGIN IMMEDIATE")
+    for path, sha1, written, error in results:
+        if error:
+            stats["failed"] += 1
+            log(f"[STATIC] 失敗 {path}: {error}")
+            continue
+        kind, arg, page, hard, soft, cids = want[path]
+        db.execute(
+            "INSERT OR REPLACE INTO pages (path, kind, arg, page, hard, soft, sha1, rendered_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, kind, arg, page, hard, soft, sha1, now),
+        )
+        db.execute("DELETE FROM page_cids WHERE path = ?", (path,))
+        db.executemany("INSERT OR IGNORE INTO page_cids (path, cid) VALUES (?, ?)",
+                       [(path, c) for c in cids])
+        stats["rendered"] += 1
+        stats["written"] += written
+
+    # 記事の削除・ページ数の減少で要らなくなったファイル
+    for path in set(have) - set(want):
+        (out_dir / path).unlink(missing_ok=True)
+        db.execute("DELETE FROM pages WHERE path = ?", (path,))
+        db.execute("DELETE FROM page_cids WHERE path = ?", (path,))
+        stats["removed"] += 1
+    db.execute("COMMIT")
+    db.close()
+
+    stats["sec"] = round(time.time() - t0, 1)
+    log("[STATIC] " + " ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
+
+
+def pages_for_cid(cid):
+    """cid を表示している出力ファイルの一覧"""
+    db = _open_manifest()
+    try:
+        return [p for (p,) in db.execute(
+            "SELECT path FROM page_cids WHERE cid = ? ORDER BY path", (cid,))]
+    finally:
+        db.close()
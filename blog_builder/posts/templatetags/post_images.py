@@ -0,0 +1,36 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from posts import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_image(cid, slot="01", alt="", sizes="", loading="lazy"):
+    """
+    {% post_image post.cid "01" alt="..." sizes="(max-width: 640px) 100vw, 320px" %}
+
+    派生画像（posts.images）があれば <picture> に AVIF/WebP の <source> と
+    jpg の srcset を付ける。無ければ従来どおりの <img> だけを出す。
+    """
+    pic = images.picture(cid, slot)
+    attrs = format_html(' alt="{}"', alt)
+    if pic["width"] and pic["height"]:
+        attrs += format_html(' width="{}" height="{}"', pic["width"], pic["height"])
+    if pic["srcset"]:
+        attrs += format_html(' srcset="{}"', pic["srcset"])
+    if sizes and (pic["srcset"] or pic["sources"]):
+        attrs += format_html(' sizes="{}"', sizes)
+    if loading:
+        attrs += format_html(' loading="{}"', loading)
+    img = format_html('<img src="{}"{} referrerpolicy="no-referrer">', pic["src"], attrs)
+    if not pic["sources"]:
+        return img
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}"{}>',
+        ((s["type"], s["srcset"], format_html(' sizes="{}"', sizes) if sizes else "")
+         for s in pic["sources"]),
+    )
+    return format_html('<picture class="post-picture">{}{}</picture>', sources, img)
@@ -1,3 +1,330 @@
-from django.test import TestCase
+import importlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.apps import apps
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from posts import bulk_import, search, views
+from posts.cursor import decode_cursor, encode_cursor, keyset_page
+from posts.management.commands.auto_populate_content import build_post, record_fields
+from posts.management.commands.sync_sizes_from_history import load_checkpoint, save_checkpoint
+from posts.models import Post, PostGenre
+
+
+class TmpDirMixin:
+    """一時ディレクトリを用意し、スタンプなどの書き出し先をそこへ向ける"""
+
+    def setUp(self):
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self._settings = override_settings(
+            POST_CACHE_STAMP=self.tmp / "post_cache.stamp",
+            SIZES_SYNC_CHECKPOINT=self.tmp / "sizes_sync.checkpoint.json",
+        )
+        self._settings.enable()
+
+    def tearDown(self):
+        self._settings.disable()
+        self._tmp.cleanup()
+        super().tearDown()
+
+
+def make_post(cid, **kwargs):
+    kwargs.setdefault("title", cid)
+    kwargs.setdefault("release_date", timezone.now())
+    return Post.objects.create(cid=cid, **kwargs)
+
+
+class SyncSizesFromHistoryTests(TmpDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.history = self.tmp / "history.jsonl"
+        self.checkpoint = self.tmp / "sizes_sync.checkpoint.json"
+
+    def write(self, *recs, tail=""):
+        self.history.write_text(
+            "".join(json.dumps(r) + "\n" for r in recs) + tail, encoding="utf-8")
+
+    def sync(self, *args):
+        call_command("sync_sizes_from_history", "--history", str(self.history), *args, stdout=StringIO())
+
+    def test_fills_sizes_and_bwh(self):
+        make_post("a1")
+        self.write({"cid": "a1", "sizes": "T160 B85 W58 H86"})
+        self.sync()
+        post = Post.objects.get(cid="a1")
+        self.assertEqual(post.sizes, "T160 B85 W58 H86")
+        self.assertEqual((post.bust, post.waist, post.hip), (85, 58, 86))
+
+    def test_unmatched_cid_is_retried_after_import(self):
+        make_post("a1")
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"}, {"cid": "b1", "sizes": "B90 W62 H88"})
+        self.sync()
+        offset, pending = load_checkpoint(self.checkpoint, self.history)
+        self.assertEqual(offset, self.history.stat().st_size)
+        self.assertEqual(pending, {"b1": "B90 W62 H88"})
+
+        # 後から Post が取り込まれれば、ファイルを読み直さなくても埋まる
+        make_post("b1")
+        self.sync()
+        self.assertEqual(Post.objects.get(cid="b1").sizes, "B90 W62 H88")
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history), (offset, {}))
+
+    def test_partial_last_line_is_left_for_next_run(self):
+        make_post("a1")
+        make_post("b1")
+        line = json.dumps({"cid": "b1", "sizes": "B90 W62 H88"})
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"}, tail=line[:10])
+        self.sync()
+        first = self.history.read_bytes().index(b"\n") + 1
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history)[0], first)
+        self.assertEqual(Post.objects.get(cid="b1").sizes, "")
+
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"}, tail=line + "\n")
+        self.sync()
+        self.assertEqual(Post.objects.get(cid="b1").sizes, "B90 W62 H88")
+
+    def test_checkpoint_invalidation(self):
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"}, {"cid": "b1", "sizes": "B90 W62 H88"})
+        size = self.history.stat().st_size
+        save_checkpoint(self.checkpoint, self.history, size, {"x": "B1"})
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history), (size, {"x": "B1"}))
+
+        # 切り詰め
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"})
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history), (0, {}))
+
+        # 先頭の中身が変わった（長さは同じ）
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"}, {"cid": "b1", "sizes": "B90 W62 H88"})
+        save_checkpoint(self.checkpoint, self.history, size)
+        self.write({"cid": "a2", "sizes": "B80 W60 H82"}, {"cid": "b1", "sizes": "B90 W62 H88"})
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history), (0, {}))
+
+        # 同じ中身で差し替え（inode が変わる）
+        save_checkpoint(self.checkpoint, self.history, size)
+        other = self.tmp / "history.new"
+        other.write_bytes(self.history.read_bytes())
+        os.replace(other, self.history)
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history), (0, {}))
+
+        # 壊れたチェックポイント
+        self.checkpoint.write_text("{", encoding="utf-8")
+        self.assertEqual(load_checkpoint(self.checkpoint, self.history), (0, {}))
+
+    def test_full_ignores_checkpoint(self):
+        make_post("a1")
+        self.write({"cid": "a1", "sizes": "B80 W60 H82"})
+        self.sync()
+        Post.objects.filter(cid="a1").update(sizes="", bust=None, waist=None, hip=None)
+        self.sync()
+        self.assertEqual(Post.objects.get(cid="a1").sizes, "")
+        self.sync("--full")
+        self.assertEqual(Post.objects.get(cid="a1").sizes, "B80 W60 H82")
+
+
+class UpsertTests(TmpDirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.jsonl = self.tmp / "in.jsonl"
+
+    def upsert(self, *recs, **kwargs):
+        self.jsonl.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs), encoding="utf-8")
+        return bulk_import.upsert(self.jsonl, record_fields, build_post, **kwargs)
+
+    def rec(self, cid, **kwargs):
+        rec = {"cid": cid, "title": f"title {cid}", "maker": "maker-a", "genres": ["素人", "美乳"],
+               "review_body": f"review of {cid}", "date": "2025-01-01T00:00:00+09:00"}
+        rec.update(kwargs)
+        return rec
+
+    def genres_of(self, cid):
+        return set(PostGenre.objects.filter(post__cid=cid).values_list("name", flat=True))
+
+    def test_create(self):
+        stats = self.upsert(self.rec("a1"), self.rec("a2"))
+        self.assertEqual((stats["rows"], stats["created"], stats["updated"], stats["unchanged"], stats["errors"]),
+                         (2, 2, 0, 0, 0))
+        self.assertEqual(sorted(stats["cids"]), ["a1", "a2"])
+        post = Post.objects.get(cid="a1")
+        self.assertEqual(post.content_hash, bulk_import.content_hash(record_fields(self.rec("a1"))))
+        self.assertEqual(self.genres_of("a1"), {"素人", "美乳"})
+
+    def test_unchanged(self):
+        self.upsert(self.rec("a1"), self.rec("a2"))
+        before = Post.objects.get(cid="a1").updated_at
+        stats = self.upsert(self.rec("a1"), self.rec("a2"))
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (0, 0, 2))
+        self.assertEqual(stats["cids"], [])
+        self.assertEqual(Post.objects.get(cid="a1").updated_at, before)
+
+    def test_changed_fields_are_updated(self):
+        self.upsert(self.rec("a1"), self.rec("a2"))
+        stats = self.upsert(self.rec("a1", title="renamed zebra", genres=["巨乳"]), self.rec("a2"))
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (0, 1, 1))
+        self.assertEqual(stats["cids"], ["a1"])
+        self.assertEqual(stats["fields"]["title"], 1)
+        self.assertEqual(stats["fields"]["genres"], 1)
+        self.assertNotIn("maker", stats["fields"])
+
+        post = Post.objects.get(cid="a1")
+        self.assertEqual(post.title, "renamed zebra")
+        self.assertEqual(post.content_hash,
+                         bulk_import.content_hash(record_fields(self.rec("a1", title="renamed zebra", genres=["巨乳"]))))
+        # ジャンル索引・検索索引も付け直される
+        self.assertEqual(self.genres_of("a1"), {"巨乳"})
+        if search.is_available():
+            self.assertEqual(search.search_ids("zebra"), [post.pk])
+
+    def test_same_cid_twice_in_one_chunk(self):
+        stats = self.upsert(self.rec("a1", title="first"), self.rec("a1", title="second"))
+        self.assertEqual((stats["rows"], stats["created"], stats["updated"], stats["unchanged"]), (2, 1, 0, 1))
+        self.assertEqual(Post.objects.get(cid="a1").title, "second")
+
+        stats = self.upsert(self.rec("a1", title="third"), self.rec("a1", title="fourth"))
+        self.assertEqual((stats["rows"], stats["created"], stats["updated"], stats["unchanged"]), (2, 0, 1, 1))
+        self.assertEqual(Post.objects.get(cid="a1").title, "fourth")
+        self.assertEqual(Post.objects.filter(cid="a1").count(), 1)
+
+    def test_hash_only_update_for_legacy_rows(self):
+        self.upsert(self.rec("a1"))
+        Post.objects.filter(cid="a1").update(content_hash="")
+        stats = self.upsert(self.rec("a1"))
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (0, 0, 1))
+        self.assertEqual(Post.objects.get(cid="a1").content_hash,
+                         bulk_import.content_hash(record_fields(self.rec("a1"))))
+
+    def test_dry_run_and_bad_rows(self):
+        self.jsonl.write_text(json.dumps(self.rec("a1")) + "\n{broken\n" + json.dumps({"title": "no cid"}) + "\n",
+                              encoding="utf-8")
+        stats = bulk_import.upsert(self.jsonl, record_fields, build_post, dry_run=True)
+        self.assertEqual((stats["rows"], stats["created"], stats["errors"]), (3, 1, 2))
+        self.assertFalse(Post.objects.exists())
+
+
+class KeysetPageTests(TestCase):
+    PER_PAGE = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        base = timezone.now().replace(microsecond=0)
+        dates = [base, base, base - timedelta(days=1), None, base - timedelta(days=2),
+                 None, base - timedelta(days=1), None, base]
+        for i, rd in enumerate(dates):
+            Post.objects.create(cid=f"k{i}", title=f"k{i}", release_date=rd)
+
+    def qs(self):
+        return Post.objects.order_by("-release_date", "-id")
+
+    def expected_pages(self):
+        ids = list(self.qs().values_list("id", flat=True))
+        return [ids[i:i + self.PER_PAGE] for i in range(0, len(ids), self.PER_PAGE)]
+
+    def ids(self, page):
+        return [p.id for p in page["object_list"]]
+
+    def test_null_dates_sort_last(self):
+        rows = list(self.qs())
+        nulls = [p.release_date is None for p in rows]
+        self.assertEqual(nulls, sorted(nulls))
+
+    def test_forward_and_backward_walks_round_trip(self):
+        expected = self.expected_pages()
+
+        page = keyset_page(self.qs(), self.PER_PAGE)
+        self.assertFalse(page["has_previous"])
+        forward = [self.ids(page)]
+        while page["has_next"]:
+            page = keyset_page(self.qs(), self.PER_PAGE, after=page["next_token"])
+            forward.append(self.ids(page))
+        self.assertEqual(forward, expected)
+
+        backward = [self.ids(page)]
+        while page["has_previous"]:
+            page = keyset_page(self.qs(), self.PER_PAGE, before=page["prev_token"])
+            backward.append(self.ids(page))
+        self.assertEqual(backward[::-1], expected)
+        self.assertEqual(page["prev_token"], "")
+
+    def test_page_number_matches_cursor_walk(self):
+        expected = self.expected_pages()
+        for n, ids in enumerate(expected, 1):
+            self.assertEqual(self.ids(keyset_page(self.qs(), self.PER_PAGE, page=n)), ids)
+
+    def test_token_round_trip(self):
+        for post in self.qs():
+            self.assertEqual(decode_cursor(encode_cursor(post)), (post.release_date, post.pk))
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+    def test_before_first_row_returns_first_page(self):
+        first = self.qs().first()
+        page = keyset_page(self.qs(), self.PER_PAGE, before=encode_cursor(first))
+        self.assertEqual(self.ids(page), self.expected_pages()[0])
+
+
+@override_settings(POST_LIST_CURSOR_PAGINATION=True, POST_LIST_MAX_PAGE_NUMBER=2)
+class CursorPaginateTests(TestCase):
+    def setUp(self):
+        self.rf = RequestFactory()
+
+    def paginate(self, **params):
+        return views._paginate(self.rf.get("/", params), Post.objects.order_by("-release_date", "-id"))
+
+    def test_invalid_token_is_404(self):
+        for key in ("after", "before"):
+            with self.assertRaises(Http404):
+                self.paginate(**{key: "%%%"})
+
+    def test_page_past_limit_is_404(self):
+        self.assertIsNone(self.paginate(page=2)["page_obj"])
+        with self.assertRaises(Http404):
+            self.paginate(page=3)
+
+
+class SearchResultsTests(TestCase):
+    def setUp(self):
+        if not search.is_available():
+            self.skipTest("FTS5 が使えない")
+        self.rf = RequestFactory()
+        self.posts = [make_post(f"z{i:03d}", title=f"zebra {i}") for i in range(views.PER_PAGE + 5)]
+        search.index_posts(self.posts + [make_post("other", title="lion")])
+
+    def test_pages_with_count_and_offset(self):
+        hits = search.search_results("zebra")
+        self.assertEqual(hits.count(), len(self.posts))
+        ids = hits[0:views.PER_PAGE] + hits[views.PER_PAGE:views.PER_PAGE * 2]
+        self.assertEqual(sorted(ids), sorted(p.pk for p in self.posts))
+        self.assertEqual(hits[len(self.posts):len(self.posts) + 10], [])
+
+    def test_post_index_reaches_last_page(self):
+        last = Post.objects.get(pk=search.search_ids("zebra")[-1])
+        response = views.post_index(self.rf.get("/", {"q": "zebra", "page": 2}))
+        self.assertContains(response, f'href="/posts/{last.cid}/" class="post-card"')
+
+    def test_short_term_uses_like(self):
+        hits = search.search_results("li")
+        self.assertEqual(hits.count(), 1)
+
+
+class BackfillRenderedFieldsMigrationTests(TestCase):
+    def test_fills_blank_rendered_fields(self):
+        migration = importlib.import_module("posts.migrations.0010_backfill_rendered_fields")
+        blank = make_post("r1", review="## レビュー\n\n素人の**抜粋**です")
+        done = make_post("r2", review="本文", meta_description="そのまま")
+        migration.backfill_rendered_fields(apps, None)
+
+        blank.refresh_from_db()
+        self.assertIn("<strong>抜粋</strong>", blank.review_html)
+        self.assertTrue(blank.excerpt_short)
+        self.assertTrue(blank.meta_description)
+        done.refresh_from_db()
+        self.assertEqual((done.meta_description, done.review_html), ("そのまま", ""))
@@ -0,0 +1,144 @@
+"""
+閲覧数のライトビハインド・カウンタ
+
+post_detail のたびに UPDATE + refresh_from_db していたのをやめ、
+プロセス内で cid ごとの加算分を貯めて、一定時間／一定件数ごとに
+まとめて UPDATE する。
+
+- VIEW_COUNTER_FLUSH_INTERVAL : 最後の書き込みから何秒で flush するか
+- VIEW_COUNTER_FLUSH_SIZE     : 何件たまったら flush するか
+- VIEW_COUNTER_FLUSH_REQUEST  : このファイルが更新されたら次のリクエストで flush する
+                                （manage.py flush_view_counts が touch する）
+
+人気順（view_total）は flush の時点でしか変わらないので、
+flush 間隔の中では並びが安定する。
+"""
+import atexit
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Post
+
+# SQLite の式の深さ制限に当たらないよう、1回の UPDATE に載せる cid 数
+UPDATE_CHUNK = 200
+
+_lock = threading.Lock()
+_pending = Counter()
+_pending_total = 0
+_last_flush = time.monotonic()
+_last_request_check = 0.0
+_request_mtime = None
+
+
+def _interval():
+    return getattr(settings, "VIEW_COUNTER_FLUSH_INTERVAL", 60)
+
+
+def _size():
+    return getattr(settings, "VIEW_COUNTER_FLUSH_SIZE", 200)
+
+
+def _request_path():
+    p = getattr(settings, "VIEW_COUNTER_FLUSH_REQUEST", None)
+    return Path(p) if p else Path(settings.BASE_DIR) / "view_counter.flush"
+
+
+def _flush_requested(now):
+    """flush 要求ファイルの mtime を見る（stat は1秒に1回まで）"""
+    global _last_request_check, _request_mtime
+    if now - _last_request_check < 1.0:
+        return False
+    _last_request_check = now
+    try:
+        mtime = _request_path().stat().st_mtime
+    except OSError:
+        mtime = 0.0  # まだ一度も要求されていない
+    if _request_mtime is None:
+        # 起動直後は現在の値を基準にするだけ
+        _request_mtime = mtime
+        return False
+    if mtime != _request_mtime:
+        _request_mtime = mtime
+        return True
+    return False
+
+
+def record_view(cid):
+    """閲覧を1件記録する。必要ならその場で flush する"""
+    global _pending_total
+    now = time.monotonic()
+    with _lock:
+        _pending[cid] += 1
+        _pending_total += 1
+        due = (
+            _pending_total >= _size()
+            or now - _last_flush >= _interval()
+            or _flush_requested(now)
+        )
+    if due:
+        flush()
+
+
+def pending_count(cid=None):
+    """まだ DB に書いていない閲覧数（cid 指定なしなら合計）"""
+    with _lock:
+        return _pending_total if cid is None else _pending.get(cid, 0)
+
+
+def flush():
+    """貯まっている加算分を UPDATE でまとめて書き込む。書き込んだ閲覧数を返す"""
+    global _pending_total, _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _pending_total = 0
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+
+    items = list(batch.items())
+    written = 0
+    for i in range(0, len(items), UPDATE_CHUNK):
+        chunk = items[i:i + UPDATE_CHUNK]
+        delta = Case(
+            *[When(cid=cid, then=Value(n)) for cid, n in chunk],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        try:
+            Post.objects.filter(cid__in=[cid for cid, _ in chunk]).update(
+                view_total=F("view_total") + delta
+            )
+        except DatabaseError:
+            # DB がロック中などで書けなければ、残りは次回に持ち越す
+            with _lock:
+                for cid, n in items[i:]:
+                    _pending[cid] += n
+                    _pending_total += n
+            break
+        written += sum(n for _, n in chunk)
+    return written
+
+
+def request_flush():
+    """全ワーカーに flush を要求する（要求ファイルを touch）"""
+    path = _request_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return path
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
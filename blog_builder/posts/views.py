@@ -1,12 +1,15 @@
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 from django.utils.html import mark_safe
 from django.urls import reverse
 from django.core.paginator import Paginator
-from django.db.models import F
 from .models import Post
+from .genres import to_list as _to_list
+from . import fragment_cache, recommend, search, view_counter
+from .cursor import keyset_page
+from .rendering import render_review_fields
 import itertools
-import random
-import markdown
 
 GENRE_OMIT = {
     "ハイビジョン", "HD", "4K", "独占配信",
@@ -14,15 +17,43 @@ GENRE_OMIT = {
     "FANZA",
 }
 
-
-def _to_list(genres):
-    if isinstance(genres, list):
-        return [g for g in genres if isinstance(g, str)]
-    if isinstance(genres, str):
-        return [g.strip() for g in genres.split('/') if g.strip()] \
-            or [g.strip() for g in genres.split('、') if g.strip()] \
-            or [g.strip() for g in genres.split(',') if g.strip()]
-    return []
+# 一覧系のクエリで読まない重いカラム
+LIST_DEFER = ("review", "review_body", "review_html")
+# 関連枠カードで使うカラム
+CARD_FIELDS = ("id", "cid", "name", "title")
+
+# 一覧の1ページあたり件数
+PER_PAGE = 30
+
+
+def _paginate(request, qs):
+    """
+    一覧のページング。テンプレート用の dict（page_obj / cursor_page / posts）を返す。
+    POST_LIST_CURSOR_PAGINATION が有効なら COUNT も OFFSET も使わないカーソル方式で、
+    ?page=N は POST_LIST_MAX_PAGE_NUMBER までの浅いページだけ受け付ける。
+    """
+    if not getattr(settings, "POST_LIST_CURSOR_PAGINATION", False):
+        paginator = Paginator(qs, PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get("page") or 1)
+        return {"page_obj": page_obj, "cursor_page": None, "posts": page_obj.object_list}
+
+    try:
+        page = max(1, int(request.GET.get("page") or 1))
+    except ValueError:
+        page = 1
+    if page > getattr(settings, "POST_LIST_MAX_PAGE_NUMBER", 10):
+        raise Http404("page too deep")
+
+    try:
+        cursor_page = keyset_page(
+            qs, PER_PAGE,
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+            page=page,
+        )
+    except ValueError:
+        raise Http404("invalid cursor")
+    return {"page_obj": None, "cursor_page": cursor_page, "posts": cursor_page["object_list"]}
 
 
 def _build_genre_pairs(post):
@@ -68,95 +99,96 @@ def _build_genre_pairs(post):
     return pairs
 
 
-def build_review_excerpt(post, length: int = 60) -> str:
-    raw = (
-        getattr(post, "review", None)
-        or getattr(post, "review_body", None)
-        or ""
-    )
-    raw = str(raw).strip()
-    if not raw:
-        return ""
+def post_index(request):
+    # 一覧では本文を使わない（抜粋は excerpt_short に保存済み）
+    qs = Post.objects.defer(*LIST_DEFER).order_by("-release_date", "-id")
 
-    import re as _re
+    query = (request.GET.get("q") or "").strip()
 
-    lines = []
-    for line in raw.splitlines():
-        s = line.strip()
-        if not s:
-            continue
-        if s.startswith("#"):
-            continue
-        if any(w in s for w in ("基本情報", "レビュー", "Profile", "プロフィール")):
-            continue
-        lines.append(s)
+    popular_posts = Post.objects.defer(*LIST_DEFER).order_by("-view_total", "-id")[:30]
 
-    if not lines:
-        text = " ".join(raw.split())
-    else:
-        text = lines[0]
+    context = {
+        "popular_posts": popular_posts,
+        "genre_main": None,
+        "query": query,
+    }
 
-    text = _re.sub(r"[#*_`>]+", "", text)
-    text = " ".join(text.split())
-    return text[:length]
+    # 検索は全文検索の索引（posts.search）で関連度順に引く
+    # （件数は COUNT、各ページは LIMIT / OFFSET で引くので上限なく辿れる）
+    hits = search.search_results(query) if query else None
+    if hits is not None:
+        paginator = Paginator(hits, PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get("page") or 1)
+        found = Post.objects.defer(*LIST_DEFER).in_bulk(page_obj.object_list)
+        context.update({
+            "page_obj": page_obj,
+            "cursor_page": None,
+            "posts": [found[i] for i in page_obj.object_list if i in found],
+        })
+        return render(request, "post_index.html", context)
 
+    if query:
+        # 索引が使えない環境では従来どおりタイトルの部分一致
+        qs = qs.filter(title__icontains=query)
 
-def build_review_excerpt_html(body_html: str, length: int = 250) -> str:
-    if not body_html:
-        return ""
-    import re as _re, html as _html
-    m = _re.search(r"<h2>レビュー</h2>\s*<p>(.*?)</p>", body_html, _re.S)
-    if m:
-        text_html = m.group(1)
-    else:
-        m2 = _re.search(r"<p>(.*?)</p>", body_html, _re.S)
-        text_html = m2.group(1) if m2 else body_html
-    text = _re.sub(r"<[^>]+>", "", text_html)
-    text = _html.unescape(text)
-    text = " ".join(text.split())
-    return text[:length]
+    context.update(_paginate(request, qs))
+    return render(request, "post_index.html", context)
 
 
-def post_index(request):
-    qs = Post.objects.order_by("-release_date", "-id")
+def _card(p):
+    """関連枠の1件分（テンプレートで使う項目だけ。キャッシュに載せるため dict にする）"""
+    return {"cid": p.cid, "name": p.name, "title": p.title}
 
-    query = (request.GET.get("q") or "").strip()
-    if query:
-        qs = qs.filter(title__icontains=query)
 
-    paginator = Paginator(qs, 30)
-    page_number = request.GET.get("page") or 1
-    page_obj = paginator.get_page(page_number)
+def _build_detail_content(post):
+    """post だけで決まる部分（保存済みの本文HTML・抜粋・ジャンル）"""
+    if not post.meta_description:
+        # backfill_rendered_fields 前の記事はその場で計算する
+        render_review_fields(post)
 
-    for p in page_obj:
-        p.review_excerpt = build_review_excerpt(p, length=120)
+    genre_text_list = _to_list(post.genres)
 
-    popular_posts = Post.objects.order_by("-view_total", "-id")[:30]
+    return {
+        "body_html": mark_safe(post.review_html),
+        "review_excerpt": post.excerpt_long,
+        "meta_description": post.meta_description,
+        "genre_pairs": _build_genre_pairs(post),
+        "genre_text": " / ".join(genre_text_list) if genre_text_list else "",
+    }
 
-    context = {
-        "page_obj": page_obj,
-        "posts": page_obj.object_list,
-        "popular_posts": popular_posts,
-        "genre_main": None,
-        "query": query,
+
+def _build_detail_related(post):
+    """他の記事の追加で変わる部分（関連枠）"""
+    same_maker_posts = Post.objects.only(*CARD_FIELDS).filter(
+        maker=post.maker
+    ).exclude(
+        id=post.id
+    ).order_by("-release_date", "-id")[:9]
+
+    popular_posts = Post.objects.only(*CARD_FIELDS).exclude(
+        id=post.id
+    ).order_by("-release_date", "-id")[:6]
+
+    # 他メーカー枠は MakerRing（取り込み時に更新）から表示分だけ引く
+    other_maker_blocks = recommend.other_maker_blocks(post)
+
+    return {
+        "same_maker_posts": [_card(p) for p in same_maker_posts],
+        "popular_posts": [_card(p) for p in popular_posts],
+        "other_maker_blocks": [
+            {"maker": b["maker"], "posts": [_card(p) for p in b["posts"]]}
+            for b in other_maker_blocks
+        ],
     }
-    return render(request, "post_index.html", context)
 
 
 def post_detail(request, cid):
     post = get_object_or_404(Post, cid=cid)
 
-    if hasattr(post, "view_total"):
-        Post.objects.filter(pk=post.pk).update(view_total=F("view_total") + 1)
-        post.refresh_from_db()
-
-    raw_review = (post.review or post.review_body or "").strip()
-    if raw_review:
-        body_html = mark_safe(
-            markdown.markdown(raw_review, extensions=["extra"])
-        )
-    else:
-        body_html = ""
+    # 閲覧数はプロセス内に貯めて、まとめて書き込む（posts.view_counter）
+    # 静的書き出し（posts.static_export）のリクエストは数えない
+    if not getattr(request, "static_export", False):
+        view_counter.record_view(post.cid)
 
     if getattr(post, "sizes", None):
         seo_sizes = post.sizes
@@ -171,95 +203,37 @@ def post_detail(request, cid):
     sample_images = [f"{base}/{post.cid}_{i:02d}.jpg" for i in range(1, 6)]
     poster_url = f"{base}/{post.cid}_poster.jpg"
 
-    if raw_review:
-        one_line = "".join(raw_review.splitlines())
-        meta_description = one_line[:120]
-    else:
-        meta_description = f"{actress_label} の素人ハメ撮り作品レビューです。"
-
     page_url = request.build_absolute_uri(
         reverse("post_detail", kwargs={"cid": post.cid})
     )
 
-    genre_pairs = _build_genre_pairs(post)
-    genre_text_list = _to_list(post.genres)
-    genre_text = " / ".join(genre_text_list) if genre_text_list else ""
-
-    same_maker_posts = Post.objects.filter(
-        maker=post.maker
-    ).exclude(
-        id=post.id
-    ).order_by("-release_date", "-id")[:9]
-
-    popular_posts = Post.objects.exclude(
-        id=post.id
-    ).order_by("-release_date", "-id")[:6]
-
-    others_qs = Post.objects.exclude(id=post.id)
-    if post.maker:
-        others_qs = others_qs.exclude(maker=post.maker)
-
-    others = list(others_qs.order_by("-release_date", "-id")[:200])
-    random.shuffle(others)
-
-    maker_map = {}
-    for p2 in others:
-        maker = (p2.maker or "").strip()
-        if not maker:
-            continue
-        lst = maker_map.setdefault(maker, [])
-        if len(lst) < 6:
-            lst.append(p2)
-
-    other_maker_blocks = []
-    for maker, posts_for_maker in maker_map.items():
-        if posts_for_maker:
-            other_maker_blocks.append({
-                "maker": maker,
-                "posts": posts_for_maker,
-            })
-        if len(other_maker_blocks) >= 3:
-            break
-
     context = {
         "post": post,
-        "body_html": body_html,
         "seo_sizes": seo_sizes,
         "actress_label": actress_label,
         "poster_url": poster_url,
         "sample_images": sample_images,
-        "meta_description": meta_description,
         "page_url": page_url,
-        "genre_pairs": genre_pairs,
-        "genre_text": genre_text,
-        "same_maker_posts": same_maker_posts,
-        "popular_posts": popular_posts,
-        "other_maker_blocks": other_maker_blocks,
     }
-    context["review_excerpt"] = build_review_excerpt_html(body_html)
+    # 重い部分は cid ごとにキャッシュ（posts.fragment_cache）
+    context.update(fragment_cache.get_content(post, _build_detail_content))
+    context.update(fragment_cache.get_related(post, _build_detail_related))
     return render(request, "post_detail_template.html", context)
 
 
 def genre_list(request, main):
-    base_qs = Post.objects.order_by("-release_date", "-id")
-    filtered = [p for p in base_qs if main in _to_list(p.genres)]
-
-    paginator = Paginator(filtered, 30)
-    page_number = request.GET.get("page") or 1
-    page_obj = paginator.get_page(page_number)
+    # PostGenre 索引で絞り込み、COUNT / LIMIT / OFFSET は DB 側で行う
+    base_qs = Post.objects.filter(genre_links__name=main).defer(*LIST_DEFER).order_by("-release_date", "-id")
 
-    for p in page_obj:
-        p.review_excerpt = build_review_excerpt(p, length=120)
+    popular_posts = Post.objects.defer(*LIST_DEFER).order_by("-view_total", "-id")[:30]
 
-    popular_posts = Post.objects.order_by("-view_total", "-id")[:30]
-
-    return render(request, "post_index.html", {
-        "page_obj": page_obj,
-        "posts": page_obj.object_list,
+    context = {
         "popular_posts": popular_posts,
         "genre_main": main,
         "query": "",
-    })
+    }
+    context.update(_paginate(request, base_qs))
+    return render(request, "post_index.html", context)
 
 
 def contact(request):
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+全文検索（posts.search）と従来の title__icontains の速度比較。
+
+一時 SQLite に架空の記事を N 件作り、同じ検索語で
+  - icontains     : タイトルだけの LIKE '%q%'（従来の post_index と同じ）+ COUNT(*)
+  - icontains_all : 6 列すべての LIKE（FTS と同じ範囲を素朴に探した場合）
+  - fts           : posts.search.build_count_query + build_query の1ページ分（MATCH + bm25）
+の中央値をミリ秒で出す。本番 DB には触らない。
+
+使い方:
+  python scripts/bench_search.py --rows 10000,100000 --repeat 7
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR   = Path(__file__).resolve().parent      # .../blog_builder/scripts
+PROJECT_ROOT = SCRIPT_DIR.parent                    # .../blog_builder
+sys.path.append(str(PROJECT_ROOT))
+
+from posts import search  # noqa  (django.setup() 不要：SQL を組み立てるだけ)
+
+NAMES = ["ゆい", "さくら", "みなみ", "あおい", "りんか", "ひなの", "なな", "まりな", "YUNA", "RINKA"]
+MAKERS = ["ブロッコリー", "素人ホイホイ", "S-Cute", "ナンパTV", "MGS", "プレステージ", "シロウトTV"]
+GENRES = ["巨乳", "美少女", "ハメ撮り", "素人", "スレンダー", "OL", "女子大生", "人妻", "ギャル", "清楚"]
+WORDS = [
+    "初めての撮影", "恥ずかしそうに", "笑顔が可愛い", "スタイル抜群", "ホテルで",
+    "緊張しながら", "大胆に", "色白美肌", "敏感体質", "久しぶりの", "密着", "本音トーク",
+]
+QUERIES = ["巨乳", "さくら", "スタイル抜群", "ブロッコリー", "笑顔 ホテル", "存在しない語句"]
+
+
+def make_rows(n, seed=1):
+    rng = random.Random(seed)
+    for i in range(1, n + 1):
+        name = rng.choice(NAMES)
+        yield (
+            i,
+            f"{name}（{rng.randint(18, 35)}） {rng.choice(WORDS)}{rng.choice(WORDS)}",
+            name,
+            rng.choice(MAKERS),
+            rng.choice(MAKERS),
+            " / ".join(rng.sample(GENRES, 4)),
+            "".join(rng.choice(WORDS) + "。" for _ in range(rng.randint(20, 60))),
+            f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00",
+        )
+
+
+def build_db(path, n):
+    con = sqlite3.connect(path)
+    con.execute(
+        "CREATE TABLE posts_post (id INTEGER PRIMARY KEY, title TEXT, name TEXT, maker TEXT,"
+        " label TEXT, genres TEXT, review TEXT, release_date TEXT)"
+    )
+    con.execute("CREATE INDEX post_release_id_idx ON posts_post (release_date, id)")
+    con.executemany("INSERT INTO posts_post VALUES (?, ?, ?, ?, ?, ?, ?, ?)", make_rows(n))
+    con.execute(search.CREATE_SQL)
+    con.execute(
+        f"INSERT INTO {search.FTS_TABLE} (rowid, {', '.join(search.COLUMNS)}) "
+        f"SELECT id, {', '.join(search.COLUMNS)} FROM posts_post"
+    )
+    con.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+    con.commit()
+    return con
+
+
+def timed(con, sql, params, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        con.execute(sql, params).fetchall()
+        out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def bench(con, query, repeat):
+    like = f"%{search._like_escape(query)}%"
+    res = {}
+
+    # 従来: Paginator の COUNT(*) + 1ページ目
+    res["icontains"] = timed(
+        con, "SELECT COUNT(*) FROM posts_post WHERE title LIKE ? ESCAPE '\\'", [like], repeat
+    ) + timed(
+        con,
+        "SELECT id FROM posts_post WHERE title LIKE ? ESCAPE '\\' "
+        "ORDER BY release_date DESC, id DESC LIMIT 30",
+        [like], repeat,
+    )
+
+    terms = query.split()
+    where = " AND ".join(
+        "(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in search.COLUMNS) + ")" for _ in terms
+    )
+    params = [f"%{search._like_escape(t)}%" for t in terms for _ in search.COLUMNS]
+    res["icontains_all"] = timed(
+        con, f"SELECT COUNT(*) FROM posts_post WHERE {where}", params, repeat
+    ) + timed(
+        con,
+        f"SELECT id FROM posts_post WHERE {where} ORDER BY release_date DESC, id DESC LIMIT 30",
+        params, repeat,
+    )
+
+    # FTS も post_index と同じく COUNT と1ページ分（LIMIT / OFFSET）
+    count_sql, count_params = search.build_count_query(query)
+    sql, params = search.build_query(query, limit=30)
+    res["fts"] = timed(
+        con, count_sql.replace("%s", "?"), count_params, repeat
+    ) + timed(con, sql.replace("%s", "?"), params, repeat)
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", default="10000,100000", help="件数（カンマ区切り）")
+    ap.add_argument("--repeat", type=int, default=7, help="1クエリあたりの試行回数（中央値を採用）")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in [int(x) for x in args.rows.split(",") if x.strip()]:
+            t0 = time.perf_counter()
+            con = build_db(Path(tmp) / f"bench_{n}.sqlite3", n)
+            print(f"\n=== {n} 件（DB作成 {time.perf_counter() - t0:.1f} 秒）===")
+            print(f"{'query':<16}{'icontains':>12}{'icontains_all':>16}{'fts':>10}  (ms, median)")
+            for q in QUERIES:
+                r = bench(con, q, args.repeat)
+                print(f"{q:<16}{r['icontains']:>12.2f}{r['icontains_all']:>16.2f}{r['fts']:>10.2f}")
+            con.close()
+
+
+if __name__ == "__main__":
+    main()
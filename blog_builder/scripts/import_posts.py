@@ -19,6 +19,10 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog_builder.settings")
 django.setup()
 
 from posts.models import Post  # noqa
+from posts.genres import sync_post_genres  # noqa
+from posts.recommend import refresh_maker_rings  # noqa
+from posts import fragment_cache, search  # noqa
+from posts.rendering import render_review_fields  # noqa
 
 QUEUE_DIR     = BASE_DIR / "publish_queue"
 CONTENT_ROOT  = BASE_DIR / "content"
@@ -67,6 +71,9 @@ def main():
         print("INFO: publish_queue に処理待ちがありません。")
         return
 
+    touched_makers = set()
+    updated_cids = []
+
     for q in queue_files:
         cid = q.stem
         print(f"--- Processing CID: {cid} ---")
@@ -93,6 +100,9 @@ def main():
                 print(f"FAIL: DB に cid={cid} がないのでスキップ")
                 continue
 
+            # メーカーが変わる場合に備えて、変更前のメーカーも更新対象にする
+            touched_makers.add(post.maker)
+
             # レビュー本文
             review_body = extract_review(post_data.content)
             post.review_body = review_body
@@ -137,8 +147,15 @@ def main():
                 if rd:
                     post.release_date = rd
 
+            # 本文HTML・抜粋・meta description を保存用に計算
+            render_review_fields(post)
+
             post.draft_path = str(PUBLISHED_DIR / md_path.name)
             post.save()
+            sync_post_genres([post])
+            search.index_posts([post])
+            touched_makers.add(post.maker)
+            updated_cids.append(cid)
 
             # 原稿移動 & queue 削除
             published_path = PUBLISHED_DIR / md_path.name
@@ -153,6 +170,11 @@ def main():
             print(f"FATAL: [{cid}] の処理でエラー: {e}")
             print("FATAL: この CID はスキップします。")
 
+    if touched_makers:
+        refresh_maker_rings(touched_makers)
+    if updated_cids:
+        fragment_cache.invalidate(updated_cids)
+
 
 if __name__ == "__main__":
     main()
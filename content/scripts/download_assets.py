@@ -1,74 +1,57 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import json, os, urllib.request
+import argparse, json, sys
 from pathlib import Path
-import time
+
+# data_getter/fanza の共通ダウンローダを使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "data_getter" / "fanza"))
+import asset_store
+import downloader
 
 # --- 設定 ---
 EXPORTS = Path.home()/ "eroblog"/ "content"/ "exports"/ "latest.jsonl"
 ASSETS  = Path.home()/ "eroblog"/ "content"/ "assets"
+STORE   = Path.home()/ "eroblog"/ "content"/ "asset_store"
 # ---
 
-ASSETS.mkdir(parents=True, exist_ok=True)
 
-# [修正] 偽装ヘッダー (自分をブラウザだと偽る)
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36',
-    'Referer': 'https://www.dmm.co.jp/'
-}
+def poster_candidates(url):
+    # 大きいポスター（pl.jpg）を先に試し、だめなら元の URL
+    large = url.replace("jm.jpg", "pl.jpg")
+    return [large, url] if large != url else [url]
 
-def download_file(url, dest_path):
-    """ 偽装ヘッダー付きでファイルをダウンロードする """
-    try:
-        req = urllib.request.Request(url, headers=HEADERS)
-        with urllib.request.urlopen(req) as response:
-            with open(dest_path, 'wb') as out_file:
-                out_file.write(response.read())
-        return True
-    except Exception as e:
-        print(f"  └ Failed: {e}")
-        return False
 
-try:
-    with EXPORTS.open(encoding="utf-8") as f:
-        line = f.readline()
-    if not line: print("エラー: latest.jsonl が空です。"); exit()
-            
-    data = json.loads(line)
-    cid = data.get("cid")
-    if not cid: print("エラー: 1行目から cid が見つかりません。"); exit()
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--all", action="store_true", help="latest.jsonl の全行をまとめて取得（既定は1行目のみ）")
+    args = ap.parse_args()
 
-    print(f"--- 処理対象: {cid} ---")
+    ASSETS.mkdir(parents=True, exist_ok=True)
+    try:
+        with EXPORTS.open(encoding="utf-8") as f:
+            lines = [l for l in f if l.strip()] if args.all else [f.readline()]
+        if not lines or not lines[0].strip():
+            print("エラー: latest.jsonl が空です。"); return
+
+        jobs = []
+        for line in lines:
+            data = json.loads(line)
+            if not data.get("cid"):
+                print("エラー: cid が見つからない行をスキップします。"); continue
+            print(f"--- 処理対象: {data['cid']} ---")
+            jobs += downloader.jobs_for_post(data, ASSETS, poster_candidates=poster_candidates)
+
+        dl = downloader.Downloader(store=asset_store.AssetStore(STORE, ASSETS))
+        try:
+            dl.fetch_many(jobs, on_done=downloader.print_result)
+        finally:
+            dl.close()
+        print("[DOWNLOAD]", dl.summary(), "|", dl.store.summary())
+        print("------------------------")
 
-    # poster_urlを {cid}_poster.jpg として保存
-    poster_url = data.get("poster_url")
-    if poster_url:
-        poster_ext = (os.path.splitext(poster_url)[1] or ".jpg").split('?')[0]
-        poster_dest = ASSETS / f"{cid}_poster{poster_ext}"
-        
-        if not poster_dest.exists():
-            large_poster_url = poster_url.replace("jm.jpg", "pl.jpg")
-            print(f"Downloading large poster: {large_poster_url}")
-            if not download_file(large_poster_url, poster_dest):
-                print(f"Falling back to original: {poster_url}")
-                if not download_file(poster_url, poster_dest):
-                    print(f"skip poster: {poster_url}")
-            if poster_dest.exists(): print(f"saved poster: {poster_dest.name}")
-        else:
-            print(f"exists poster: {poster_dest.name}")
+    except Exception as e:
+        print(f"スクリプト実行中にエラーが発生しました: {e}")
 
-    # sample_imagesを {cid}_{num}.jpg として保存
-    for j, u in enumerate(data.get("sample_images") or []):
-        ext = (os.path.splitext(u)[1] or ".jpg").split('?')[0]
-        dest = ASSETS / f"{cid}_{j+1:02d}{ext}"
-        if not dest.exists():
-            print(f"Downloading sample: {u}")
-            if download_file(u, dest):
-                print(f"saved sample: {dest.name}")
-        else:
-            print(f"exists sample: {dest.name}")
-            
-    print("------------------------")
 
-except Exception as e:
-    print(f"スクリプト実行中にエラーが発生しました: {e}")
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
-import os, sys, json, re, subprocess, csv, datetime, urllib.request, urllib.parse as up
+import os, sys, json, re, subprocess, csv, datetime, threading, time, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "fanza"))
+import api_fetch_by_cid
+import asset_store
+import browser_pool
+import discovery
+import downloader
+import image_variants
+import processed_store
+import sample_resolver
+
 # ---- FANZA API env bootstrap (auto-added) ----
 def _ensure_fanza_env():
     import os, sys
@@ -37,7 +49,7 @@ BASE  = Path(__file__).resolve().parent
 OUT   = BASE / "out" / "items"
 JSONL = BASE / "out" / "videoc_latest_enriched.jsonl"
 CSV   = BASE / "out" / "videoc_latest.csv"
-HIST  = BASE / "out" / "processed_cids.txt"
+HIST  = processed_store.DB_PATH
 
 # content/assets/ へのパス
 ASSETS = BASE.parent / "content" / "assets"
@@ -56,6 +68,56 @@ API_HOST = "https://api.dmm.com/affiliate/v3/ItemList"
 ALLOW_HOSTS = ("pics.dmm.co.jp", "awsimgsrc.dmm.co.jp")
 EXTS = (".jpg", ".jpeg", ".webp", ".png")
 
+# サブプロセスが主にアクセスするホスト（リクエスト予算の単位）
+API_NETLOC = "api.dmm.com"
+VIDEO_NETLOC = "video.dmm.co.jp"
+PICS_NETLOC = "pics.dmm.co.jp"
+
+
+class HostBudget:
+    """
+    ホストごとのリクエスト予算。
+      - concurrency : 同じホストへ同時に出すリクエスト（サブプロセス）の上限
+      - interval    : 同じホストへのリクエスト開始の最小間隔（秒）
+    with BUDGET.slot(host): の中で1リクエスト（またはサブプロセス1本）を実行する。
+    """
+
+    def __init__(self, concurrency=2, interval=0.25):
+        self.concurrency = max(1, int(concurrency))
+        self.interval = max(0.0, float(interval))
+        self._lock = threading.Lock()
+        self._sems = {}
+        self._next = {}
+
+    def _sem(self, host):
+        with self._lock:
+            if host not in self._sems:
+                self._sems[host] = threading.BoundedSemaphore(self.concurrency)
+            return self._sems[host]
+
+    @contextmanager
+    def slot(self, host):
+        sem = self._sem(host)
+        sem.acquire()
+        try:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next.get(host, 0.0))
+                self._next[host] = start + self.interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            sem.release()
+
+
+# main() で --host_concurrency / --host_interval から作り直す
+BUDGET = HostBudget()
+# サンプル画像の HEAD 確認で同じホストへ同時に出す本数（BUDGET とは別枠・間隔なし）
+PROBE_CONCURRENCY = 8
+# プロセス内ブラウザプールのページ数（main() で --workers に合わせる）
+POOL_SIZE = 1
+
 
 def run(cmd: str) -> str:
     p = subprocess.run(cmd, shell=True, capture_output=True, text=True)
@@ -64,15 +126,39 @@ def run(cmd: str) -> str:
     return p.stdout
 
 
+# prefetch_api() でまとめて引いた結果（cid -> 正規化 dict or None）
+API_PREFETCH = {}
+
+
+def prefetch_api(cids):
+    """新着一覧を1回走査して、今回の CID をまとめて API から引いておく"""
+    stats = {}
+    try:
+        # 一覧の各ページ・キーワード検索1件ごとに BUDGET の枠を取る（--host_interval を守る）
+        API_PREFETCH.update(api_fetch_by_cid.lookup_many(
+            cids, stats=stats, host_slot=lambda host: BUDGET.slot(host)))
+    except Exception as e:
+        print("[WARN] API まとめ取得に失敗（CID ごとに取得します）:", e)
+        return
+    print("[API] batch: " + " ".join(f"{k}={v}" for k, v in stats.items()))
+
+
 def api_one(cid: str) -> dict:
-    js = run(f'{sys.executable} fanza/api_fetch_by_cid.py --cid "{cid}"')
-    return json.loads(js)
+    if cid in API_PREFETCH:
+        d = API_PREFETCH[cid]
+    else:
+        # プロセス内のクライアントで引く（接続は keep-alive で使い回し）
+        with BUDGET.slot(API_NETLOC):
+            d = api_fetch_by_cid.lookup(cid)
+    return d or {"error": "not_found", "cid": cid}
 
 
 def probe_one(cid: str) -> dict:
     url = f"https://video.dmm.co.jp/amateur/content/?id={cid}"
-    js = run(f'{sys.executable} fanza/videoc_probe.py "{url}"')
-    d = json.loads(js)
+    # 常駐プールがあればそちら、無ければプロセス内のプールで開く（CID ごとに Chromium を起動しない）
+    with BUDGET.slot(VIDEO_NETLOC):
+        # サンプル画像は samples_one で取るので、ページ側の収集（スクロール）は省く
+        d = browser_pool.call("probe", {"url": url, "samples": False}, pool_size=POOL_SIZE)
     try:
         OUT.mkdir(parents=True, exist_ok=True)
         (OUT / f"{cid}_probe_pw.json").write_text(
@@ -84,24 +170,28 @@ def probe_one(cid: str) -> dict:
     return d
 
 
-def samples_one(cid: str):
+def samples_one(cid: str, api: dict = None):
     outp = Path(f"out/items/{cid}_samples.json")
 
-    # 無ければ生成
+    # 無ければ生成: API / 命名規則の候補を並行 HEAD で確かめ、取れなかったときだけブラウザ
     if not outp.exists():
-        cmd = (
-            f'{sys.executable} scripts/fetch_exact_samples.py '
-            f'--cid "{cid}" --out "{outp}" --headless true --timeout 120000'
+        dl = get_prober()
+        d = sample_resolver.resolve(cid, api=api, dl=dl)
+        if not d["sample_images"]:
+            try:
+                with BUDGET.slot(VIDEO_NETLOC):
+                    d = browser_pool.call(
+                        "samples", {"cid": cid, "timeout": 120000}, pool_size=POOL_SIZE
+                    )
+            except Exception as e:
+                raise RuntimeError(f"fetch_exact_samples failed: {e}") from e
+            d.setdefault("notes", []).append("headless=True")
+            # 大サイズへの昇格（あれば）
+            d["sample_images"] = sample_resolver.upgrade(d.get("sample_images") or [], cid, dl)
+        outp.parent.mkdir(parents=True, exist_ok=True)
+        outp.write_text(
+            json.dumps(d, ensure_ascii=False, separators=(",", ":")), encoding="utf-8"
         )
-        p = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        if p.returncode != 0:
-            raise RuntimeError(f"fetch_exact_samples failed: {p.stderr}")
-
-    # 大サイズへの昇格（あれば）
-    upgr = Path("scripts/upgrade_samples_to_large.py")
-    if upgr.exists():
-        cmd = f'{sys.executable} "{upgr}" "{outp}"'
-        subprocess.run(cmd, shell=True, capture_output=True, text=True)
 
     try:
         d = json.loads(outp.read_text(encoding="utf-8"))
@@ -184,17 +274,42 @@ def write_csv_row(d: dict):
         )
 
 
+_downloader = None
+
+
+def get_downloader():
+    """画像ダウンローダ（接続はホストごとに使い回し、同時数は BUDGET に従う。保存は asset_store 経由）"""
+    global _downloader
+    if _downloader is None:
+        _downloader = downloader.Downloader(
+            headers=HEADERS, host_slot=lambda host: BUDGET.slot(host),
+            store=asset_store.AssetStore(assets_dir=ASSETS),
+        )
+    return _downloader
+
+
+_prober = None
+
+
+def get_prober():
+    """
+    サンプル画像の存在確認（HEAD）用。BUDGET の間隔待ちに入れるとそれだけで数秒かかり、
+    画像ダウンロードとも取り合うので、ホストごとの同時数だけで絞る別のプールにする
+    """
+    global _prober
+    if _prober is None:
+        _prober = downloader.Downloader(
+            per_host=PROBE_CONCURRENCY, max_workers=PROBE_CONCURRENCY, timeout=6, headers=HEADERS,
+        )
+    return _prober
+
+
 def download_file(url: str, dest_path: Path) -> bool:
-    try:
-        print(f"  Downloading: {url}")
-        req = urllib.request.Request(url, headers=HEADERS)
-        with urllib.request.urlopen(req, timeout=20) as response:
-            with open(dest_path, "wb") as out_file:
-                out_file.write(response.read())
-        return True
-    except Exception as e:
-        print(f"  └ Failed: {e}")
-        return False
+    print(f"  Downloading: {url}")
+    r = get_downloader().fetch(url, dest_path, overwrite=True)
+    if not r.ok:
+        print(f"  └ Failed: {r.error}")
+    return r.ok
 
 
 def download_assets_for_post(enriched: dict):
@@ -205,31 +320,8 @@ def download_assets_for_post(enriched: dict):
 
     ASSETS.mkdir(parents=True, exist_ok=True)
     print(f"[DOWNLOAD] Checking assets for {cid}...")
-
-    poster_url = enriched.get("poster_url")
-    if poster_url:
-        poster_ext = (os.path.splitext(poster_url)[1] or ".jpg").split("?")[0]
-        poster_dest = ASSETS / f"{cid}_poster{poster_ext}"
-
-        if not poster_dest.exists():
-            if download_file(poster_url, poster_dest):
-                print(f"  Saved poster: {poster_dest.name}")
-            else:
-                print(f"  Skip poster: {poster_url}")
-        else:
-            print(f"  Exists poster: {poster_dest.name}")
-
-    sample_images = enriched.get("sample_images") or []
-    for j, u in enumerate(sample_images):
-        ext = (os.path.splitext(u)[1] or ".jpg").split("?")[0]
-        dest = ASSETS / f"{cid}_{j+1:02d}{ext}"
-
-        if not dest.exists():
-            if download_file(u, dest):
-                print(f"  Saved sample: {dest.name}")
-        else:
-            print(f"  Exists sample: {dest.name}")
-
+    for r in get_downloader().fetch_many(downloader.jobs_for_post(enriched, ASSETS)):
+        downloader.print_result(r)
     print(f"[DOWNLOAD] Asset check for {cid} complete.")
 
 
@@ -264,10 +356,8 @@ def call_itemlist_variant(aid, aff, site, service, floor, offset=1, hits=50):
         params["service"] = service
     if floor:
         params["floor"] = floor
-    url = API_HOST + "?" + up.urlencode(params)
-    with urllib.request.urlopen(url, timeout=20) as resp:
-        body = resp.read().decode("utf-8", "replace")
-    return json.loads(body)
+    with BUDGET.slot(API_NETLOC):
+        return api_fetch_by_cid.call_itemlist(params)
 
 
 def extract_items(j):
@@ -287,16 +377,18 @@ def extract_cid_from_item(it):
     return m.group(1) if m else None
 
 
+API_VARIANTS = [
+    {"site": "FANZA", "service": "digital", "floor": "videoc"},
+    {"site": "FANZA", "service": "amateur", "floor": "videoc"},
+    {"site": None, "service": "digital", "floor": "videoc"},
+]
+
+
 def try_api_latest_cids(limit=60):
     aid, aff = get_api_keys()
-    variants = [
-        {"site": "FANZA", "service": "digital", "floor": "videoc"},
-        {"site": "FANZA", "service": "amateur", "floor": "videoc"},
-        {"site": None, "service": "digital", "floor": "videoc"},
-    ]
     got = []
     seen = set()
-    for v in variants:
+    for v in API_VARIANTS:
         for offset in (1, 51, 101, 151, 201):
             j = call_itemlist_variant(
                 aid, aff, v["site"], v["service"], v["floor"], offset=offset, hits=50
@@ -330,37 +422,47 @@ def try_html_latest_cids(limit=60):
     return out
 
 
+_store = None
+
+
 def load_history():
-    if not HIST.exists():
-        return set()
-    return {
-        l.strip()
-        for l in HIST.read_text(encoding="utf-8").splitlines()
-        if l.strip()
-    }
+    """処理済み CID の台帳（`cid in load_history()` で判定。初回は txt から移行）"""
+    global _store
+    if _store is None:
+        _store = processed_store.ProcessedStore(HIST)
+    return _store
 
 
 def append_history(cid: str):
-    HIST.parent.mkdir(parents=True, exist_ok=True)
-    with HIST.open("a", encoding="utf-8") as f:
-        f.write(cid + "\n")
+    load_history().mark_done(cid)
 
 
-def find_unprocessed_latest_cids(max_new: int = 20):
+def find_unprocessed_latest_cids(max_new: int = 20, full_scan: bool = False):
     """
-    processed_cids.txt にまだ登場していない CID を
+    処理済み台帳（processed_store）にまだ無い CID を
     新しい順に最大 max_new 件だけ返す。
+    一覧は前回の位置（discovery.py）を越えるところまでしか読まない。
     """
     history = load_history()
     if max_new < 1:
         max_new = 1
     fetch_limit = max(60, max_new * 4)
-    cands = try_api_latest_cids(limit=fetch_limit)
-    if not cands:
+    aid, aff = get_api_keys()
+
+    def fetch_page(v, offset, hits):
+        j = call_itemlist_variant(
+            aid, aff, v["site"], v["service"], v["floor"], offset=offset, hits=hits
+        )
+        return extract_items(j)
+
+    unseen, stats = discovery.discover(
+        fetch_page, API_VARIANTS, history=history, limit=fetch_limit, full=full_scan
+    )
+    print("[DISCOVERY]", discovery.format_stats(stats))
+    if stats["variant"] is None:
+        # API が使えなかったときだけ HTML 一覧へ
         cands = try_html_latest_cids(limit=fetch_limit)
-    if not cands:
-        return []
-    unseen = [c for c in cands if c not in history]
+        unseen = [c for c in cands if c not in history]
     return unseen[:max_new]
 
 
@@ -406,6 +508,94 @@ def filter_urls(urls, cid, limit=10):
     return (out[:limit] if out else norm[:limit])
 
 
+def collect_one(cid: str) -> dict:
+    """API / probe / サンプル収集をまとめて1件ぶんの enriched を作る（ファイル出力はしない）"""
+    print(f"[RUN] CID={cid}")
+    api = api_one(cid) or {}
+    probe = probe_one(cid)
+    raw_samples = samples_one(cid, api)
+    samples = filter_urls(raw_samples, cid)
+
+    enriched = dict(api)  # API優先
+
+    if (
+        probe.get("review_body")
+        or probe.get("review")
+        or probe.get("description")
+    ):
+        enriched["review_body"] = (
+            probe.get("review_body")
+            or probe.get("review")
+            or probe.get("description")
+        )
+
+    _sizes = probe.get("sizes") or probe.get("sizes_text")
+    if _sizes:
+        enriched["sizes"] = _sizes
+
+    if probe.get("name") and not enriched.get("performers"):
+        enriched["name"] = probe.get("name")
+
+    if probe.get("label") and not enriched.get("series"):
+        enriched["label"] = probe.get("label")
+
+    # samples_one は API の画像を大サイズに読み替えて確かめたものを返すので、そちらを優先
+    if samples or not enriched.get("sample_images"):
+        enriched["sample_images"] = samples
+    else:
+        enriched["sample_images"] = filter_urls(
+            enriched.get("sample_images") or [], cid
+        )
+    enriched.setdefault("cid", cid)
+    return enriched
+
+
+def commit_one(enriched: dict):
+    """JSONL / CSV / 履歴への書き込み（必ず CID の指定順に呼ぶ）"""
+    merge_and_append(enriched)
+    write_csv_row(enriched)
+    append_history(enriched["cid"])
+
+
+def report_ok(enriched: dict):
+    print(
+        "[OK] merged: {cid} images={img} review_len={rev}".format(
+            cid=enriched.get("cid"),
+            img=len(enriched.get("sample_images") or []),
+            rev=len(enriched.get("review_body") or ""),
+        )
+    )
+
+
+def run_concurrent(cids, workers: int):
+    """
+    --workers N 用。API / probe / サンプル収集を N 本並行で走らせ、
+    書き込みは CID の指定順に1件ずつ行う（前の CID が終わるまで後ろは書かない）。
+    画像ダウンロードは書き込み後に別プールへ回し、次の CID の収集と重ねる。
+    途中の CID で失敗したら、それより前の分だけ書いて直列版と同じく例外で止まる。
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collect") as pool, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as dl:
+        futures = [pool.submit(collect_one, cid) for cid in cids]
+        downloads = []
+        try:
+            for cid, fut in zip(cids, futures):
+                try:
+                    enriched = fut.result()
+                except Exception as e:
+                    load_history().record_failure(cid, e)
+                    raise
+                commit_one(enriched)
+                report_ok(enriched)
+                downloads.append(dl.submit(download_assets_for_post, enriched))
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+        for f in downloads:
+            f.result()
+
+
 def main():
     import argparse
 
@@ -435,6 +625,29 @@ def main():
         default=20,
         help="自動取得で処理する未処理CIDの最大件数（既定=20）",
     )
+    ap.add_argument(
+        "--full_scan",
+        action="store_true",
+        help="前回の位置を無視して新着一覧を読み直す（既定は差分だけ）",
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="並行して処理する CID 数（既定=1: 従来どおり1件ずつ）",
+    )
+    ap.add_argument(
+        "--host_concurrency",
+        type=int,
+        default=2,
+        help="同じホストへ同時に出すリクエストの上限（既定=2）",
+    )
+    ap.add_argument(
+        "--host_interval",
+        type=float,
+        default=0.25,
+        help="同じホストへのリクエスト開始の最小間隔・秒（既定=0.25）",
+    )
     args = ap.parse_args()
 
     cids = []
@@ -453,19 +666,43 @@ def main():
             if l.strip()
         ]
 
-    if args.auto:
+    done = ingest(
+        cids, auto=args.auto, auto_limit=args.auto_limit, full_scan=args.full_scan,
+        workers=args.workers, host_concurrency=args.host_concurrency,
+        host_interval=args.host_interval,
+    )
+    if not done:
+        sys.exit(0)
+
+
+def ingest(cids=(), auto=False, auto_limit=20, full_scan=False, workers=1,
+           host_concurrency=2, host_interval=0.25, keep_pool=False, mp_start=None):
+    """
+    CID を集めて JSONL / CSV / 履歴に書き、画像まで落とす。処理した CID のリストを返す
+    （対象が無ければ空）。main と常駐デーモン（ingest_daemon.py）から呼ぶ。
+    keep_pool=True ならブラウザプールを閉じずに次回へ持ち越す。
+    mp_start は派生画像のプロセスプールの起動方式（スレッドの動いているプロセスからは "forkserver"）。
+    """
+    global BUDGET, POOL_SIZE
+    BUDGET = HostBudget(host_concurrency, host_interval)
+    POOL_SIZE = max(1, workers)
+
+    cids = list(cids)
+    if auto:
         # 未処理 CID をまとめて複数件取得
-        auto_cids = find_unprocessed_latest_cids(max_new=args.auto_limit)
+        auto_cids = find_unprocessed_latest_cids(
+            max_new=auto_limit, full_scan=full_scan
+        )
         if not auto_cids:
             print("[INFO] 未処理の販売中新着が見つからなかったため終了")
-            sys.exit(0)
+            return []
         cids += auto_cids
 
     # ここまでで cids が空なら何もしない
     cids = list(dict.fromkeys(cids))
     if not cids:
         print("[INFO] 対象 CID が無いため終了")
-        sys.exit(0)
+        return []
 
     # この実行回での結果だけを入れるため、事前にクリア
     JSONL.parent.mkdir(parents=True, exist_ok=True)
@@ -474,71 +711,47 @@ def main():
     if CSV.exists():
         CSV.unlink()
 
-    for cid in cids:
-        print(f"[RUN] CID={cid}")
-        api = api_one(cid) or {}
-        probe = probe_one(cid)
-        raw_samples = samples_one(cid)
-        samples = filter_urls(raw_samples, cid)
-
-        enriched = dict(api)  # API優先
-
-        if (
-            probe.get("review_body")
-            or probe.get("review")
-            or probe.get("description")
-        ):
-            enriched["review_body"] = (
-                probe.get("review_body")
-                or probe.get("review")
-                or probe.get("description")
-            )
+    prefetch_api(cids)
 
-        _sizes = probe.get("sizes") or probe.get("sizes_text")
-        if _sizes:
-            enriched["sizes"] = _sizes
-
-        if probe.get("name") and not enriched.get("performers"):
-            enriched["name"] = probe.get("name")
-
-        if probe.get("label") and not enriched.get("series"):
-            enriched["label"] = probe.get("label")
-
-        if not enriched.get("sample_images"):
-            enriched["sample_images"] = samples
+    try:
+        if workers > 1:
+            run_concurrent(cids, workers)
         else:
-            enriched["sample_images"] = filter_urls(
-                enriched.get("sample_images") or [], cid
-            )
-
-        merge_and_append(enriched)
-        write_csv_row(enriched)
-        append_history(cid)
+            for cid in cids:
+                try:
+                    enriched = collect_one(cid)
+                except Exception as e:
+                    load_history().record_failure(cid, e)
+                    raise
+                commit_one(enriched)
+                download_assets_for_post(enriched)
+                report_ok(enriched)
+    finally:
+        if not keep_pool:
+            browser_pool.close_local_pool()
+
+    print("[API]", api_fetch_by_cid.default_client().summary())
+    if _downloader is not None:
+        print("[DOWNLOAD]", _downloader.summary(), "|", _downloader.store.summary())
+        # 取得した画像の縮小版・WebP/AVIF 版（テンプレートの srcset 用）
+        stats = image_variants.build(_downloader.store, cids=cids, start_method=mp_start)
+        print("[VARIANTS]", image_variants.format_stats(stats))
+    print("[DONE] JSONL:", JSONL, " CSV:", CSV, " HIST:", HIST)
+    return cids
 
-        download_assets_for_post(enriched)
 
-        print(
-            "[OK] merged: {cid} images={img} review_len={rev}".format(
-                cid=cid,
-                img=len(enriched.get("sample_images") or []),
-                rev=len(enriched.get("review_body") or ""),
-            )
-        )
-
-    print("[DONE] JSONL:", JSONL, " CSV:", CSV, " HIST:", HIST)
+def postrun_archive():
+    """scripts/postrun_archive.py（履歴・daily・exports への追記）をこのプロセス内で実行する"""
+    try:
+        scripts = str(BASE / "scripts")
+        if scripts not in sys.path:
+            sys.path.insert(0, scripts)
+        import postrun_archive as _archive
+        _archive.main()
+    except Exception as e:
+        print("[WARN] 履歴追記フックで例外:", e)
 
 
 if __name__ == "__main__":
     main()
-
-# ---- postrun archive hook (auto-added) ----
-try:
-    base_dir = os.path.dirname(__file__)
-    arch = os.path.join(base_dir, "scripts", "postrun_archive.py")
-    if os.path.exists(arch):
-        subprocess.run([sys.executable, arch], check=True)
-    else:
-        print("[WARN] postrun_archive.py が見つかりません")
-except Exception as e:
-    print("[WARN] 履歴追記フックで例外:", e)
-# ------------------------------------------
+    postrun_archive()
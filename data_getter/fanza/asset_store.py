@@ -0,0 +1,582 @@
+# -*- coding: utf-8 -*-
+"""
+画像のコンテンツアドレス保存（sha256 名の blob ＋ manifest）
+
+content/assets/{cid}_poster.jpg / {cid}_NN.jpg は今までどおり置くが、実体は
+content/asset_store/blobs/ab/<sha256>.jpg にひとつだけ持ち、旧名はそこへの
+ハードリンク（できなければシンボリックリンク → コピー）にする。
+同じ画像（「NOW PRINTING」のような共通のダミー画像など）は blob 1つにまとまる。
+
+manifest.sqlite3
+- blobs  : hash → size, width, height, ext, created_at
+- assets : (cid, slot) → hash, source_url, fetched_at, path
+- variants : (hash, fmt, width) → height, size, path（image_variants が作る派生画像）
+
+「取得済みか」は dest.exists() ではなく manifest と blob の有無で見る（exists()）。
+旧名のファイルだけあって manifest に無いものは、その場で取り込む。
+
+  python fanza/asset_store.py import            # 既存の content/assets を取り込む
+  python fanza/asset_store.py stats
+  python fanza/asset_store.py verify [--full] [--fix]
+  python fanza/asset_store.py gc [--dry-run]
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[2]
+ASSETS = REPO / "content" / "assets"
+ROOT = REPO / "content" / "asset_store"
+LINK_MODES = ("hard", "symlink", "copy")
+
+# {cid}_poster.jpg / {cid}_01.jpg
+NAME_RE = re.compile(r"^(?P<cid>.+)_(?P<slot>poster|\d{2,})(?P<ext>\.[A-Za-z0-9]+)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash       TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    width      INTEGER,
+    height     INTEGER,
+    ext        TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    cid        TEXT NOT NULL,
+    slot       TEXT NOT NULL,
+    hash       TEXT NOT NULL,
+    source_url TEXT,
+    fetched_at REAL NOT NULL,
+    path       TEXT NOT NULL,
+    PRIMARY KEY (cid, slot)
+);
+CREATE INDEX IF NOT EXISTS assets_hash ON assets (hash);
+CREATE TABLE IF NOT EXISTS variants (
+    hash   TEXT NOT NULL,
+    fmt    TEXT NOT NULL,
+    width  INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    size   INTEGER NOT NULL,
+    path   TEXT NOT NULL,
+    PRIMARY KEY (hash, fmt, width)
+);
+"""
+# 縮小版・WebP/AVIF 版（image_variants）の置き場所。/media/_v/… で配信される
+VARIANTS_DIRNAME = "_v"
+
+
+def parse_name(name):
+    """'abc123_poster.jpg' → ('abc123', 'poster')。形式外なら None"""
+    m = NAME_RE.match(name)
+    return (m.group("cid"), m.group("slot")) if m else None
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def image_info(path):
+    """(形式の拡張子, 幅, 高さ)。PIL なしでヘッダだけ読む。わからなければ (None, None, None)"""
+    with open(path, "rb") as f:
+        head = f.read(32)
+        try:
+            if head[:3] == b"\xff\xd8\xff":
+                f.seek(2)
+                while True:
+                    b = f.read(1)
+                    while b and b != b"\xff":
+                        b = f.read(1)
+                    while b == b"\xff":
+                        b = f.read(1)
+                    if not b:
+                        break
+                    marker = b[0]
+                    if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                        continue
+                    seg = struct.unpack(">H", f.read(2))[0]
+                    # SOF0..SOF15（DHT/JPG/DAC を除く）
+                    if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                        h, w = struct.unpack(">xHH", f.read(5))
+                        return ".jpg", w, h
+                    f.seek(seg - 2, 1)
+                return ".jpg", None, None
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                w, h = struct.unpack(">II", head[16:24])
+                return ".png", w, h
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                w, h = struct.unpack("<HH", head[6:10])
+                return ".gif", w, h
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                kind = head[12:16]
+                if kind == b"VP8 ":
+                    w, h = struct.unpack("<HH", head[26:30])
+                    return ".webp", w & 0x3FFF, h & 0x3FFF
+                if kind == b"VP8L":
+                    b = head[21:25]
+                    w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+                    h = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+                    return ".webp", w, h
+                if kind == b"VP8X":
+                    w = 1 + int.from_bytes(head[24:27], "little")
+                    h = 1 + int.from_bytes(head[27:30], "little")
+                    return ".webp", w, h
+                return ".webp", None, None
+        except (struct.error, IndexError):
+            pass
+    return None, None, None
+
+
+class AssetStore:
+    def __init__(self, root=ROOT, assets_dir=ASSETS, link="hard"):
+        if link not in LINK_MODES:
+            raise ValueError(f"link must be one of {LINK_MODES}")
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.assets_dir = Path(assets_dir)
+        self.link_mode = link
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.root / "manifest.sqlite3"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        cols = {r[1] for r in self._db.execute("PRAGMA table_info(blobs)")}
+        if "variants_at" not in cols:
+            # 派生画像を作り終えた時刻（作る幅が無い小さい画像も済みにするため）
+            self._db.execute("ALTER TABLE blobs ADD COLUMN variants_at REAL")
+        self.variants_dir = self.assets_dir / VARIANTS_DIRNAME
+        self._lock = threading.RLock()
+        self.counters = {"stored": 0, "deduped": 0, "imported": 0, "relinked": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def blob_path(self, h, ext):
+        return self.blobs_dir / h[:2] / f"{h}{ext}"
+
+    # --- リンク ---
+    def _link(self, blob, dest):
+        """dest を blob へのリンクに置き換える（一時名で作って os.replace）"""
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{threading.get_ident()}.lnk")
+        tmp.unlink(missing_ok=True)
+        modes = LINK_MODES[LINK_MODES.index(self.link_mode):]
+        for mode in modes:
+            try:
+                if mode == "hard":
+                    os.link(blob, tmp)
+                elif mode == "symlink":
+                    os.symlink(os.path.relpath(blob, dest.parent), tmp)
+                else:
+                    shutil.copyfile(blob, tmp)
+                break
+            except OSError:
+                tmp.unlink(missing_ok=True)
+                if mode == modes[-1]:
+                    raise
+        os.replace(tmp, dest)
+
+    def is_linked(self, dest, blob):
+        try:
+            return os.path.samefile(dest, blob)
+        except OSError:
+            return False
+
+    # --- 追加 ---
+    def add_file(self, src, dest, url=None, move=True):
+        """
+        src の中身を blob にして dest をそこへのリンクにし、manifest に記録する。
+        move=True なら src（ダウンロードの .part など）は blob に移すか、重複なら消す。
+        (hash, deduped) を返す。
+        """
+        src, dest = Path(src), Path(dest)
+        parsed = parse_name(dest.name)
+        if not parsed:
+            raise ValueError(f"unexpected asset name: {dest.name}")
+        cid, slot = parsed
+        h = file_hash(src)
+        fmt, w, hgt = image_info(src)
+        ext = fmt or dest.suffix.lower() or ".bin"
+        blob = self.blob_path(h, ext)
+        now = time.time()
+
+        with self._lock:
+            row = self._db.execute("SELECT ext FROM blobs WHERE hash = ?", (h,)).fetchone()
+            if row:
+                blob = self.blob_path(h, row[0])
+            deduped = blob.exists()
+            if deduped:
+                if move and not self.is_linked(src, blob):
+                    src.unlink(missing_ok=True)
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                if move:
+                    os.replace(src, blob)
+                else:
+                    shutil.copyfile(src, blob)
+                os.chmod(blob, 0o444)
+            if not self.is_linked(dest, blob):
+                self._link(blob, dest)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, size, width, height, ext, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (h, blob.stat().st_size, w, hgt, blob.suffix, now),
+                )
+                self._db.execute(
+                    "INSERT INTO assets (cid, slot, hash, source_url, fetched_at, path)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(cid, slot) DO UPDATE SET hash = excluded.hash,"
+                    " source_url = COALESCE(excluded.source_url, assets.source_url),"
+                    " fetched_at = excluded.fetched_at, path = excluded.path",
+                    (cid, slot, h, url, now, self._relpath(dest)),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self._count("deduped" if deduped else "stored")
+        return h, deduped
+
+    def accepts(self, dest):
+        """{cid}_{slot}.ext 形式の名前ならストアで扱う"""
+        return parse_name(Path(dest).name) is not None
+
+    def _relpath(self, dest):
+        try:
+            return str(Path(dest).resolve().relative_to(self.assets_dir.resolve()))
+        except ValueError:
+            return str(dest)
+
+    def _dest(self, path):
+        p = Path(path)
+        return p if p.is_absolute() else self.assets_dir / p
+
+    # --- 参照 ---
+    def lookup(self, cid, slot):
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT a.*, b.size, b.width, b.height, b.ext FROM assets a"
+                " JOIN blobs b ON b.hash = a.hash WHERE a.cid = ? AND a.slot = ?",
+                (cid, slot),
+            )
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else None
+
+    def exists(self, dest):
+        """
+        取得済みなら True。manifest にあって blob もあれば、旧名が消えていても張り直す。
+        旧名のファイルだけある（ストア導入前の取得分）なら取り込んでから True。
+        """
+        dest = Path(dest)
+        parsed = parse_name(dest.name)
+        if not parsed:
+            return dest.exists()
+        row = self.lookup(*parsed)
+        if row:
+            blob = self.blob_path(row["hash"], row["ext"])
+            if blob.exists():
+                if not self.is_linked(dest, blob):
+                    self._link(blob, dest)
+                    self._count("relinked")
+                return True
+        if dest.is_file():
+            self.add_file(dest, dest, move=False)
+            self._count("imported")
+            return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            q = self._db.execute
+            out = {
+                "assets": q("SELECT COUNT(*) FROM assets").fetchone()[0],
+                "cids": q("SELECT COUNT(DISTINCT cid) FROM assets").fetchone()[0],
+                "blobs": q("SELECT COUNT(*) FROM blobs").fetchone()[0],
+                "blob_bytes": q("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0],
+                "logical_bytes": q(
+                    "SELECT COALESCE(SUM(b.size), 0) FROM assets a JOIN blobs b ON b.hash = a.hash"
+                ).fetchone()[0],
+            }
+            # 多くの CID から共有されている blob（ダミー画像の候補）
+            out["shared"] = q(
+                "SELECT hash, COUNT(*) n FROM assets GROUP BY hash HAVING n > 1"
+                " ORDER BY n DESC LIMIT 5"
+            ).fetchall()
+        return out
+
+    # --- 保守 ---
+    def import_dir(self, assets_dir=None, workers=4):
+        """assets_dir の {cid}_{slot}.ext で manifest に無いものを取り込む"""
+        assets_dir = Path(assets_dir or self.assets_dir)
+        with self._lock:
+            known = {p for (p,) in self._db.execute("SELECT path FROM assets")}
+        todo = [
+            Path(e.path) for e in os.scandir(assets_dir)
+            if e.is_file() and parse_name(e.name) and e.name not in known
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for _ in ex.map(lambda p: self.add_file(p, p, move=False), todo):
+                pass
+        return len(todo)
+
+    def _iter_assets(self, batch=1000):
+        last = ("", "")
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT a.cid, a.slot, a.hash, a.path, b.size, b.ext FROM assets a"
+                    " LEFT JOIN blobs b ON b.hash = a.hash"
+                    " WHERE (a.cid, a.slot) > (?, ?) ORDER BY a.cid, a.slot LIMIT ?",
+                    (*last, batch),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][:2]
+
+    def verify(self, full=False, fix=False, workers=4):
+        """
+        blob の有無・サイズ（full なら sha256 も）と、旧名がその blob を指しているかを調べる。
+        fix=True なら旧名のリンクを張り直し、壊れた blob は消して manifest から外す（次回取り直し）。
+        """
+        report = {"checked": 0, "missing_blob": [], "corrupt_blob": [], "bad_link": []}
+
+        def check(row):
+            cid, slot, h, path, size, ext = row
+            blob = self.blob_path(h, ext or "")
+            if ext is None or not blob.exists():
+                return "missing_blob", row
+            if blob.stat().st_size != size or (full and file_hash(blob) != h):
+                return "corrupt_blob", row
+            if not self.is_linked(self._dest(path), blob):
+                return "bad_link", row
+            return None, row
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for problem, row in ex.map(check, self._iter_assets()):
+                report["checked"] += 1
+                if problem:
+                    report[problem].append(row)
+
+        if fix:
+            for cid, slot, h, path, size, ext in report["bad_link"]:
+                self._link(self.blob_path(h, ext), self._dest(path))
+                self._count("relinked")
+            corrupt = {r[2]: r[5] for r in report["corrupt_blob"]}
+            vpaths = []
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    for h in corrupt:
+                        self._db.execute("DELETE FROM blobs WHERE hash = ?", (h,))
+                        # 壊れた blob から作った派生画像も一緒に外す（gc は blobs から辿るので残ると消せない）
+                        vpaths += [p for (p,) in self._db.execute(
+                            "DELETE FROM variants WHERE hash = ? RETURNING path", (h,))]
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            for vp in vpaths:
+                (self.assets_dir / vp).unlink(missing_ok=True)
+            for h, ext in corrupt.items():
+                self.blob_path(h, ext).unlink(missing_ok=True)
+            for cid, slot, h, path, size, ext in report["missing_blob"] + report["corrupt_blob"]:
+                dest = self._dest(path)
+                # 旧名側に正しい中身が残っていれば（コピー運用など）そこから blob を戻す
+                if dest.is_file() and file_hash(dest) == h:
+                    self.add_file(dest, dest, move=False)
+                    continue
+                # ハードリンクなら旧名も同じく壊れているので消し、次回取り直させる
+                dest.unlink(missing_ok=True)
+                with self._lock:
+                    self._db.execute("DELETE FROM assets WHERE cid = ? AND slot = ?", (cid, slot))
+        return report
+
+    def gc(self, dry_run=False, grace=3600):
+        """
+        どの asset からも参照されない blob（と派生画像）と、manifest に無い blobs/・_v/ 内のファイルを消す。
+        書き込み途中と競合しないよう、grace 秒より新しいファイルは残す。
+        (消した件数, バイト数) を返す。
+        """
+        cutoff = time.time() - grace
+        with self._lock:
+            unref = self._db.execute(
+                "SELECT b.hash, b.ext FROM blobs b"
+                " WHERE NOT EXISTS (SELECT 1 FROM assets a WHERE a.hash = b.hash)"
+            ).fetchall()
+            known = {f"{h}{ext}" for (h, ext) in self._db.execute("SELECT hash, ext FROM blobs")}
+            known_v = {p for (p,) in self._db.execute("SELECT path FROM variants")}
+        victims = [(h, self.blob_path(h, ext)) for h, ext in unref]
+        for base, names, rel in ((self.blobs_dir, known, False),
+                                 (self.variants_dir, known_v, True)):
+            if not base.is_dir():
+                continue
+            for sub in os.scandir(base):
+                if not sub.is_dir():
+                    continue
+                for e in os.scandir(sub.path):
+                    name = self._relpath(e.path) if rel else e.name
+                    if name not in names and e.stat().st_mtime < cutoff:
+                        victims.append((None, Path(e.path)))
+
+        n = size = 0
+        for h, path in victims:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                st = None
+            if not dry_run and h is not None:
+                with self._lock:
+                    gone = self._db.execute(
+                        "DELETE FROM blobs WHERE hash = ?"
+                        " AND NOT EXISTS (SELECT 1 FROM assets WHERE hash = ?)",
+                        (h, h),
+                    ).rowcount
+                    # 数えてから消すまでの間に参照されたものは残す
+                    vpaths = [p for (p,) in self._db.execute(
+                        "DELETE FROM variants WHERE hash = ? RETURNING path", (h,))] if gone else None
+                if vpaths is None:
+                    continue
+                for vp in vpaths:
+                    (self.assets_dir / vp).unlink(missing_ok=True)
+            n += 1
+            size += st.st_size if st else 0
+            if not dry_run:
+                path.unlink(missing_ok=True)
+        return n, size
+
+    # --- 派生画像 ---
+    def variant_path(self, h, fmt, width):
+        return self.variants_dir / h[:2] / f"{h}_{width}.{fmt}"
+
+    def pending_variants(self, cids=None, force=False):
+        """
+        派生画像がまだの blob を [(hash, blob_path, 原寸の幅, kind)] で返す。
+        kind はポスターとして使われていれば "poster"、それ以外は "sample"。
+        """
+        sql = ("SELECT b.hash, b.ext, b.width, MAX(a.slot = 'poster') FROM blobs b"
+               " JOIN assets a ON a.hash = b.hash")
+        where, params = [], []
+        if not force:
+            where.append("b.variants_at IS NULL")
+        if cids is not None:
+            cids = list(dict.fromkeys(cids))
+            if not cids:
+                return []
+            where.append(f"a.cid IN ({','.join('?' * len(cids))})")
+            params += cids
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY b.hash"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [(h, self.blob_path(h, ext), w, "poster" if is_poster else "sample")
+                for h, ext, w, is_poster in rows]
+
+    def record_variants(self, h, rows):
+        """rows: [(fmt, width, height, size, path)]。path は assets_dir からの相対"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM variants WHERE hash = ?", (h,))
+                self._db.executemany(
+                    "INSERT INTO variants (hash, fmt, width, height, size, path)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(h, *r) for r in rows],
+                )
+                self._db.execute("UPDATE blobs SET variants_at = ? WHERE hash = ?", (time.time(), h))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def variants_of(self, h):
+        with self._lock:
+            return self._db.execute(
+                "SELECT fmt, width, height, size, path FROM variants WHERE hash = ?"
+                " ORDER BY fmt, width", (h,)
+            ).fetchall()
+
+    def forget(self, cid):
+        """CID の manifest 行を消す（blob は gc で消える）"""
+        with self._lock:
+            return self._db.execute("DELETE FROM assets WHERE cid = ?", (cid,)).rowcount
+
+    def summary(self):
+        with self._lock:
+            return " ".join(f"{k}={v}" for k, v in self.counters.items())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=str(ROOT), help="blob と manifest の置き場所")
+    ap.add_argument("--assets", default=str(ASSETS), help="旧名のファイルを置くディレクトリ")
+    ap.add_argument("--link", choices=LINK_MODES, default="hard")
+    ap.add_argument("--workers", type=int, default=4)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("import", help="assets ディレクトリの既存ファイルを取り込む")
+    sub.add_parser("stats", help="件数・容量・共有されている blob")
+    v = sub.add_parser("verify", help="blob とリンクの整合性を調べる")
+    v.add_argument("--full", action="store_true", help="sha256 も計算し直す")
+    v.add_argument("--fix", action="store_true", help="リンクを張り直し、壊れた分は manifest から外す")
+    g = sub.add_parser("gc", help="参照されない blob を消す")
+    g.add_argument("--dry-run", action="store_true")
+    g.add_argument("--grace", type=int, default=3600, help="この秒数より新しいファイルは残す")
+    s = sub.add_parser("show", help="CID の manifest を表示")
+    s.add_argument("cid")
+    f = sub.add_parser("forget", help="CID を manifest から消す")
+    f.add_argument("cids", nargs="+")
+    args = ap.parse_args()
+
+    store = AssetStore(args.root, args.assets, link=args.link)
+    if args.cmd == "import":
+        print(store.import_dir(workers=args.workers), "件取り込み", store.summary())
+    elif args.cmd == "stats":
+        st = store.stats()
+        saved = st["logical_bytes"] - st["blob_bytes"]
+        print({k: v for k, v in st.items() if k != "shared"}, f"dedup={saved} bytes")
+        for h, n in st["shared"]:
+            print(f"  {h[:16]}… × {n}")
+    elif args.cmd == "verify":
+        rep = store.verify(full=args.full, fix=args.fix, workers=args.workers)
+        print(f"checked={rep['checked']} missing_blob={len(rep['missing_blob'])}"
+              f" corrupt_blob={len(rep['corrupt_blob'])} bad_link={len(rep['bad_link'])}")
+        for key in ("missing_blob", "corrupt_blob", "bad_link"):
+            for cid, slot, *_ in rep[key][:20]:
+                print(f"  {key}: {cid} {slot}")
+    elif args.cmd == "gc":
+        n, size = store.gc(dry_run=args.dry_run, grace=args.grace)
+        print(f"{'削除対象' if args.dry_run else '削除'}: {n} 件 / {size} bytes")
+    elif args.cmd == "show":
+        with store._lock:
+            rows = store._db.execute(
+                "SELECT slot FROM assets WHERE cid = ? ORDER BY slot", (args.cid,)
+            ).fetchall()
+        for (slot,) in rows:
+            print(store.lookup(args.cid, slot))
+    elif args.cmd == "forget":
+        print(sum(store.forget(c) for c in args.cids), "件削除")
+
+
+if __name__ == "__main__":
+    main()
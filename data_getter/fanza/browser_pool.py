@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Playwright のブラウザ／コンテキストを使い回すプール
+
+videoc_probe.py / fetch_exact_samples.py が CID ごとに Chromium を起動し、
+トップページ訪問と年齢認証をやり直していたのをまとめる。
+
+- ワーカー（スレッド）ごとに Chromium + コンテキスト + ページを1つずつ持ち、
+  ジョブ fn(page, ...) をそのページで実行する（sync API のオブジェクトは
+  作ったスレッドからしか触れないため、並行数 = ワーカー数）
+- 年齢認証・Cookie は最初に通したコンテキストの storage_state をプールで共有し、
+  以降に作るコンテキストはそれを引き継ぐ（トップページ訪問はコンテキストごとに1回）
+- ページはジョブごとに about:blank へ戻して再利用。max_jobs 件ごと、または
+  JS ヒープが max_context_mb を超えたらコンテキストを作り直す
+
+ライブラリとして:
+  with BrowserPool(size=3) as pool:
+      out = pool.run(videoc_probe.probe_page, url)
+
+常駐デーモンとして（blog_videoc_today / videoc_probe / fetch_exact_samples が自動で使う）:
+  python fanza/browser_pool.py serve --port 8765 --size 3
+  curl -s localhost:8765/health
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent          # data_getter/fanza
+DATA_GETTER = HERE.parent                       # data_getter
+
+UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0 Safari/537.36"
+HOME_URL = "https://video.dmm.co.jp/"
+LAUNCH_ARGS = ["--no-sandbox", "--disable-dev-shm-usage", "--lang=ja-JP"]
+AGE_COOKIES = [
+    {"name": "ckcy", "value": "1", "domain": ".dmm.co.jp", "path": "/"},
+    {"name": "age_check_done", "value": "1", "domain": ".dmm.co.jp", "path": "/"},
+]
+# 既存の保存済みログイン状態（あれば初期状態に使う。上書きはしない）
+STORAGE_STATE = DATA_GETTER / "dmm_storage_state.json"
+
+DAEMON_URL = os.environ.get("BROWSER_POOL_URL", "http://127.0.0.1:8765")
+
+_STOP = object()
+
+
+def pass_age_check(page):
+    """年齢認証ページなら同意して戻る。通したら True"""
+    try:
+        h1 = (page.locator("h1").first.inner_text(timeout=1500) or "")
+    except Exception:
+        h1 = ""
+    if "年齢認証" not in h1:
+        return False
+    for q in ["同意", "はい", "I Agree"]:
+        try:
+            page.get_by_role("link", name=re.compile(q)).first.click(timeout=2000)
+            page.wait_for_load_state("networkidle", timeout=10000)
+            return True
+        except Exception:
+            pass
+        try:
+            btn = page.locator(f"text={q}").first
+            if btn.count():
+                btn.click(timeout=2000)
+                page.wait_for_load_state("networkidle", timeout=10000)
+                return True
+        except Exception:
+            pass
+    return False
+
+
+def _initial_state():
+    """初期 storage_state（dmm_storage_state.json + cookies.json）"""
+    state = {"cookies": [], "origins": []}
+    try:
+        if STORAGE_STATE.exists():
+            state = json.loads(STORAGE_STATE.read_text(encoding="utf-8"))
+    except Exception:
+        pass
+    try:
+        if os.path.exists("cookies.json"):
+            state.setdefault("cookies", []).extend(
+                json.load(open("cookies.json", "r", encoding="utf-8"))
+            )
+    except Exception:
+        pass
+    return state
+
+
+class _Worker(threading.Thread):
+    def __init__(self, pool, n):
+        super().__init__(name=f"browser-pool-{n}", daemon=True)
+        self.pool = pool
+        self.pw = None
+        self.browser = None
+        self.ctx = None
+        self.page = None
+        self.jobs = 0
+
+    # --- ブラウザ／コンテキストの用意 ---
+    def _ensure_browser(self):
+        if self.browser is not None and self.browser.is_connected():
+            return
+        from playwright.sync_api import sync_playwright
+
+        if self.pw is None:
+            self.pw = sync_playwright().start()
+        self.browser = self.pw.chromium.launch(headless=self.pool.headless, args=LAUNCH_ARGS)
+        self.ctx = self.page = None
+        self.pool._count("browsers_launched")
+
+    def _ensure_page(self):
+        self._ensure_browser()
+        if self.ctx is not None and self.page is not None and not self.page.is_closed():
+            return self.page
+        self._close_context()
+        state, fresh = self.pool._shared_state()
+        self.ctx = self.browser.new_context(
+            user_agent=UA,
+            locale="ja-JP",
+            extra_http_headers={"Referer": HOME_URL},
+            storage_state=state,
+        )
+        try:
+            self.ctx.add_cookies(AGE_COOKIES)
+        except Exception:
+            pass
+        self.page = self.ctx.new_page()
+        self.jobs = 0
+        self.pool._count("contexts_created")
+        if fresh:
+            # プールで最初のコンテキストだけトップ訪問と年齢認証を行い、状態を共有する
+            try:
+                self.page.goto(HOME_URL, wait_until="domcontentloaded", timeout=20000)
+                pass_age_check(self.page)
+            except Exception:
+                pass
+            try:
+                self.pool._set_state(self.ctx.storage_state())
+            except Exception:
+                pass
+        return self.page
+
+    def _close_context(self):
+        try:
+            if self.ctx is not None:
+                self.ctx.close()
+        except Exception:
+            pass
+        self.ctx = self.page = None
+
+    def _heap_mb(self):
+        try:
+            used = self.page.evaluate(
+                "() => (performance.memory && performance.memory.usedJSHeapSize) || 0"
+            )
+            return (used or 0) / (1024 * 1024)
+        except Exception:
+            return 0.0
+
+    def _after_job(self, failed):
+        self.jobs += 1
+        if failed or self.page is None or self.page.is_closed():
+            self._close_context()
+            return
+        recycle = self.jobs >= self.pool.max_jobs or self._heap_mb() > self.pool.max_context_mb
+        if not recycle:
+            try:
+                self.page.goto("about:blank", timeout=5000)
+            except Exception:
+                recycle = True
+        if recycle:
+            # 次のコンテキストへ最新の Cookie を引き継いでから閉じる
+            try:
+                self.pool._set_state(self.ctx.storage_state())
+            except Exception:
+                pass
+            self._close_context()
+            self.pool._count("contexts_recycled")
+
+    # --- ループ ---
+    def run(self):
+        while True:
+            item = self.pool._queue.get()
+            if item is _STOP:
+                break
+            fut, fn, args, kwargs = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            failed = False
+            try:
+                page = self._ensure_page()
+                fut.set_result(fn(page, *args, **kwargs))
+            except BaseException as e:
+                failed = True
+                fut.set_exception(e)
+            finally:
+                self.pool._count("jobs")
+                if failed:
+                    self.pool._count("errors")
+                try:
+                    self._after_job(failed)
+                except Exception:
+                    self._close_context()
+        self._close_context()
+        try:
+            if self.browser is not None:
+                self.browser.close()
+        except Exception:
+            pass
+        try:
+            if self.pw is not None:
+                self.pw.stop()
+        except Exception:
+            pass
+
+
+class BrowserPool:
+    def __init__(self, size=2, headless=True, max_jobs=50, max_context_mb=300):
+        self.size = max(1, int(size))
+        self.headless = headless
+        self.max_jobs = max(1, int(max_jobs))
+        self.max_context_mb = float(max_context_mb)
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._state = None
+        self._stats = {
+            "jobs": 0, "errors": 0, "browsers_launched": 0,
+            "contexts_created": 0, "contexts_recycled": 0,
+        }
+
+    def _shared_state(self):
+        """(storage_state, まだ年齢認証を通していないか)"""
+        with self._lock:
+            if self._state is None:
+                return _initial_state(), True
+            return self._state, False
+
+    def _set_state(self, state):
+        with self._lock:
+            self._state = state
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def start(self):
+        if not self._workers:
+            for n in range(self.size):
+                w = _Worker(self, n)
+                w.start()
+                self._workers.append(w)
+        return self
+
+    def submit(self, fn, *args, **kwargs):
+        """fn(page, *args, **kwargs) をどれかのワーカーで実行する Future"""
+        self.start()
+        fut = Future()
+        self._queue.put((fut, fn, args, kwargs))
+        return fut
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def map(self, fn, items, timeout=None):
+        futs = [self.submit(fn, x) for x in items]
+        return [f.result(timeout) for f in futs]
+
+    def cookies(self):
+        with self._lock:
+            return list((self._state or {}).get("cookies") or [])
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s.update(size=self.size, queued=self._queue.qsize())
+        return s
+
+    def close(self):
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for w in self._workers:
+            w.join(timeout=30)
+        self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------- デーモン ----------------
+
+_job_table = None
+
+
+def _jobs():
+    """デーモンで受け付けるジョブ名 → (ページ関数, 引数を取り出す関数)。初回だけ組み立てる"""
+    global _job_table
+    if _job_table is None:
+        for p in (str(HERE), str(DATA_GETTER / "scripts")):
+            if p not in sys.path:
+                sys.path.insert(0, p)
+        import videoc_probe
+        import fetch_exact_samples
+
+        _job_table = {
+            "probe": (videoc_probe.probe_page, lambda d: (d["url"], bool(d.get("samples", True)))),
+            "samples": (
+                fetch_exact_samples.collect_samples,
+                lambda d: (d["cid"], int(d.get("timeout") or 120000)),
+            ),
+        }
+    return _job_table
+
+
+def serve(host="127.0.0.1", port=8765, **pool_kwargs):
+    pool = BrowserPool(**pool_kwargs).start()
+    jobs = _jobs()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body):
+            raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self._send(200, {"ok": True, **pool.stats()})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            name = self.path.strip("/")
+            if name not in jobs:
+                return self._send(404, {"error": f"unknown job: {name}"})
+            try:
+                n = int(self.headers.get("Content-Length") or 0)
+                data = json.loads(self.rfile.read(n) or b"{}")
+                fn, to_args = jobs[name]
+                self._send(200, pool.run(fn, *to_args(data)))
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, fmt, *args):
+            print("[POOL]", fmt % args, flush=True)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"[POOL] listening on http://{host}:{port} size={pool.size}", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        pool.close()
+
+
+def daemon_call(job, payload, timeout=300):
+    """
+    常駐デーモンにジョブを投げる。デーモンが起動していなければ（接続を拒否されたら）None
+    （呼び出し側はプロセス内のプールにフォールバックする）。タイムアウトなどは例外にする。
+    """
+    req = urllib.request.Request(
+        f"{DAEMON_URL.rstrip('/')}/{job}",
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return json.loads(r.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        try:
+            msg = json.loads(e.read().decode("utf-8")).get("error")
+        except Exception:
+            msg = str(e)
+        raise RuntimeError(f"browser pool {job} failed: {msg}") from e
+    except urllib.error.URLError as e:
+        # 待ち受けていないときだけフォールバック。タイムアウト（デーモンが処理中）で
+        # プロセス内プールに回すと同じジョブを二重に走らせるので、そのまま上げる
+        if isinstance(e.reason, (ConnectionRefusedError, FileNotFoundError)):
+            return None
+        raise RuntimeError(f"browser pool {job} failed: {e.reason}") from e
+
+
+_local_pool = None
+_local_lock = threading.Lock()
+
+
+def local_pool(size=1, **kwargs):
+    """プロセス内で共有するプール（初回呼び出しの size で作る）"""
+    global _local_pool
+    with _local_lock:
+        if _local_pool is None:
+            _local_pool = BrowserPool(size=size, **kwargs).start()
+        return _local_pool
+
+
+def call(job, payload, pool_size=1):
+    """デーモンがあればデーモン、無ければプロセス内プールでジョブを実行する"""
+    out = daemon_call(job, payload)
+    if out is not None:
+        return out
+    fn, to_args = _jobs()[job]
+    return local_pool(pool_size).run(fn, *to_args(payload))
+
+
+def close_local_pool():
+    global _local_pool
+    with _local_lock:
+        if _local_pool is not None:
+            _local_pool.close()
+            _local_pool = None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="常駐デーモンとして起動")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    s.add_argument("--size", type=int, default=2, help="並行ページ数（ワーカー数）")
+    s.add_argument("--max-jobs", type=int, default=50, help="コンテキストを作り直すまでのジョブ数")
+    s.add_argument("--max-context-mb", type=float, default=300, help="コンテキストの JS ヒープ上限(MB)")
+    s.add_argument("--headful", action="store_true")
+    sub.add_parser("health", help="デーモンの状態を表示")
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        serve(
+            args.host, args.port,
+            size=args.size, headless=not args.headful,
+            max_jobs=args.max_jobs, max_context_mb=args.max_context_mb,
+        )
+    elif args.cmd == "health":
+        try:
+            with urllib.request.urlopen(f"{DAEMON_URL.rstrip('/')}/health", timeout=5) as r:
+                print(r.read().decode("utf-8"))
+        except Exception as e:
+            print(f"[POOL] not running: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+新着 CID の差分検出（high-water mark）
+
+毎回「3 variant × 5 ページ」を読んでから履歴で弾いていたのをやめ、
+variant ごとに前回見た一番新しい位置（date と、その date の CID 一覧）を
+out/discovery_state.json に覚えておく。次回は date 順の一覧をその位置を
+越えるところまでしか読まない（ふつうは1ページ＝API 1回で止まる）。
+
+- 前回見つけたが処理しきれなかった CID（--auto_limit で切られた分）は
+  pending として残し、次回の候補に混ぜる（処理済みは履歴で落ちる）
+- 先頭の variant が使えたら残りの variant は読まない（失敗・0件のときだけ次へ）
+- full=True（--full_scan）なら位置を無視して従来どおり読む（位置は更新する）
+"""
+import json
+import os
+import re
+from pathlib import Path
+
+STATE_PATH = Path(__file__).resolve().parent.parent / "out" / "discovery_state.json"
+# pending に残しておく最大件数
+MAX_PENDING = 500
+
+
+def variant_key(v):
+    return "/".join(str(v.get(k) or "-") for k in ("site", "service", "floor"))
+
+
+def item_cid(it):
+    cid = it.get("cid")
+    if cid:
+        return cid
+    u = it.get("URL") or it.get("url") or ""
+    m = re.search(r"[?&]id=([a-z0-9_]+)", u, re.I)
+    return m.group(1) if m else None
+
+
+def load_state(path=STATE_PATH):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception:
+        return {"marks": {}, "pending": []}
+
+
+def save_state(state, path=STATE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _is_known(mark, date, cid):
+    if not mark:
+        return False
+    return date < mark["date"] or (date == mark["date"] and cid in mark["cids"])
+
+
+def _next_mark(mark, newest_date, newest_cids):
+    if newest_date is None:
+        return mark
+    if not mark or newest_date > mark["date"]:
+        return {"date": newest_date, "cids": newest_cids}
+    if newest_date == mark["date"]:
+        return {"date": newest_date, "cids": list(dict.fromkeys(mark["cids"] + newest_cids))}
+    return mark
+
+
+def discover(fetch_page, variants, history=(), limit=60, max_pages=5, hits=50,
+             full=False, accept=None, state_path=STATE_PATH):
+    """
+    fetch_page(variant, offset, hits) -> items（date 降順）
+    accept(variant, item) -> bool で対象を絞れる。
+    history は `in` が使えれば set でも ProcessedStore でもよい。
+    (履歴に無い CID の新しい順リスト, stats) を返す。
+    stats["variant"] が None ならどの variant も読めなかった（呼び出し側のフォールバック用）。
+    """
+    state = load_state(state_path)
+    marks = state.setdefault("marks", {})
+    stats = {"mode": "full" if full else "incremental", "api_calls": 0, "variant": None,
+             "candidates": 0, "new": 0, "pending": 0}
+
+    found = []
+    for v in variants:
+        key = variant_key(v)
+        mark = None if full else marks.get(key)
+        newest_date, newest_cids = None, []
+        got_items = False
+        seen = []
+        for page in range(max_pages):
+            try:
+                items = fetch_page(v, page * hits + 1, hits)
+            except Exception:
+                break
+            finally:
+                stats["api_calls"] += 1
+            if not items:
+                break
+            got_items = True
+            crossed = False
+            for it in items:
+                cid = item_cid(it)
+                if not cid or (accept and not accept(v, it)):
+                    continue
+                date = it.get("date") or ""
+                if newest_date is None or date > newest_date:
+                    newest_date, newest_cids = date, [cid]
+                elif date == newest_date and cid not in newest_cids:
+                    newest_cids.append(cid)
+                if _is_known(mark, date, cid):
+                    crossed = True
+                    continue
+                if cid not in seen:
+                    seen.append(cid)
+            # 前回の位置を越えた、または（位置が無いとき）必要数に届いたら止める
+            if crossed or (mark is None and len(seen) >= limit):
+                break
+        if not got_items:
+            continue
+        marks[key] = _next_mark(marks.get(key), newest_date, newest_cids)
+        stats["variant"] = key
+        found = seen
+        break
+
+    new = [c for c in found if c not in history]
+    pending = [c for c in state.get("pending") or [] if c not in history]
+    out = list(dict.fromkeys(new + pending))
+    state["pending"] = out[:MAX_PENDING]
+    if stats["variant"] is not None:
+        save_state(state, state_path)
+
+    # 履歴で絞る前の件数（前回の位置より新しいもの）
+    stats["candidates"] = len(found)
+    stats["new"] = len(new)
+    stats["pending"] = len(out) - len(new)
+    return out, stats
+
+
+def format_stats(stats):
+    return " ".join(f"{k}={v}" for k, v in stats.items())
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+画像ダウンローダ（ポスター・サンプル画像）
+
+- ホストごとに keep-alive 接続をプールして使い回す（http.client）
+- ホストごとの同時接続数を制限（host_slot を渡せば呼び出し側の予算に従う）
+- {dest}.part へ逐次書き込み → 検証 → os.replace で置き換え（途中で落ちても壊れたファイルを残さない）
+- .part が残っていれば Range で続きから取る
+- Content-Type（image/*）と Content-Length を検証
+- 接続エラー・5xx・429・途中切れはバックオフしつつ再試行。404 などは即失敗
+- fetch_many() で複数 CID ぶんのジョブをまとめて並行処理
+- exists_many() で候補 URL を同じ接続プールから並行に HEAD して存在確認
+- store（asset_store.AssetStore）を渡すと、取得済みの判定と保存を blob ストア経由にする
+
+  dl = Downloader()
+  results = dl.fetch_many(jobs_for_post(enriched, ASSETS))
+"""
+import http.client
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse as up
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/58.0.3029.110 Safari/537.36"
+    ),
+    "Referer": "https://www.dmm.co.jp/",
+}
+CHUNK = 64 * 1024
+MAX_REDIRECTS = 5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    def __init__(self, msg, retry=False):
+        super().__init__(msg)
+        self.retry = retry
+
+
+class Result:
+    __slots__ = ("url", "dest", "ok", "skipped", "resumed", "bytes", "error", "kind")
+
+    def __init__(self, url, dest, kind=""):
+        self.url, self.dest, self.kind = url, Path(dest), kind
+        self.ok = self.skipped = self.resumed = False
+        self.bytes = 0
+        self.error = None
+
+    def __repr__(self):
+        state = "skip" if self.skipped else ("ok" if self.ok else f"fail:{self.error}")
+        return f"<Result {self.dest.name} {state}>"
+
+
+def ext_of(url, default=".jpg"):
+    return os.path.splitext(up.urlsplit(url).path)[1] or default
+
+
+def jobs_for_post(enriched, assets_dir, poster_candidates=None):
+    """
+    1記事ぶんのジョブ [(urls, dest, kind), ...]。ファイル名は従来どおり
+    {cid}_poster{ext} / {cid}_{NN}{ext}。urls は先頭から順に試す候補。
+    """
+    cid = enriched.get("cid")
+    if not cid:
+        return []
+    assets_dir = Path(assets_dir)
+    jobs = []
+    poster_url = enriched.get("poster_url")
+    if poster_url:
+        urls = poster_candidates(poster_url) if poster_candidates else [poster_url]
+        jobs.append((urls, assets_dir / f"{cid}_poster{ext_of(poster_url)}", "poster"))
+    for j, u in enumerate(enriched.get("sample_images") or []):
+        if u:
+            jobs.append(([u], assets_dir / f"{cid}_{j + 1:02d}{ext_of(u)}", "sample"))
+    return jobs
+
+
+class Downloader:
+    def __init__(self, per_host=4, max_workers=8, timeout=20, retries=3, backoff=1.0,
+                 headers=None, accept_types=("image/",), host_slot=None, store=None):
+        self.per_host = per_host
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = dict(headers or HEADERS)
+        self.accept_types = accept_types
+        self._host_slot = host_slot
+        self.store = store
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._sems = {}
+        self.counters = {"ok": 0, "skipped": 0, "failed": 0, "resumed": 0,
+                         "retries": 0, "bytes": 0, "connections": 0}
+
+    # --- 接続プール ---
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _pool(self, key):
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = queue.LifoQueue()
+            return self._pools[key]
+
+    @contextmanager
+    def _slot(self, host):
+        if self._host_slot is not None:
+            with self._host_slot(host):
+                yield
+            return
+        with self._lock:
+            sem = self._sems.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with sem:
+            yield
+
+    def _acquire(self, scheme, host):
+        try:
+            return self._pool((scheme, host)).get_nowait(), True
+        except queue.Empty:
+            self._count("connections")
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            return cls(host, timeout=self.timeout), False
+
+    def _release(self, scheme, host, conn):
+        pool = self._pool((scheme, host))
+        if pool.qsize() < self.per_host:
+            pool.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def _send(self, scheme, host, path, headers, method="GET"):
+        while True:
+            conn, reused = self._acquire(scheme, host)
+            try:
+                conn.request(method, path, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if not reused:
+                    raise DownloadError(f"{type(e).__name__}: {e}", retry=True)
+                # サーバ側で切れていた keep-alive 接続なら張り直して再送
+
+    # --- 1 URL ---
+    def _get_once(self, url, part):
+        """url を part へ取得（Range で続きから）。最終的な URL を返す"""
+        for _ in range(MAX_REDIRECTS + 1):
+            sp = up.urlsplit(url)
+            path = (sp.path or "/") + (f"?{sp.query}" if sp.query else "")
+            have = part.stat().st_size if part.exists() else 0
+            headers = dict(self.headers)
+            if have:
+                headers["Range"] = f"bytes={have}-"
+            with self._slot(sp.netloc):
+                conn, resp = self._send(sp.scheme, sp.netloc, path, headers)
+                try:
+                    location = self._handle(resp, url, part, have)
+                except BaseException:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._release(sp.scheme, sp.netloc, conn)
+            if location is None:
+                return url
+            url = up.urljoin(url, location)
+        raise DownloadError("too many redirects")
+
+    def _handle(self, resp, url, part, have):
+        status = resp.status
+        if status in (301, 302, 303, 307, 308):
+            resp.read()
+            return resp.getheader("Location") or ""
+        if status == 416 and have:
+            # .part がすでに全体（または壊れている）→ 捨てて取り直し
+            resp.read()
+            part.unlink(missing_ok=True)
+            raise DownloadError("range not satisfiable", retry=True)
+        if status >= 400:
+            resp.read()
+            raise DownloadError(f"HTTP {status}", retry=status in RETRY_STATUS)
+
+        ctype = (resp.getheader("Content-Type") or "").lower()
+        if self.accept_types and not ctype.startswith(tuple(self.accept_types)):
+            resp.read()
+            raise DownloadError(f"unexpected content-type: {ctype or '-'}")
+
+        if status == 206:
+            mode, start = "ab", have
+            total = (resp.getheader("Content-Range") or "").rpartition("/")[2]
+            expected = int(total) if total.isdigit() else None
+        else:
+            mode, start = "wb", 0
+            length = resp.getheader("Content-Length")
+            expected = int(length) if length and length.isdigit() else None
+
+        written = start
+        try:
+            with open(part, mode) as f:
+                while True:
+                    chunk = resp.read(CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        except (http.client.HTTPException, OSError) as e:
+            # 途中まで書いた .part は残して次の試行で Range 再開
+            raise DownloadError(f"{type(e).__name__}: {e}", retry=True)
+        if expected is not None and written != expected:
+            raise DownloadError(f"incomplete: {written}/{expected}", retry=True)
+        if written == 0:
+            part.unlink(missing_ok=True)
+            raise DownloadError("empty body")
+        if status == 206:
+            self._count("resumed")
+        self._count("bytes", written - start)
+        return None
+
+    # --- 存在確認 ---
+    def head(self, url):
+        """
+        url が画像として取れるか（HEAD。リダイレクトは辿る）。
+        404 や「now printing」画像へのリダイレクト、画像以外の Content-Type は False
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            sp = up.urlsplit(url)
+            path = (sp.path or "/") + (f"?{sp.query}" if sp.query else "")
+            try:
+                with self._slot(sp.netloc):
+                    conn, resp = self._send(sp.scheme, sp.netloc, path, self.headers, method="HEAD")
+                    resp.read()
+                    if resp.will_close:
+                        conn.close()
+                    else:
+                        self._release(sp.scheme, sp.netloc, conn)
+            except DownloadError:
+                return False
+            if resp.status in (301, 302, 303, 307, 308):
+                url = up.urljoin(url, resp.getheader("Location") or "")
+                if "now_printing" in url:
+                    return False
+                continue
+            if resp.status != 200:
+                return False
+            ctype = (resp.getheader("Content-Type") or "").lower()
+            return not self.accept_types or ctype.startswith(tuple(self.accept_types))
+        return False
+
+    def exists_many(self, urls):
+        """{url: bool}。HEAD を max_workers 本まで並行に投げる"""
+        urls = list(dict.fromkeys(u for u in urls if u))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as ex:
+            return dict(zip(urls, ex.map(self.head, urls)))
+
+    def fetch(self, urls, dest, kind="", overwrite=False):
+        """候補 URL を順に試して dest へ保存する"""
+        if isinstance(urls, str):
+            urls = [urls]
+        dest = Path(dest)
+        res = Result(urls[0] if urls else "", dest, kind)
+        exists = self.store.exists(dest) if self.store else dest.exists()
+        if exists and not overwrite:
+            res.skipped = True
+            self._count("skipped")
+            return res
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        part = dest.with_name(dest.name + ".part")
+
+        for url in urls:
+            res.url = url
+            for attempt in range(self.retries + 1):
+                try:
+                    had_part = part.exists()
+                    self._get_once(url, part)
+                    res.bytes = part.stat().st_size
+                    if self.store and self.store.accepts(dest):
+                        self.store.add_file(part, dest, url)
+                    else:
+                        os.replace(part, dest)
+                    res.ok, res.resumed, res.error = True, had_part, None
+                    self._count("ok")
+                    return res
+                except DownloadError as e:
+                    res.error = str(e)
+                    if not e.retry or attempt >= self.retries:
+                        break
+                    self._count("retries")
+                    time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+            # 次の候補 URL へ移るときは途中ファイルを捨てる
+            part.unlink(missing_ok=True)
+        self._count("failed")
+        return res
+
+    def fetch_many(self, jobs, on_done=None):
+        """
+        jobs: [(urls, dest, kind), ...]（複数 CID ぶんをまとめて渡してよい）
+        入力順の Result リストを返す。on_done(result) は完了ごとに呼ぶ。
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+
+        def run(job):
+            r = self.fetch(*job)
+            if on_done:
+                on_done(r)
+            return r
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as ex:
+            return list(ex.map(run, jobs))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def summary(self):
+        return " ".join(f"{k}={v}" for k, v in self.stats().items())
+
+
+def print_result(r):
+    """従来のログ形式で1行出す"""
+    label = r.kind or "file"
+    if r.skipped:
+        print(f"  Exists {label}: {r.dest.name}")
+    elif r.ok:
+        print(f"  Saved {label}: {r.dest.name}" + (" (resumed)" if r.resumed else ""))
+    else:
+        print(f"  └ Failed: {r.url} ({r.error})")
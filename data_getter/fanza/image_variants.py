@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+派生画像（縮小版・WebP/AVIF 版）を作る
+
+asset_store の blob ごとに、幅を落とした版と WebP/AVIF 版を
+content/assets/_v/ab/<sha256>_<幅>.<fmt> に作り、幅・高さ・サイズを
+manifest の variants テーブルに記録する。テンプレート側（posts.images）は
+これを見て srcset / <picture> を組み立てる。
+
+- 元画像（jpg）はそのまま最大サイズの候補として使うので、jpg は縮小版だけ作る
+- WebP/AVIF は縮小版に加えて原寸も作る
+- 原寸より大きい幅は作らない
+- 変換は multiprocessing のプールで並列に行う（Pillow を使う。無ければ何もしない）
+- AVIF は Pillow が対応していれば作る（pillow-avif-plugin でも可）
+
+  python fanza/image_variants.py backfill            # 既存の content/assets 全体
+  python fanza/image_variants.py backfill --force    # 作り直し
+  python fanza/image_variants.py stats
+"""
+import argparse
+import os
+import sys
+import time
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import asset_store
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 用途ごとに作る幅（一覧カード・関連枠は 240〜320px 程度で表示される）
+WIDTHS = {
+    "poster": (240, 480),
+    "sample": (320, 640),
+}
+QUALITY = {"jpg": 82, "webp": 78, "avif": 55}
+PIL_FORMAT = {"jpg": "JPEG", "webp": "WEBP", "avif": "AVIF"}
+
+
+def available_formats():
+    """この環境で書き出せる形式"""
+    if Image is None:
+        return ()
+    try:
+        import pillow_avif  # noqa: F401  AVIF プラグイン（入っていれば）
+    except ImportError:
+        pass
+    Image.init()
+    return tuple(f for f in ("avif", "webp", "jpg") if PIL_FORMAT[f] in Image.SAVE)
+
+
+def plan(orig_width, kind, formats):
+    """[(fmt, width)]。jpg は縮小版だけ、WebP/AVIF は原寸も"""
+    widths = [w for w in WIDTHS[kind] if orig_width is None or w < orig_width]
+    out = []
+    for fmt in formats:
+        out += [(fmt, w) for w in widths]
+        if fmt != "jpg" and orig_width:
+            out.append((fmt, orig_width))
+    return out
+
+
+def _render(job):
+    """
+    プールのワーカーで動く。1 blob ぶんの派生画像を書き出して
+    (hash, [(fmt, width, height, size, path)], error) を返す。
+    """
+    h, src, kind, assets_dir, formats = job
+    assets_dir = Path(assets_dir)
+    rows = []
+    try:
+        with Image.open(src) as im:
+            im.load()
+            if im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            for fmt, width in plan(im.width, kind, formats):
+                height = max(1, round(im.height * width / im.width))
+                out = im if width == im.width else im.resize((width, height), Image.LANCZOS)
+                dest = assets_dir / asset_store.VARIANTS_DIRNAME / h[:2] / f"{h}_{width}.{fmt}"
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                tmp = dest.with_name(f".{dest.name}.{os.getpid()}")
+                opts = {"quality": QUALITY[fmt]}
+                if fmt == "jpg":
+                    opts.update(optimize=True, progressive=True)
+                elif fmt == "webp":
+                    opts.update(method=4)
+                out.save(tmp, PIL_FORMAT[fmt], **opts)
+                os.replace(tmp, dest)
+                rows.append((fmt, width, height, dest.stat().st_size,
+                             str(dest.relative_to(assets_dir))))
+    except Exception as e:
+        return h, rows, f"{type(e).__name__}: {e}"
+    return h, rows, None
+
+
+def build(store, cids=None, processes=None, force=False, formats=None, verbose=False, start_method=None):
+    """
+    派生画像がまだの blob（cids を渡せばその CID のものだけ）を変換する。
+    件数の dict を返す。スレッドの動いているプロセスから呼ぶときは
+    start_method="forkserver" などにする（既定はプラットフォームの既定＝Linux では fork）
+    """
+    stats = {"blobs": 0, "files": 0, "bytes": 0, "failed": 0, "sec": 0.0}
+    formats = tuple(formats or available_formats())
+    if not formats:
+        print("[VARIANTS] Pillow が無いので派生画像は作りません")
+        return stats
+    pending = store.pending_variants(cids=cids, force=force)
+    if not pending:
+        return stats
+
+    t0 = time.time()
+    jobs = [(h, str(path), kind, str(store.assets_dir), formats)
+            for h, path, _w, kind in pending if path.exists()]
+    processes = processes or min(os.cpu_count() or 1, 8)
+    ctx = multiprocessing.get_context(start_method)
+    with ctx.Pool(processes=min(processes, len(jobs)) or 1) as pool:
+        for h, rows, error in pool.imap_unordered(_render, jobs, chunksize=4):
+            if error:
+                stats["failed"] += 1
+                print(f"[VARIANTS] 失敗 {h[:12]}: {error}")
+                continue
+            store.record_variants(h, rows)
+            stats["blobs"] += 1
+            stats["files"] += len(rows)
+            stats["bytes"] += sum(r[3] for r in rows)
+            if verbose and stats["blobs"] % 500 == 0:
+                print(f"[VARIANTS] {stats['blobs']}/{len(jobs)}")
+    stats["sec"] = round(time.time() - t0, 1)
+    return stats
+
+
+def format_stats(stats):
+    return " ".join(f"{k}={v}" for k, v in stats.items())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=str(asset_store.ROOT))
+    ap.add_argument("--assets", default=str(asset_store.ASSETS))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("backfill", help="既存の画像をストアに取り込み、派生画像を作る")
+    b.add_argument("--processes", type=int, default=None)
+    b.add_argument("--force", action="store_true", help="作成済みの blob も作り直す")
+    b.add_argument("--cids", nargs="*", default=None, help="この CID だけ")
+    sub.add_parser("stats", help="派生画像の件数と容量")
+    args = ap.parse_args()
+
+    store = asset_store.AssetStore(args.root, args.assets)
+    if args.cmd == "backfill":
+        n = store.import_dir()
+        if n:
+            print(f"[VARIANTS] ストアに {n} 件取り込み")
+        print("[VARIANTS] 形式:", ", ".join(available_formats()) or "-")
+        stats = build(store, cids=args.cids, processes=args.processes,
+                      force=args.force, verbose=True)
+        print("[VARIANTS]", format_stats(stats))
+    elif args.cmd == "stats":
+        with store._lock:
+            rows = store._db.execute(
+                "SELECT fmt, COUNT(*), SUM(size), AVG(size) FROM variants GROUP BY fmt ORDER BY fmt"
+            ).fetchall()
+            done, total = store._db.execute(
+                "SELECT COUNT(variants_at), COUNT(*) FROM blobs").fetchone()
+        print(f"blobs: {done}/{total} 済み")
+        for fmt, n, size, avg in rows:
+            print(f"  {fmt:4} {n:>7} 件  {size or 0:>12} bytes（平均 {int(avg or 0)}）")
+
+
+if __name__ == "__main__":
+    main()
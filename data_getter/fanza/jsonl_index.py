@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+JSONL を全部 json.loads せずに読むための共通処理
+
+- read_last / tail / read_first: ファイル末尾（先頭）からブロック単位で読み、
+  必要な行だけをパースする（generate_draft.read_last_json を一般化したもの）
+- find_last(path, cid): 末尾から逆向きに探して最初に当たった行を返す
+- LineIndex: 行頭オフセットの索引。<path>.lines に uint64 の配列で保存し、
+  mmap して引く。追記されたぶんだけ索引を伸ばし、ファイルが差し替え・切り詰め
+  られていたら作り直す
+- CidIndex: cid → 最後に出てきた行のオフセット。<path>.lines.cids に「cid<TAB>offset」で
+  追記していき、開くときはこの小さいファイルだけを読む
+
+書きかけの最終行（改行で終わっていない行）は索引に入れない。
+
+  python fanza/jsonl_index.py last out/history.jsonl
+  python fanza/jsonl_index.py tail out/history.jsonl -n 5
+  python fanza/jsonl_index.py get out/history.jsonl sweet101
+  python fanza/jsonl_index.py index out/history.jsonl
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import re
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+BLOCK = 64 * 1024
+# 索引がそのファイルのものか確かめるために読む先頭のバイト数
+HEAD_BYTES = 4096
+# 索引ファイルのヘッダ: magic, inode, 索引済みのサイズ, 先頭の sha1（オフセット列が 8 バイト境界に乗るよう詰める）
+HEADER = struct.Struct("<8sQQ20s4x")
+MAGIC = b"JSONLIX1"
+CID_RE = re.compile(rb'"cid"\s*:\s*"([^"\\]+)"')
+
+
+def _loads(line):
+    try:
+        d = json.loads(line)
+    except ValueError:
+        return None
+    return d if isinstance(d, dict) else None
+
+
+def iter_lines_reverse(path, block=BLOCK):
+    """末尾から1行ずつ（bytes）返す。空行も返す"""
+    with open(path, "rb") as f:
+        pos = f.seek(0, 2)
+        rest = b""
+        while pos > 0:
+            n = min(block, pos)
+            pos -= n
+            f.seek(pos)
+            buf = f.read(n) + rest
+            lines = buf.split(b"\n")
+            # 先頭の断片は前のブロックとつながるので持ち越す
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                yield line
+        yield rest
+
+
+def iter_records_reverse(path):
+    """末尾から dict を返す（空行・壊れた行は飛ばす）"""
+    for line in iter_lines_reverse(path):
+        if line.strip():
+            d = _loads(line)
+            if d is not None:
+                yield d
+
+
+def read_last(path, pred=None):
+    """最後の有効なレコード（pred があれば pred(d) が真になる最後のもの）"""
+    if not Path(path).exists():
+        return None
+    for d in iter_records_reverse(path):
+        if pred is None or pred(d):
+            return d
+    return None
+
+
+def tail(path, n=10):
+    """最後の n 件（古い順）"""
+    if not Path(path).exists():
+        return []
+    out = []
+    for d in iter_records_reverse(path):
+        out.append(d)
+        if len(out) >= n:
+            break
+    return out[::-1]
+
+
+def read_first(path):
+    """最初の有効なレコード"""
+    if not Path(path).exists():
+        return None
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                d = _loads(line)
+                if d is not None:
+                    return d
+    return None
+
+
+def find_last(path, cid):
+    """cid が一致する最後のレコード（末尾から探す）"""
+    if not Path(path).exists():
+        return None
+    for line in iter_lines_reverse(path):
+        # json.loads する前に cid の文字列で絞る
+        if cid.encode("utf-8") not in line:
+            continue
+        d = _loads(line)
+        if d is not None and d.get("cid") == cid:
+            return d
+    return None
+
+
+def _head_digest(f, length):
+    f.seek(0)
+    return hashlib.sha1(f.read(min(length, HEAD_BYTES))).digest()
+
+
+class LineIndex:
+    """行頭オフセットの索引（<path>.lines を mmap して引く）"""
+
+    suffix = ".lines"
+
+    def __init__(self, path, index_path=None):
+        self.path = Path(path)
+        self.index_path = Path(index_path or str(self.path) + self.suffix)
+        self._mm = None
+        self._offsets = None
+        self._file = None
+        self.refresh()
+
+    # --- 索引の更新 ---
+    def _valid_header(self, st):
+        """索引が使えれば索引済みのサイズ、作り直しが要るなら None"""
+        try:
+            with self.index_path.open("rb") as ix:
+                magic, inode, size, head = HEADER.unpack(ix.read(HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or inode != st.st_ino or size > st.st_size:
+            return None
+        with self.path.open("rb") as f:
+            if _head_digest(f, size) != head:
+                return None
+        return size
+
+    def _scan(self, start):
+        """start から末尾までの完全な行の (行頭オフセット, 行) を返す"""
+        with self.path.open("rb") as f:
+            f.seek(start)
+            pos = start
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                yield pos, raw
+                pos += len(raw)
+
+    def _extend(self, entries, indexed):
+        """新しく読んだ行を索引に足す（子クラスは行ごとの処理を足す）"""
+        offsets = array("Q", (pos for pos, raw in entries if raw.strip()))
+        end = indexed
+        if entries:
+            end = entries[-1][0] + len(entries[-1][1])
+        return offsets, end
+
+    def refresh(self):
+        """ファイルに追記されたぶんを索引に足す（差し替えられていたら作り直す）"""
+        self.close()
+        if not self.path.exists():
+            self._offsets = memoryview(array("Q"))
+            return self
+        st = self.path.stat()
+        indexed = self._valid_header(st)
+        rebuild = indexed is None
+        if rebuild:
+            indexed = 0
+            self._reset()
+        entries = list(self._scan(indexed))
+        offsets, end = self._extend(entries, indexed)
+        if rebuild or entries:
+            with self.path.open("rb") as f:
+                head = _head_digest(f, end)
+            mode = "wb" if rebuild else "r+b"
+            with self.index_path.open(mode) as ix:
+                ix.seek(0)
+                ix.write(HEADER.pack(MAGIC, st.st_ino, end, head))
+                ix.seek(0, 2)
+                ix.write(offsets.tobytes())
+        self._open()
+        return self
+
+    def _reset(self):
+        pass
+
+    def _open(self):
+        size = self.index_path.stat().st_size
+        if size <= HEADER.size:
+            self._offsets = memoryview(array("Q"))
+            return
+        self._file = self.index_path.open("rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = memoryview(self._mm)[HEADER.size:].cast("Q")
+
+    def close(self):
+        if self._offsets is not None:
+            self._offsets.release()
+            self._offsets = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # --- 参照 ---
+    def __len__(self):
+        return len(self._offsets)
+
+    def offset(self, i):
+        return self._offsets[i]
+
+    def read_at(self, offset):
+        with self.path.open("rb") as f:
+            f.seek(offset)
+            return _loads(f.readline())
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.read_at(self._offsets[i])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CidIndex(LineIndex):
+    """cid → 最後に出てきた行のオフセット（<path>.lines.cids に追記していく）"""
+
+    def __init__(self, path, index_path=None):
+        self.cid_path = Path(str(index_path or str(path) + LineIndex.suffix) + ".cids")
+        self._cids = {}
+        super().__init__(path, index_path)
+
+    def _reset(self):
+        self._cids = {}
+        self.cid_path.unlink(missing_ok=True)
+
+    def _extend(self, entries, indexed):
+        offsets, end = super()._extend(entries, indexed)
+        pairs = []
+        for pos, raw in entries:
+            # "cid" が1回だけならトップレベルのものとみなして正規表現で拾う（大半の行はパースしない）
+            m = CID_RE.search(raw) if raw.count(b'"cid"') == 1 else None
+            if m:
+                cid = m.group(1).decode("utf-8", "replace")
+            else:
+                d = _loads(raw) if raw.strip() else None
+                cid = str(d.get("cid") or "") if d else ""
+            if cid:
+                pairs.append((cid, pos))
+        if pairs:
+            with self.cid_path.open("a", encoding="utf-8") as w:
+                w.writelines(f"{cid}\t{pos}\n" for cid, pos in pairs)
+        return offsets, end
+
+    def _open(self):
+        super()._open()
+        self._cids = {}
+        if self.cid_path.exists():
+            with self.cid_path.open(encoding="utf-8") as f:
+                for line in f:
+                    cid, _, pos = line.rstrip("\n").rpartition("\t")
+                    if cid and pos.isdigit():
+                        self._cids[cid] = int(pos)
+
+    def __contains__(self, cid):
+        return cid in self._cids
+
+    def get(self, cid):
+        """cid の最後のレコード（索引と食い違っていたら末尾から探し直す）"""
+        pos = self._cids.get(cid)
+        if pos is None:
+            return None
+        d = self.read_at(pos)
+        if d is not None and d.get("cid") == cid:
+            return d
+        return find_last(self.path, cid)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("last", help="最後のレコード")
+    p.add_argument("path")
+    p = sub.add_parser("tail", help="最後の n 件")
+    p.add_argument("path")
+    p.add_argument("-n", type=int, default=10)
+    p = sub.add_parser("get", help="cid の最後のレコード（索引を使う）")
+    p.add_argument("path")
+    p.add_argument("cid")
+    p = sub.add_parser("index", help="索引を作る・更新する")
+    p.add_argument("path")
+    args = ap.parse_args()
+
+    if args.cmd == "last":
+        recs = [read_last(args.path)]
+    elif args.cmd == "tail":
+        recs = tail(args.path, args.n)
+    elif args.cmd == "get":
+        with CidIndex(args.path) as ix:
+            recs = [ix.get(args.cid)]
+    else:
+        with CidIndex(args.path) as ix:
+            print(f"lines={len(ix)} cids={len(ix._cids)} index={ix.index_path}")
+        return
+    recs = [r for r in recs if r is not None]
+    if not recs:
+        print("(なし)")
+        sys.exit(1)
+    for r in recs:
+        sys.stdout.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+処理済み CID の台帳（SQLite）
+
+out/processed_cids.txt を毎回全部読んで set にし、1件ごとに追記していたのを置き換える。
+- cid は PRIMARY KEY なので「処理済みか」は索引1回で引ける（`cid in store`）
+- 状態（done / failed）、初回・最終の時刻、失敗回数、最後のエラーを持つ
+- mark_many() / batch() で複数件を1トランザクションでまとめて書ける
+- 初回オープン時に processed_cids.txt があれば一度だけ取り込み、.migrated に改名する
+
+失敗が MAX_FAILURES 回たまった CID は「あきらめた」扱いで処理済みと同じく候補から外す。
+
+  python fanza/processed_store.py stats
+  python fanza/processed_store.py forget sweet101   # 取り直したいとき
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+OUT = Path(__file__).resolve().parent.parent / "out"
+DB_PATH = OUT / "processed_cids.sqlite3"
+TEXT_PATH = OUT / "processed_cids.txt"
+MAX_FAILURES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    cid           TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,
+    first_seen_at REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    processed_at  REAL,
+    failures      INTEGER NOT NULL DEFAULT 0,
+    last_error    TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class ProcessedStore:
+    def __init__(self, path=DB_PATH, text_path=TEXT_PATH, max_failures=MAX_FAILURES):
+        self.path = Path(path)
+        self.max_failures = max_failures
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+        if text_path:
+            self.migrate_from_text(text_path)
+
+    # --- トランザクション ---
+    @contextmanager
+    def batch(self):
+        """中の書き込みを1トランザクションにまとめる（入れ子可）"""
+        with self._lock:
+            if self._depth == 0:
+                self._db.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._db.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._db.execute("COMMIT")
+
+    # --- 参照 ---
+    def __contains__(self, cid):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, failures FROM processed WHERE cid = ?", (cid,)
+            ).fetchone()
+        return bool(row) and (row[0] == "done" or row[1] >= self.max_failures)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def get(self, cid):
+        with self._lock:
+            cur = self._db.execute("SELECT * FROM processed WHERE cid = ?", (cid,))
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else None
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*), SUM(failures >= ?) FROM processed GROUP BY status",
+                (self.max_failures,),
+            ).fetchall()
+        out = {status: n for status, n, _ in rows}
+        out["gave_up"] = sum(g or 0 for s, _, g in rows if s == "failed")
+        return out
+
+    # --- 書き込み ---
+    def mark_many(self, cids, status="done"):
+        now = time.time()
+        done_at = now if status == "done" else None
+        rows = [(c, status, now, now, done_at) for c in dict.fromkeys(cids) if c]
+        with self.batch():
+            self._db.executemany(
+                "INSERT INTO processed (cid, status, first_seen_at, updated_at, processed_at)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(cid) DO UPDATE SET status = excluded.status,"
+                " updated_at = excluded.updated_at,"
+                " processed_at = COALESCE(excluded.processed_at, processed.processed_at)",
+                rows,
+            )
+        return len(rows)
+
+    def mark_done(self, cid):
+        self.mark_many([cid], "done")
+
+    def record_failure(self, cid, error=""):
+        now = time.time()
+        with self.batch():
+            self._db.execute(
+                "INSERT INTO processed (cid, status, first_seen_at, updated_at, failures, last_error)"
+                " VALUES (?, 'failed', ?, ?, 1, ?)"
+                " ON CONFLICT(cid) DO UPDATE SET failures = processed.failures + 1,"
+                " last_error = excluded.last_error, updated_at = excluded.updated_at,"
+                " status = CASE processed.status WHEN 'done' THEN 'done' ELSE 'failed' END",
+                (cid, now, now, str(error)[:1000]),
+            )
+
+    def forget(self, cid):
+        with self.batch():
+            return self._db.execute("DELETE FROM processed WHERE cid = ?", (cid,)).rowcount
+
+    # --- 移行 ---
+    def migrate_from_text(self, text_path=TEXT_PATH):
+        """processed_cids.txt を一度だけ取り込む。取り込んだ件数を返す"""
+        text_path = Path(text_path)
+        with self._lock:
+            done = self._db.execute("SELECT value FROM meta WHERE key = 'migrated_text'").fetchone()
+        if done or not text_path.exists():
+            return 0
+        cids = [l.strip() for l in text_path.read_text(encoding="utf-8").splitlines() if l.strip()]
+        with self.batch():
+            n = self.mark_many(cids, "done")
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('migrated_text', ?)",
+                (f"{text_path.name}:{n}:{int(time.time())}",),
+            )
+        try:
+            text_path.rename(text_path.with_name(text_path.name + ".migrated"))
+        except OSError:
+            pass
+        print(f"[HIST] {text_path.name} から {n} 件を取り込みました")
+        return n
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="状態ごとの件数")
+    f = sub.add_parser("forget", help="CID を台帳から消す（次回また候補になる）")
+    f.add_argument("cids", nargs="+")
+    g = sub.add_parser("show", help="CID の記録を表示")
+    g.add_argument("cid")
+    args = ap.parse_args()
+
+    store = ProcessedStore()
+    if args.cmd == "stats":
+        print(store.stats())
+    elif args.cmd == "forget":
+        print(sum(store.forget(c) for c in args.cids), "件削除")
+    elif args.cmd == "show":
+        print(store.get(args.cid))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+取得レコードのアーカイブ（圧縮セグメント + SQLite 索引）
+
+out/history.jsonl と out/daily/YYYYMMDD.jsonl は、追記前の重複確認のたびに
+ファイルを頭から全部 json.loads していた。ここでは
+
+- 本体: out/archive/seg-000001.z ... に1レコードずつ zlib（共有辞書つき）で圧縮して追記する
+  （フレームは [長さ 4byte][codec 1byte][圧縮データ]。SEGMENT_MAX を超えたら次のファイル）
+- 索引: out/archive/index.sqlite3 に cid / 日付 / セグメント / オフセット / 長さを持つ
+  - 「その日の daily にもう居るか」は (day, cid) の一意索引1回
+  - 「history の末尾の CID」は (history, seq) の索引1回（本体は読まない）
+  - CID ごとの最新レコード・日付や期間での取り出しは索引 → 該当フレームだけ読む
+- 同じレコードが history と daily の両方に入るときも本体は1つ（フラグで持つ）
+- 月ごとに Parquet へまとめ直せる（pyarrow があれば。無ければ jsonl.gz）
+
+追記は BEGIN IMMEDIATE の中でセグメントへ書いてから索引を入れるので、
+別プロセスから同時に追記してもオフセットはずれない。索引に入る前に落ちた
+フレームはセグメント末尾のゴミとして残るだけで、読まれない。
+
+  python fanza/record_archive.py import              # 既存の history.jsonl / daily/*.jsonl を取り込む
+  python fanza/record_archive.py stats
+  python fanza/record_archive.py last
+  python fanza/record_archive.py get sweet101
+  python fanza/record_archive.py export --since 20250101 > backfill.jsonl
+  python fanza/record_archive.py rollup 202501
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+OUT = Path(__file__).resolve().parent.parent / "out"
+ROOT = OUT / "archive"
+HISTORY_JSONL = OUT / "history.jsonl"
+DAILY_DIR = OUT / "daily"
+# 1セグメントの上限（超えたら次のファイルに書く）
+SEGMENT_MAX = 64 * 1024 * 1024
+
+FRAME = struct.Struct(">IB")
+CODEC_ZLIB_V1 = 1
+# 共有辞書（よく出るキーと URL の頭）。既存フレームが読めなくなるので中身は変えないこと。
+# 変えるときは CODEC を増やして新しい辞書を足す
+ZDICT_V1 = (
+    '"cid": "", "title": "", "name": "", "maker": "", "label": "", "series": "", '
+    '"genres": [], "performers": [], "sizes": "", "sizes_text": "", "date": "", '
+    '"review_body": "", "review": "", "description": "", "poster_url": "", '
+    '"sample_movie_url": "", "sample_images": [], "affiliate_url": "", "_ts": "", '
+    '"https://al.dmm.co.jp/?lurl=https%3A%2F%2Fvideo.dmm.co.jp%2Famateur%2Fcontent%2F%3Fid%3D'
+    '"https://pics.dmm.co.jp/digital/amateur/", "https://www.dmm.co.jp/litevideo/-/part/=/cid=", '
+    '"https://video.dmm.co.jp/amateur/content/?id=", jp-001.jpg", jp-002.jpg", js-001.jpg", '
+    'pl.jpg", jm.jpg", "素人", "ハメ撮り", "巨乳", "美乳", "スレンダー", "中出し", "パイパン", '
+    '"T", " B", "(", "cm)", " W", " H", "00:00:00"'
+).encode("utf-8")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq      INTEGER PRIMARY KEY,
+    cid      TEXT NOT NULL,
+    day      TEXT NOT NULL,
+    ts       TEXT,
+    digest   TEXT NOT NULL,
+    segment  INTEGER NOT NULL,
+    offset   INTEGER NOT NULL,
+    length   INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    history  INTEGER NOT NULL DEFAULT 0,
+    daily    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS records_cid ON records(cid, seq);
+CREATE INDEX IF NOT EXISTS records_day ON records(day, seq);
+CREATE INDEX IF NOT EXISTS records_history ON records(history, seq);
+CREATE UNIQUE INDEX IF NOT EXISTS records_daily ON records(day, cid) WHERE daily = 1;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def day_of(rec):
+    """daily に入れる日付（YYYYMMDD）。レコードの date、無ければ今日"""
+    return (rec.get("date") or datetime.now().strftime("%Y-%m-%d")).split(" ")[0].replace("-", "")
+
+
+def encode(rec):
+    raw = json.dumps(rec, ensure_ascii=False).encode("utf-8")
+    c = zlib.compressobj(9, zlib.DEFLATED, 15, 9, zlib.Z_DEFAULT_STRATEGY, ZDICT_V1)
+    data = c.compress(raw) + c.flush()
+    return raw, FRAME.pack(len(data), CODEC_ZLIB_V1) + data
+
+
+def decode(frame):
+    length, codec = FRAME.unpack_from(frame)
+    if codec != CODEC_ZLIB_V1:
+        raise ValueError(f"unknown codec: {codec}")
+    d = zlib.decompressobj(15, ZDICT_V1)
+    raw = d.decompress(frame[FRAME.size:FRAME.size + length]) + d.flush()
+    return json.loads(raw)
+
+
+class RecordArchive:
+    def __init__(self, root=ROOT, segment_max=SEGMENT_MAX):
+        self.root = Path(root)
+        self.segment_max = segment_max
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.root / "index.sqlite3"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    def segment_path(self, n):
+        return self.root / f"seg-{n:06d}.z"
+
+    def _current_segment(self):
+        n = self._db.execute("SELECT MAX(segment) FROM records").fetchone()[0] or 1
+        path = self.segment_path(n)
+        if path.exists() and path.stat().st_size >= self.segment_max:
+            n += 1
+        return n
+
+    # --- 追記 ---
+    def append(self, rec, day=None, history=True, daily=True):
+        """
+        1レコード追記する。
+        - history: 末尾の CID が同じなら入れない
+        - daily: 同じ日に同じ CID が既にあれば入れない
+        (history に入ったか, daily に入ったか) を返す
+        """
+        cid = rec.get("cid")
+        if not cid:
+            raise ValueError("cid が無いレコードは追記できません")
+        day = day or day_of(rec)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                to_history = history and self._last_history_cid() != cid
+                to_daily = daily and not self._has_daily(day, cid)
+                if to_history or to_daily:
+                    self._insert(rec, day, to_history, to_daily)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return to_history, to_daily
+
+    def _insert(self, rec, day, history, daily, digest=None, raw=None, frame=None):
+        if frame is None:
+            raw, frame = encode(rec)
+        digest = digest or hashlib.sha1(raw).hexdigest()
+        segment = self._current_segment()
+        with self.segment_path(segment).open("ab") as f:
+            offset = f.seek(0, 2)
+            f.write(frame)
+        self._db.execute(
+            "INSERT INTO records (cid, day, ts, digest, segment, offset, length, raw_size, history, daily)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (rec["cid"], day, rec.get("_ts"), digest, segment, offset, len(frame), len(raw),
+             int(history), int(daily)),
+        )
+
+    # --- 参照 ---
+    def _last_history_cid(self):
+        row = self._db.execute(
+            "SELECT cid FROM records WHERE history = 1 ORDER BY seq DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def _has_daily(self, day, cid):
+        return self._db.execute(
+            "SELECT 1 FROM records WHERE day = ? AND cid = ? AND daily = 1", (day, cid)).fetchone() is not None
+
+    def last_history_cid(self):
+        with self._lock:
+            return self._last_history_cid()
+
+    def has_daily(self, day, cid):
+        with self._lock:
+            return self._has_daily(day, cid)
+
+    def has_day(self, day):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM records WHERE day = ? AND daily = 1 LIMIT 1", (day,)).fetchone() is not None
+
+    def _read(self, segment, offset, length):
+        with self.segment_path(segment).open("rb") as f:
+            f.seek(offset)
+            return decode(f.read(length))
+
+    def last(self):
+        """history の末尾のレコード"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT segment, offset, length FROM records WHERE history = 1 ORDER BY seq DESC LIMIT 1"
+            ).fetchone()
+        return self._read(*row) if row else None
+
+    def get(self, cid):
+        """その CID の最新のレコード"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT segment, offset, length FROM records WHERE cid = ? ORDER BY seq DESC LIMIT 1", (cid,)
+            ).fetchone()
+        return self._read(*row) if row else None
+
+    def iter_records(self, stream=None, day=None, since=None, until=None, cids=None):
+        """
+        条件に合うレコードを追記順に返す。stream は "history" / "daily" / None（全部）、
+        day・since・until は YYYYMMDD（since / until は両端を含む）
+        """
+        where, args = [], []
+        if stream in ("history", "daily"):
+            where.append(f"{stream} = 1")
+        if day:
+            where.append("day = ?")
+            args.append(day)
+        if since:
+            where.append("day >= ?")
+            args.append(since)
+        if until:
+            where.append("day <= ?")
+            args.append(until)
+        if cids:
+            cids = list(cids)
+            where.append(f"cid IN ({', '.join('?' * len(cids))})")
+            args += cids
+        sql = "SELECT segment, offset, length FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY seq", args).fetchall()
+
+        # セグメントは開きっぱなしにして順に読む
+        f, current = None, None
+        try:
+            for segment, offset, length in rows:
+                if segment != current:
+                    if f:
+                        f.close()
+                    f, current = self.segment_path(segment).open("rb"), segment
+                f.seek(offset)
+                yield decode(f.read(length))
+        finally:
+            if f:
+                f.close()
+
+    def stats(self):
+        with self._lock:
+            n, hist, daily, days, raw, stored = self._db.execute(
+                "SELECT COUNT(*), SUM(history), SUM(daily), COUNT(DISTINCT day),"
+                " SUM(raw_size), SUM(length) FROM records"
+            ).fetchone()
+            segments = self._db.execute("SELECT COUNT(DISTINCT segment) FROM records").fetchone()[0]
+        return {
+            "records": n, "history": hist or 0, "daily": daily or 0, "days": days,
+            "segments": segments, "raw_bytes": raw or 0, "stored_bytes": stored or 0,
+        }
+
+    # --- 既存 JSONL の取り込み ---
+    def import_jsonl(self, path, history=False, day=None, mark=None):
+        """
+        history.jsonl（history=True）や daily/YYYYMMDD.jsonl（day=...）を取り込む。
+        同じ CID・同じ中身の行が既にあればフラグだけ立てる。取り込んだ行数を返す。
+        mark を渡すと、同じトランザクションで meta に「このファイルは取り込み済み」を残す
+        """
+        added = 0
+        with self._lock, open(path, encoding="utf-8") as src:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for line in src:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not isinstance(rec, dict) or not rec.get("cid"):
+                        continue
+                    rec_day = day or day_of(rec)
+                    raw, frame = encode(rec)
+                    digest = hashlib.sha1(raw).hexdigest()
+                    if day and self._has_daily(rec_day, rec["cid"]):
+                        continue
+                    # もう一方（history / daily）で取り込み済みの同じ中身なら本体は共有する
+                    flag = "history" if history else "daily"
+                    row = self._db.execute(
+                        f"SELECT seq FROM records WHERE cid = ? AND digest = ? AND day = ? AND {flag} = 0"
+                        " ORDER BY seq DESC LIMIT 1", (rec["cid"], digest, rec_day)
+                    ).fetchone()
+                    if row:
+                        self._db.execute(f"UPDATE records SET {flag} = 1 WHERE seq = ?", row)
+                        continue
+                    self._insert(rec, rec_day, history, bool(day), digest, raw, frame)
+                    added += 1
+                if mark:
+                    self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                     (mark, datetime.now(timezone.utc).isoformat()))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return added
+
+    def import_legacy(self, history_path=HISTORY_JSONL, daily_dir=DAILY_DIR):
+        """
+        history.jsonl と daily/*.jsonl をまとめて取り込む（初回の移行用）。
+        ファイルごとに取り込み済みの印を残すので、途中で落ちても再実行で続きから
+        （history の取り込みは重複を見ないので、2回読むと二重になる）
+        """
+        with self._lock:
+            done = {k for (k,) in self._db.execute("SELECT key FROM meta WHERE key LIKE 'legacy:%'")}
+        n = 0
+        if Path(history_path).exists() and "legacy:history" not in done:
+            n += self.import_jsonl(history_path, history=True, mark="legacy:history")
+        for p in sorted(Path(daily_dir).glob("*.jsonl")):
+            if p.stem.isdigit() and len(p.stem) == 8 and f"legacy:daily:{p.stem}" not in done:
+                n += self.import_jsonl(p, day=p.stem, mark=f"legacy:daily:{p.stem}")
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_at', ?)",
+                             (datetime.now(timezone.utc).isoformat(),))
+        return n
+
+    def imported(self):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM meta WHERE key = 'imported_at'").fetchone() is not None
+
+    # --- 月次のまとめ ---
+    def rollup(self, month, out_dir=None):
+        """
+        YYYYMM のレコードを1ファイルにまとめる。pyarrow があれば Parquet
+        （入れ子の値は JSON 文字列の列にする）、無ければ jsonl.gz。書いたパスを返す
+        """
+        out_dir = Path(out_dir or self.root / "rollup")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        recs = list(self.iter_records(since=f"{month}01", until=f"{month}31"))
+        if not recs:
+            return None
+        if pyarrow is None:
+            path = out_dir / f"{month}.jsonl.gz"
+            with gzip.open(path, "wt", encoding="utf-8") as w:
+                for rec in recs:
+                    w.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            return path
+        columns = sorted({k for rec in recs for k in rec})
+        table = pyarrow.table({
+            k: [v if v is None or isinstance(v, (str, int, float, bool)) else json.dumps(v, ensure_ascii=False)
+                for v in (rec.get(k) for rec in recs)]
+            for k in columns
+        })
+        path = out_dir / f"{month}.parquet"
+        pyarrow.parquet.write_table(table, path, compression="zstd")
+        return path
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=str(ROOT))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    i = sub.add_parser("import", help="既存の history.jsonl / daily/*.jsonl を取り込む")
+    i.add_argument("--history", default=str(HISTORY_JSONL))
+    i.add_argument("--daily-dir", default=str(DAILY_DIR))
+    sub.add_parser("stats", help="件数と圧縮後の容量")
+    sub.add_parser("last", help="history の末尾のレコード")
+    g = sub.add_parser("get", help="CID の最新のレコード")
+    g.add_argument("cid")
+    e = sub.add_parser("export", help="条件に合うレコードを JSONL で標準出力へ（バックフィル用）")
+    e.add_argument("--stream", choices=("history", "daily"), default=None)
+    e.add_argument("--day", default=None, help="YYYYMMDD")
+    e.add_argument("--since", default=None, help="YYYYMMDD（この日を含む）")
+    e.add_argument("--until", default=None, help="YYYYMMDD（この日を含む）")
+    e.add_argument("--cids", nargs="*", default=None)
+    r = sub.add_parser("rollup", help="月ごとに Parquet（無ければ jsonl.gz）へまとめる")
+    r.add_argument("month", help="YYYYMM")
+    args = ap.parse_args()
+
+    archive = RecordArchive(args.root)
+    if args.cmd == "import":
+        n = archive.import_legacy(args.history, args.daily_dir)
+        print(f"[ARCHIVE] 取り込み {n} 件")
+        args.cmd = "stats"
+    if args.cmd == "stats":
+        st = archive.stats()
+        ratio = st["stored_bytes"] / st["raw_bytes"] if st["raw_bytes"] else 0
+        print(" ".join(f"{k}={v}" for k, v in st.items()), f"ratio={ratio:.2f}")
+    elif args.cmd in ("last", "get"):
+        rec = archive.last() if args.cmd == "last" else archive.get(args.cid)
+        if rec is None:
+            print("(なし)")
+            sys.exit(1)
+        print(json.dumps(rec, ensure_ascii=False, indent=2))
+    elif args.cmd == "export":
+        for rec in archive.iter_records(args.stream, args.day, args.since, args.until, args.cids):
+            sys.stdout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    elif args.cmd == "rollup":
+        path = archive.rollup(args.month)
+        print(f"[ARCHIVE] {path}" if path else "[ARCHIVE] 対象のレコードがありません")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+サンプル画像 URL をブラウザを使わずに決める
+
+1. API の sampleImageURL（あれば）を大サイズ（js-NNN → jp-NNN）に読み替える
+2. 無ければ pics.dmm.co.jp の命名規則 {cid}jp-NNN / {cid}js-NNN から候補を作る
+3. 候補を Downloader.exists_many() で並行に HEAD して、実在するものだけ残す
+   （命名規則の候補は BATCH 本ずつ確かめ、欠けた番号で打ち切る）
+
+HEAD は軽いので、画像ダウンロード用のホスト予算（間隔つき）には通さず、
+間隔なしの Downloader を渡すこと（blog_videoc_today.get_prober）。
+
+ここで1枚も取れなかったときだけ、呼び出し側がブラウザ（fetch_exact_samples）に回す。
+
+  python fanza/sample_resolver.py sweet101
+"""
+import argparse
+import json
+import re
+import sys
+import time
+
+import downloader
+
+PICS_BASE = "https://pics.dmm.co.jp/digital/amateur"
+LIMIT = 10
+# 命名規則の候補を一度に HEAD する本数
+BATCH = 4
+IMG_EXT = r"(jpg|jpeg|webp|png)"
+
+
+def norm(u):
+    return (u or "").split("?", 1)[0].split("#", 1)[0]
+
+
+def large_of(url, cid=""):
+    """js-NNN → jp-NNN、{cid}jm → {cid}jp に読み替えた URL（変わらなければそのまま）"""
+    base = norm(url)
+    cand = re.sub(rf"/([A-Za-z0-9_]+)js-([0-9]+)\.{IMG_EXT}$", r"/\1jp-\2.\3", base)
+    if cid:
+        cand = re.sub(rf"/(?:{re.escape(cid)})jm\.{IMG_EXT}$", rf"/{cid}jp.\1", cand)
+    return cand
+
+
+def pattern_candidates(cid, size="jp", limit=LIMIT):
+    """命名規則から作る連番の候補（size は jp=大 / js=小）"""
+    return [f"{PICS_BASE}/{cid}/{cid}{size}-{i:03d}.jpg" for i in range(1, limit + 1)]
+
+
+def probe_sequence(cid, size, dl, limit=LIMIT, batch=BATCH):
+    """
+    連番の候補を batch 本ずつ並行に HEAD し、最初に欠けた番号で打ち切る
+    （連番なので先頭から続いているぶんだけ採る。無い作品は最初の batch 本で終わる）
+    """
+    cands = pattern_candidates(cid, size, limit)
+    found = []
+    for i in range(0, len(cands), batch):
+        part = cands[i:i + batch]
+        ok = dl.exists_many(part)
+        for u in part:
+            if not ok.get(u):
+                return found
+            found.append(u)
+    return found
+
+
+def _uniq(urls):
+    return list(dict.fromkeys(u for u in urls if u))
+
+
+def upgrade(urls, cid, dl):
+    """大サイズ版があればそちらに置き換える（HEAD はまとめて並行に投げる）"""
+    urls = _uniq(norm(u) for u in urls)
+    large = {u: large_of(u, cid) for u in urls}
+    ok = dl.exists_many(v for u, v in large.items() if v != u)
+    return _uniq(large[u] if ok.get(large[u]) else u for u in urls)
+
+
+def resolve(cid, api=None, dl=None, limit=LIMIT):
+    """
+    {"cid", "sample_images", "source", "sec", "notes"} を返す。
+    source は api / pattern-jp / pattern-js / none（none ならブラウザに回す）
+    """
+    started = time.monotonic()
+    own = dl is None
+    if own:
+        dl = downloader.Downloader(headers=downloader.HEADERS)
+    try:
+        imgs, source = [], "none"
+        api_imgs = (api or {}).get("sample_images") or []
+        if api_imgs:
+            imgs, source = upgrade(api_imgs[:limit], cid, dl), "api"
+        else:
+            for size in ("jp", "js"):
+                found = probe_sequence(cid, size, dl, limit)
+                if found:
+                    imgs, source = found, f"pattern-{size}"
+                    break
+    finally:
+        if own:
+            dl.close()
+    sec = round(time.monotonic() - started, 2)
+    return {
+        "cid": cid,
+        "sample_images": imgs,
+        "source": source,
+        "sec": sec,
+        "notes": [f"resolver={source}", f"found={len(imgs)}", f"sec={sec}"],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cid")
+    ap.add_argument("--limit", type=int, default=LIMIT)
+    args = ap.parse_args()
+    out = resolve(args.cid.strip(), limit=args.limit)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    if not out["sample_images"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
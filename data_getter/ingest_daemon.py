@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+常駐の取り込みデーモン（run_hourly.sh / scripts/eroblog_hourly.sh の置き換え）
+
+毎時 venv の Python を起動し直し、CID ごとに API・probe・サンプル取得の
+インタプリタを立て、最後に別 venv で manage.py を起動していたのをやめて、
+1つのプロセスの中で
+
+    discovery → 取得（API / probe / サンプル / 画像）→ マージ（postrun_archive）→ 取り込み（manage.py コマンド）
+
+を回す。ブラウザプール・API の keep-alive 接続・画像ダウンローダ・処理済み台帳・
+Django の DB 接続はプロセスが生きている間ずっと使い回す。
+
+- スケジューラ: --interval 秒ごと（--at-minute を付けると毎時その分に揃える）にキューへ積む
+- キュー: ジョブは1本のワーカースレッドが順番に処理する（取得処理は同時に2本走らせない）
+- 制御・ヘルスチェック（127.0.0.1 のみ）:
+    GET  /health          状態・直近の結果・次回予定
+    POST /run             今すぐ1回（本文 {"full_scan": true} 可）
+    POST /cids            {"cids": ["sweet101", ...]} を取り込む
+    POST /stop            今のジョブが終わったら止める
+
+Django（blog_builder）とデータ取得の依存を同じ venv に入れておくこと。
+
+  python ingest_daemon.py serve --interval 3600 --at-minute 5 --workers 3
+  python ingest_daemon.py status
+  python ingest_daemon.py run-now
+  python ingest_daemon.py cids sweet101 mfcs185
+"""
+import argparse
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from contextlib import redirect_stdout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent
+BLOG_BUILDER = BASE.parent / "blog_builder"
+CONTROL_URL = os.environ.get("INGEST_DAEMON_URL", "http://127.0.0.1:8766")
+IMPORT_COMMANDS = ("auto_populate_content", "auto_hourly_publish")
+# このプロセスはブラウザプール・HTTP サーバ・API キャッシュのスレッドが動いているので、
+# 派生画像・静的書き出しのプロセスプールは fork せず、スレッドの無い forkserver から起こす
+MP_START_METHOD = "forkserver"
+# /health に載せるログの行数
+LOG_TAIL = 200
+
+_STOP = object()
+
+
+def setup_django():
+    sys.path.insert(0, str(BLOG_BUILDER))
+    os.environ.setdefault("STATIC_EXPORT_START_METHOD", MP_START_METHOD)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "blog_builder.settings")
+    import django
+    django.setup()
+
+
+class _Tee(io.TextIOBase):
+    """
+    print をそのまま出しつつ、直近の行をリングバッファに残す。
+    どのスレッドからも書かれるので、health() と同じロックの中で足す
+    """
+
+    def __init__(self, out, lines, lock):
+        self.out, self.lines, self.lock, self._buf = out, lines, lock, ""
+
+    def write(self, s):
+        self.out.write(s)
+        with self.lock:
+            self._buf += s
+            *done, self._buf = self._buf.split("\n")
+            self.lines.extend(done)
+            del self.lines[:-LOG_TAIL]
+        return len(s)
+
+    def flush(self):
+        self.out.flush()
+
+
+class IngestDaemon:
+    def __init__(self, interval=3600, at_minute=None, auto_limit=20, workers=1,
+                 host_concurrency=2, host_interval=0.25, import_command="auto_populate_content"):
+        self.interval = interval
+        self.at_minute = at_minute
+        self.auto_limit = auto_limit
+        self.workers = workers
+        self.host_concurrency = host_concurrency
+        self.host_interval = host_interval
+        self.import_command = import_command
+
+        self.queue = queue.Queue()
+        self.started_at = time.time()
+        self.next_run = None
+        self.current = None
+        self.last = None
+        self.counters = {"runs": 0, "ok": 0, "failed": 0, "cids": 0, "imported_runs": 0}
+        self.log = []
+        # _Tee（print）からも取るので、握ったまま print しても詰まらないよう RLock
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+
+    # --- スケジュール ---
+    def _next_after(self, now):
+        if self.at_minute is None:
+            return now + self.interval
+        t = datetime.fromtimestamp(now).replace(minute=self.at_minute, second=0, microsecond=0)
+        ts = t.timestamp()
+        while ts <= now:
+            ts += self.interval
+        return ts
+
+    def _scheduler(self):
+        self.next_run = self._next_after(time.time())
+        while not self._stopping.wait(min(30, max(0, self.next_run - time.time()))):
+            if time.time() >= self.next_run:
+                self.submit("cycle", source="schedule")
+                self.next_run = self._next_after(time.time())
+
+    def submit(self, kind, **params):
+        job = {"kind": kind, "params": params, "queued_at": time.time()}
+        # 定期実行がたまっていたら積み増さない（前回が長引いたとき）
+        if kind == "cycle" and params.get("source") == "schedule":
+            with self.queue.mutex:
+                if any(j is not _STOP and j["kind"] == "cycle" for j in self.queue.queue):
+                    return None
+        self.queue.put(job)
+        return job
+
+    # --- 1回分 ---
+    def _cycle(self, cids=(), full_scan=False, **_):
+        import blog_videoc_today as getter
+        from django.core.management import call_command
+        from django.db import close_old_connections
+
+        done = getter.ingest(
+            cids, auto=not cids, auto_limit=self.auto_limit, full_scan=full_scan,
+            workers=self.workers, host_concurrency=self.host_concurrency,
+            host_interval=self.host_interval, keep_pool=True, mp_start=MP_START_METHOD,
+        )
+        if not done:
+            return {"cids": []}
+        getter.postrun_archive()
+
+        close_old_connections()
+        try:
+            # 再取得したレビュー・サイズ・画像も反映させるため upsert で取り込む
+            call_command(self.import_command, jsonl=str(getter.JSONL), upsert=True)
+        finally:
+            close_old_connections()
+        return {"cids": done}
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is _STOP:
+                return
+            params = job["params"]
+            with self._lock:
+                self.current = {"kind": job["kind"], "started_at": time.time(), **params}
+            print(f"[INGEST] start {job['kind']} {params}", flush=True)
+            result = {"kind": job["kind"], "started_at": self.current["started_at"], **params}
+            try:
+                out = self._cycle(**params)
+                result.update(ok=True, **out)
+                with self._lock:
+                    self.counters["ok"] += 1
+                    self.counters["cids"] += len(out["cids"])
+                    self.counters["imported_runs"] += bool(out["cids"])
+            except BaseException as e:
+                # SystemExit（取得側の sys.exit）もここで止めてデーモンは生かす
+                traceback.print_exc()
+                result.update(ok=False, error=f"{type(e).__name__}: {e}")
+                with self._lock:
+                    self.counters["failed"] += 1
+            result["finished_at"] = time.time()
+            result["sec"] = round(result["finished_at"] - result["started_at"], 1)
+            with self._lock:
+                self.counters["runs"] += 1
+                self.current = None
+                self.last = result
+            print(f"[INGEST] done ok={result['ok']} cids={len(result.get('cids') or [])}"
+                  f" sec={result['sec']}", flush=True)
+
+    def health(self):
+        import browser_pool
+        with self._lock:
+            body = {
+                "ok": self.last is None or self.last.get("ok", False),
+                "uptime": round(time.time() - self.started_at),
+                "queued": self.queue.qsize(),
+                "current": self.current,
+                "last": self.last,
+                "next_run": datetime.fromtimestamp(self.next_run).isoformat(timespec="seconds")
+                if self.next_run else None,
+                "counters": dict(self.counters),
+                "log": self.log[-40:],
+            }
+        pool = browser_pool._local_pool
+        body["browser_pool"] = pool.stats() if pool is not None else None
+        return body
+
+    # --- 起動 ---
+    def serve(self, host="127.0.0.1", port=8766, run_now=False):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code, body):
+                raw = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _body(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(n) or b"{}")
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._send(200, daemon.health())
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                name = self.path.strip("/")
+                try:
+                    data = self._body()
+                except ValueError:
+                    return self._send(400, {"error": "invalid json"})
+                if not isinstance(data, dict):
+                    return self._send(400, {"error": "body must be a json object"})
+                if name == "run":
+                    job = daemon.submit("cycle", source="manual", full_scan=bool(data.get("full_scan")))
+                elif name == "cids":
+                    raw = data.get("cids") or []
+                    if not isinstance(raw, list) or not all(isinstance(c, str) for c in raw):
+                        return self._send(400, {"error": "cids must be a list of strings"})
+                    cids = [c.strip() for c in raw if c.strip()]
+                    if not cids:
+                        return self._send(400, {"error": "cids is empty"})
+                    job = daemon.submit("cycle", source="manual", cids=cids)
+                elif name == "stop":
+                    daemon.stop()
+                    return self._send(200, {"ok": True, "stopping": True})
+                else:
+                    return self._send(404, {"error": f"unknown: {name}"})
+                self._send(202, {"ok": True, "queued": daemon.queue.qsize(), "job": job})
+
+            def log_message(self, fmt, *args):
+                pass
+
+        httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd = httpd
+        worker = threading.Thread(target=self._worker, name="ingest-worker", daemon=True)
+        worker.start()
+        threading.Thread(target=self._scheduler, name="ingest-scheduler", daemon=True).start()
+        if run_now:
+            self.submit("cycle", source="startup")
+        print(f"[INGEST] listening on http://{host}:{port} interval={self.interval}s"
+              f" at_minute={self.at_minute}", flush=True)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            httpd.server_close()
+            worker.join()
+            import browser_pool
+            browser_pool.close_local_pool()
+            print("[INGEST] stopped", flush=True)
+
+    def stop(self):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self.queue.put(_STOP)
+        # serve_forever は別スレッドから止める必要がある
+        threading.Thread(target=self._httpd.shutdown, daemon=True).start()
+
+
+def control(path, payload=None, timeout=10):
+    data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(
+        f"{CONTROL_URL.rstrip('/')}/{path}", data=data, method="GET" if data is None else "POST",
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="常駐デーモンとして起動")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8766)
+    s.add_argument("--interval", type=int, default=3600, help="実行間隔・秒（既定=3600）")
+    s.add_argument("--at-minute", type=int, default=None, help="毎時この分に揃えて実行（0-59）")
+    s.add_argument("--run-now", action="store_true", help="起動直後に1回実行する")
+    s.add_argument("--auto-limit", type=int, default=20, help="1回で処理する未処理CIDの最大件数")
+    s.add_argument("--workers", type=int, default=1, help="並行して処理する CID 数")
+    s.add_argument("--host-concurrency", type=int, default=2)
+    s.add_argument("--host-interval", type=float, default=0.25)
+    s.add_argument("--import-command", choices=IMPORT_COMMANDS, default="auto_populate_content",
+                   help="取り込みに使う manage.py コマンド")
+    sub.add_parser("status", help="デーモンの状態を表示")
+    r = sub.add_parser("run-now", help="今すぐ1回実行させる")
+    r.add_argument("--full-scan", action="store_true")
+    c = sub.add_parser("cids", help="指定 CID を取り込ませる")
+    c.add_argument("cids", nargs="+")
+    sub.add_parser("stop", help="今のジョブが終わったら止める")
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        os.chdir(BASE)
+        sys.path.insert(0, str(BASE))
+        setup_django()
+        import blog_videoc_today
+        blog_videoc_today._ensure_fanza_env()
+        daemon = IngestDaemon(
+            interval=args.interval, at_minute=args.at_minute, auto_limit=args.auto_limit,
+            workers=args.workers, host_concurrency=args.host_concurrency,
+            host_interval=args.host_interval, import_command=args.import_command,
+        )
+        with redirect_stdout(_Tee(sys.stdout, daemon.log, daemon._lock)):
+            daemon.serve(args.host, args.port, run_now=args.run_now)
+        return
+
+    try:
+        if args.cmd == "status":
+            out = control("health")
+        elif args.cmd == "run-now":
+            out = control("run", {"full_scan": args.full_scan})
+        elif args.cmd == "cids":
+            out = control("cids", {"cids": args.cids})
+        else:
+            out = control("stop", {})
+    except (urllib.error.URLError, ConnectionError, OSError) as e:
+        print(f"[INGEST] not running: {e}")
+        sys.exit(1)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ BASE = Path(__file__).resolve().parent         # ~/eroblog
 OUT  = BASE / "out" / "items"
 JSONL= BASE / "out" / "videoc_latest_enriched.jsonl"
 CSVFP= BASE / "out" / "videoc_latest.csv"
-HIST = BASE / "out" / "processed_cids.txt"
+HIST = BASE / "out" / "processed_cids.sqlite3"
 API_HOST = "https://api.dmm.com/affiliate/v3/ItemList"
 
 # 親(ホーム)と自身を import パスへ
@@ -14,8 +14,16 @@ if str(BASE.parent) not in sys.path: sys.path.insert(0, str(BASE.parent))
 if str(BASE) not in sys.path: sys.path.insert(0, str(BASE))
 
 from eroblog.common.util import run_cmd, filter_sample_urls
+from eroblog.api import fetch_by_cid as api_client
+from fanza import discovery, processed_store
 from eroblog.merge.rules import merge as merge_rules
 
+DISCOVERY_VARIANTS = [
+    {"site":"FANZA","service":"digital","floor":"videoc"},
+    {"site":"DMM.com","service":"digital","floor":"videoc"},
+    {"site":"FANZA","service":"digital","floor":None},
+]
+
 def get_api_keys():
     aid = os.environ.get("API_ID") or "nAguP939XQHSFhANAPC9"
     aff = os.environ.get("AFFILIATE_ID") or "shinya39-995"
@@ -24,9 +32,7 @@ def get_api_keys():
     return aid, aff
 
 def api_latest_cids(limit=200):
-    import urllib.request as ur, urllib.parse as up, json
     aid, aff = get_api_keys()
-    API = API_HOST
     base = {"api_id":aid, "affiliate_id":aff, "output":"json", "sort":"date", "hits":100, "article":"video"}
 
     # 1) 第一候補：FANZA/digital/floor=videoc（ページング）
@@ -42,9 +48,8 @@ def api_latest_cids(limit=200):
     def fetch(params, offset=0):
         q = {**base, **params}
         if offset: q["offset"] = offset
-        url = API + "?" + up.urlencode({k:v for k,v in q.items() if v is not None})
-        with ur.urlopen(url, timeout=20) as r:
-            j = json.loads(r.read().decode("utf-8","replace"))
+        # api_client 経由（keep-alive + レスポンスキャッシュ）
+        j = api_client.call_itemlist({k:x for k,x in q.items() if x is not None})
         return (j.get("result") or {}).get("items") or []
 
     for v in variants:
@@ -75,20 +80,39 @@ def api_latest_cids(limit=200):
 
     return out[:limit]
 
+_store = None
+
 def load_history():
-    if not HIST.exists(): return set()
-    return {l.strip() for l in HIST.read_text(encoding="utf-8").splitlines() if l.strip()}
+    # 処理済み台帳（fanza/processed_store.py）。`cid in hist` は索引で引く
+    global _store
+    if _store is None: _store = processed_store.ProcessedStore(HIST)
+    return _store
 
 def append_history(cid: str):
-    HIST.parent.mkdir(parents=True, exist_ok=True)
-    with HIST.open("a", encoding="utf-8") as f: f.write(cid + "\n")
+    load_history().mark_done(cid)
 
 def pick_unseen(nth=1):
     hist = load_history()
-    cands = api_latest_cids(limit=max(200, nth))
-    unseen = [c for c in cands if c not in hist]
+    # 前回の位置（fanza/discovery.py）を越えるところまでだけ読む
+    aid, aff = get_api_keys()
+    base = {"api_id":aid, "affiliate_id":aff, "output":"json", "sort":"date", "article":"video"}
+    def fetch_page(v, offset, hits):
+        q = {**base, **v, "hits": hits, "offset": offset}
+        j = api_client.call_itemlist({k:x for k,x in q.items() if x is not None})
+        return (j.get("result") or {}).get("items") or []
+    # floor無しvariantはURLでamateurに限定
+    accept = lambda v, it: v.get("floor") is not None or "/amateur/" in (it.get("URL") or it.get("url") or "")
+    unseen, stats = discovery.discover(
+        fetch_page, DISCOVERY_VARIANTS, history=hist, limit=max(200, nth), hits=100, accept=accept
+    )
+    print("[DISCOVERY]", discovery.format_stats(stats))
+    candidates = stats["candidates"]
+    if stats["variant"] is None:
+        cands = api_latest_cids(limit=max(200, nth))
+        candidates = len(cands)
+        unseen = [c for c in cands if c not in hist]
     if not unseen:
-        print(f"[DEBUG] candidates={len(cands)} history={len(hist)}")
+        print(f"[DEBUG] candidates={candidates} history={len(hist)}")
         return None
     nth = max(1, nth)
     return unseen[nth-1] if len(unseen) >= nth else unseen[-1]
@@ -98,8 +122,7 @@ def pick_unseen(nth=1):
     return unseen[nth-1] if len(unseen) >= nth else unseen[-1]
 
 def api_fetch_by_cid(cid: str):
-    cmd = f'{sys.executable} {BASE/"api/fetch_by_cid.py"} --cid "{cid}"'
-    return json.loads(run_cmd(cmd))
+    return api_client.lookup(cid) or {"error": "not_found", "cid": cid}
 
 def probe_scrape(cid: str):
     url = f"https://video.dmm.co.jp/amateur/content/?id={cid}"
@@ -177,6 +200,7 @@ def main():
         append_history(cid)
         print(f"[OK] merged: {cid} images={len(enriched.get('sample_images') or [])} review_len={len((enriched.get('review_body') or ''))}")
 
+    print("[API]", api_client.default_client().summary())
     print("[DONE] JSONL:", JSONL, " CSV:", CSVFP, " HIST:", HIST)
 
 if __name__ == "__main__":
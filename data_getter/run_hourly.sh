@@ -1,6 +1,7 @@
 #!/usr/bin/env bash
 set -euo pipefail
 cd "$(dirname "$0")"
+# 常駐させる場合は cron ではなく `python ingest_daemon.py serve --at-minute 5` を使う（取得〜取り込みを1プロセスで回す）
 : "${API_ID:?API_ID is required}"
 : "${AFFILIATE_ID:?AFFILIATE_ID is required}"
 exec .venv/bin/python blog_videoc_today.py
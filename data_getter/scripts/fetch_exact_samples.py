@@ -3,8 +3,13 @@ import argparse, json, os, re, sys, time
 from urllib.parse import urlparse
 from pathlib import Path
 
-from playwright.sync_api import sync_playwright, TimeoutError
-import urllib.request as ur
+from playwright.sync_api import TimeoutError
+
+# ブラウザは data_getter/fanza/browser_pool.py のプールを使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "fanza"))
+from browser_pool import BrowserPool, daemon_call, pass_age_check
+import downloader
+import sample_resolver
 
 UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0 Safari/537.36"
 ALLOW_HOSTS = {"pics.dmm.co.jp","awsimgsrc.dmm.co.jp"}
@@ -23,20 +28,6 @@ def is_allowed_image(u:str)->bool:
         return True
     except: return False
 
-def agree_age(page):
-    try:
-        h1 = (page.locator("h1").first.inner_text(timeout=1200) or "")
-    except: h1 = ""
-    if "年齢認証" in h1:
-        for sel in ["text=同意する","text=はい","text=I Agree"]:
-            try:
-                btn = page.locator(sel).first
-                if btn.count():
-                    btn.click(timeout=2000)
-                    page.wait_for_load_state("networkidle", timeout=15000)
-                    break
-            except: pass
-
 def derive_from_og(cid:str, page):
     # og:image 例: https://pics.dmm.co.jp/digital/amateur/bini512/bini512jp.jpg
     try:
@@ -51,15 +42,14 @@ def derive_from_og(cid:str, page):
     cid2 = m.group(1)
     if cid2.lower() != cid.lower(): return []
     base_dir = og.rsplit("/",1)[0] + "/"
-    out = []
-    for i in range(1, 11):
-        cand = f"{base_dir}{cid}js-{i:03d}.jpg"
-        try:
-            req = ur.Request(cand, method="HEAD")
-            with ur.urlopen(req, timeout=6) as r:
-                if r.status < 400: out.append(cand)
-        except: pass
-    return out
+    cands = [f"{base_dir}{cid}js-{i:03d}.jpg" for i in range(1, 11)]
+    # HEAD は1本ずつではなくまとめて並行に
+    dl = downloader.Downloader(headers=downloader.HEADERS)
+    try:
+        ok = dl.exists_many(cands)
+    finally:
+        dl.close()
+    return [u for u in cands if ok.get(u)]
 
 def collect_images_for_cid(page, cid:str):
     urls = set()
@@ -81,57 +71,69 @@ def collect_images_for_cid(page, cid:str):
         except: pass
     return sorted(urls)
 
+def collect_samples(page, cid:str, timeout:int=120000)->dict:
+    """プールのページで作品ページを開き、サンプル画像 URL を集める"""
+    cid = cid.strip()
+    url = f"https://video.dmm.co.jp/amateur/content/?id={cid}"
+    page.set_default_timeout(timeout)
+
+    page.goto(url, wait_until="domcontentloaded")
+    pass_age_check(page)
+    # 遅延読込対策：軽くスクロール
+    try:
+        for _ in range(8):
+            page.mouse.wheel(0, 1200)
+            time.sleep(0.2)
+    except: pass
+    try:
+        page.wait_for_load_state("networkidle", timeout=15000)
+    except TimeoutError:
+        pass
+
+    imgs = collect_images_for_cid(page, cid)
+    if not imgs:
+        # フォールバック：og:image から js-### を派生
+        imgs = derive_from_og(cid, page)
+
+    return {
+        "cid": cid,
+        "url": url,
+        "sample_images": imgs,
+        "found": len(imgs),
+        "notes": [
+            f"dom={len(imgs)}",
+            f"engine=chromium",
+        ]
+    }
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--cid", required=True)
     ap.add_argument("--out", required=True)
     ap.add_argument("--headless", default="true")
     ap.add_argument("--timeout", type=int, default=120000)
+    ap.add_argument("--browser", action="store_true", help="命名規則からの推定を飛ばして最初からブラウザで集める")
     args = ap.parse_args()
 
     cid = args.cid.strip()
-    url = f"https://video.dmm.co.jp/amateur/content/?id={cid}"
-
-    with sync_playwright() as pw:
-        b = pw.chromium.launch(headless = (str(args.headless).lower()!="false"))
-        ctx = b.new_context(user_agent=UA, storage_state="dmm_storage_state.json" if Path("dmm_storage_state.json").exists() else None)
-        page = ctx.new_page()
-        page.set_default_timeout(args.timeout)
-
-        page.goto(url, wait_until="domcontentloaded")
-        agree_age(page)
-        # 遅延読込対策：軽くスクロール
-        try:
-            for _ in range(8):
-                page.mouse.wheel(0, 1200)
-                time.sleep(0.2)
-        except: pass
-        try:
-            page.wait_for_load_state("networkidle", timeout=15000)
-        except TimeoutError:
-            pass
-
-        imgs = collect_images_for_cid(page, cid)
-        if not imgs:
-            # フォールバック：og:image から js-### を派生
-            imgs = derive_from_og(cid, page)
-
-        out = {
-            "cid": cid,
-            "url": url,
-            "sample_images": imgs,
-            "found": len(imgs),
-            "notes": [
-                f"dom={len(imgs)}",
-                f"engine=chromium",
-                f"headless={str(args.headless).lower()!='false'}"
-            ]
-        }
+    headless = str(args.headless).lower() != "false"
 
+    # まず命名規則の候補を並行 HEAD で確かめる（取れればブラウザは起動しない）
+    out = None if args.browser else sample_resolver.resolve(cid)
+    if out and out["sample_images"]:
         Path(args.out).parent.mkdir(parents=True, exist_ok=True)
         Path(args.out).write_text(json.dumps(out, ensure_ascii=False, separators=(",",":")), encoding="utf-8")
+        return
+
+    # 常駐プール（fanza/browser_pool.py serve）があればそちらで実行
+    out = daemon_call("samples", {"cid": cid, "timeout": args.timeout}) if headless else None
+    if out is None:
+        with BrowserPool(size=1, headless=headless) as pool:
+            out = pool.run(collect_samples, cid, args.timeout)
+    out["notes"].append(f"headless={headless}")
 
-        ctx.close(); b.close()
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.out).write_text(json.dumps(out, ensure_ascii=False, separators=(",",":")), encoding="utf-8")
 
 if __name__ == "__main__":
     main()
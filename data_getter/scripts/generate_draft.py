@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
-import json, re
+import json, re, sys
 from pathlib import Path
 from datetime import datetime
 
 BASE = Path(__file__).resolve().parents[1]          # eroblog/data_getter
+sys.path.insert(0, str(BASE / "fanza"))
+import jsonl_index
 EROBLOG = BASE.parent                                # eroblog/
 JSONL_PATH = BASE / "out" / "videoc_latest_enriched.jsonl"
 DRAFTS_DIR = EROBLOG / "content" / "drafts"
@@ -18,32 +20,6 @@ def slug(s: str) -> str:
     s = re.sub(r"[^\w\-_.ぁ-んァ-ン一-龯]", "", s)
     return s[:80] or "untitled"
 
-def read_last_json(path: Path):
-    if not path.exists():
-        return None
-    with path.open("rb") as f:
-        f.seek(0, 2)
-        size = f.tell()
-        buf = b""
-        step = 4096
-        pos = size
-        while pos > 0:
-            n = min(step, pos)
-            pos -= n
-            f.seek(pos)
-            buf = f.read(n) + buf
-            if b"\n" in buf:
-                break
-        for line in reversed(buf.splitlines()):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                return json.loads(line.decode("utf-8"))
-            except Exception:
-                return None
-    return None
-
 def pick_review(d: dict) -> str:
     for k in ("review_html", "review", "review_body", "description"):
         v = d.get(k)
@@ -102,7 +78,7 @@ def build_markdown(d: dict) -> str:
     return "\n".join(front + body)
 
 def main():
-    data = read_last_json(JSONL_PATH)
+    data = jsonl_index.read_last(JSONL_PATH)
     if not data:
         print("[FAIL] JSONLの末尾から有効なデータを取得できませんでした。")
         return
@@ -7,9 +7,20 @@ from generate_draft import EROBLOG, DRAFTS_DIR, QUEUE_DIR, slug, build_markdown
 BASE   = Path(EROBLOG, "data_getter")
 DAILY  = BASE / "out" / "daily"
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "fanza"))
+import record_archive
+
 def iter_daily(date_str: str):
     fp = DAILY / f"{date_str}.jsonl"
     if not fp.exists():
+        # ARCHIVE_JSONL=0 で daily/*.jsonl を書いていない場合はアーカイブから読む
+        archive = record_archive.RecordArchive()
+        try:
+            if archive.has_day(date_str):
+                yield from archive.iter_records("daily", day=date_str)
+                return
+        finally:
+            archive.close()
         print(f"[FAIL] daily not found: {fp}")
         return
     with fp.open(encoding="utf-8") as f:
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
-import json, os
+import json, os, sys
 from pathlib import Path
-from datetime import datetime
 
 BASE = Path(__file__).resolve().parents[1]   # eroblog/data_getter
 EROBLOG = BASE.parent
@@ -9,67 +8,59 @@ LATEST = BASE / "out" / "videoc_latest_enriched.jsonl"
 HIST   = BASE / "out" / "history.jsonl"
 DAILY_DIR = BASE / "out" / "daily"
 EXPORT = EROBLOG / "content" / "exports" / "latest.jsonl"
+# 重複確認・末尾の参照はアーカイブ（fanza/record_archive.py）の索引で行う。
+# history.jsonl / daily/*.jsonl は従来の読み手のために書き続ける（ARCHIVE_JSONL=0 で止める）
+WRITE_JSONL = os.environ.get("ARCHIVE_JSONL", "1") != "0"
 
-DAILY_DIR.mkdir(parents=True, exist_ok=True)
-
-def read_last_nonempty(path: Path):
-    if not path.exists(): return None
-    last = None
-    with path.open(encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                last = json.loads(line)
-    return last
+sys.path.insert(0, str(BASE / "fanza"))
+import jsonl_index
+import record_archive
 
-def already_in_daily(day_path: Path, cid: str) -> bool:
-    if not day_path.exists(): return False
-    with day_path.open(encoding="utf-8") as f:
-        for line in f:
-            if not line.strip(): continue
-            try:
-                d = json.loads(line)
-            except Exception:
-                continue
-            if d.get("cid") == cid:
-                return True
-    return False
+DAILY_DIR.mkdir(parents=True, exist_ok=True)
 
 def main():
     if not LATEST.exists():
         print("[INFO] latest jsonl not found"); return
-    with LATEST.open(encoding="utf-8") as f:
-        rec = None
-        for ln in f:
-            if ln.strip():
-                rec = json.loads(ln)
+    rec = jsonl_index.read_last(LATEST)
     if not rec:
         print("[INFO] latest jsonl empty"); return
 
     # 付加情報
     rec.setdefault("_ts", (__import__('datetime').datetime.now(__import__('datetime').timezone.utc).isoformat()))
-    day = (rec.get("date") or datetime.now().strftime("%Y-%m-%d")).split(" ")[0].replace("-","")
+    day = record_archive.day_of(rec)
     day_path = DAILY_DIR / f"{day}.jsonl"
 
     # exports/latest.jsonl に同期（上書き）
     EXPORT.parent.mkdir(parents=True, exist_ok=True)
     EXPORT.write_text(json.dumps(rec, ensure_ascii=False) + "\n", encoding="utf-8")
 
-    # history.jsonl（末尾とCIDが同じならスキップ）
-    prev = read_last_nonempty(HIST)
-    if not prev or prev.get("cid") != rec.get("cid"):
-        with HIST.open("a", encoding="utf-8") as w:
-            w.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    archive = record_archive.RecordArchive()
+    try:
+        # 初回だけ既存の history.jsonl / daily を取り込む
+        if not archive.imported():
+            n = archive.import_legacy(HIST, DAILY_DIR)
+            print("[OK] archive imported:", n)
+        # history（末尾とCIDが同じならスキップ）・daily（同一日内で同一CIDは重複登録しない）
+        hist_added, daily_added = archive.append(rec, day)
+    finally:
+        archive.close()
+
+    line = json.dumps(rec, ensure_ascii=False) + "\n"
+    if hist_added:
+        if WRITE_JSONL:
+            with HIST.open("a", encoding="utf-8") as w:
+                w.write(line)
         print("[OK] history appended:", rec.get("cid"))
     else:
         print("[SKIP] history same cid:", rec.get("cid"))
 
-    # daily/YYYYMMDD.jsonl（同一日内で同一CIDは重複登録しない）
-    if already_in_daily(day_path, rec.get("cid")):
-        print("[SKIP] daily already has:", rec.get("cid"))
-    else:
-        with day_path.open("a", encoding="utf-8") as w:
-            w.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    if daily_added:
+        if WRITE_JSONL:
+            with day_path.open("a", encoding="utf-8") as w:
+                w.write(line)
         print("[OK] daily appended:", day_path.name, rec.get("cid"))
+    else:
+        print("[SKIP] daily already has:", rec.get("cid"))
 
 if __name__ == "__main__":
     main()
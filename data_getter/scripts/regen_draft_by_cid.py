@@ -5,26 +5,19 @@ from datetime import datetime
 
 # 既存の generate_draft を利用
 from generate_draft import EROBLOG, DRAFTS_DIR, QUEUE_DIR, slug, build_markdown
+import jsonl_index
 
 BASE  = Path(EROBLOG, "data_getter")
 JSONL = BASE / "out" / "videoc_latest_enriched.jsonl"
+HIST  = BASE / "out" / "history.jsonl"
 ITEMS = BASE / "out" / "items"
 
 def load_from_jsonl(cid: str):
-    if not JSONL.exists():
-        return None
-    hit = None
-    with JSONL.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                d = json.loads(line)
-            except Exception:
-                continue
-            if d.get("cid") == cid:
-                hit = d
+    # 直近の取得結果 → history.jsonl（cid 索引）の順に探す
+    hit = jsonl_index.find_last(JSONL, cid)
+    if hit is None and HIST.exists():
+        with jsonl_index.CidIndex(HIST) as ix:
+            hit = ix.get(cid)
     return hit
 
 def merge_api_probe(cid: str):
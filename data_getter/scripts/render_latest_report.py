@@ -3,6 +3,10 @@ import json, subprocess, sys, html, datetime
 from pathlib import Path
 
 BASE   = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE / "fanza"))
+import api_fetch_by_cid
+import jsonl_index
+
 OUTDIR = BASE / "out"
 JSONL  = OUTDIR / "videoc_latest_enriched.jsonl"
 ITEMS  = OUTDIR / "items"
@@ -16,18 +20,17 @@ def sh(cmd):
 def load_enriched():
     if not JSONL.exists():
         raise SystemExit("out/videoc_latest_enriched.jsonl がありません")
-    line = [l for l in JSONL.read_text(encoding="utf-8").splitlines() if l.strip()]
-    if not line:
+    enr = jsonl_index.read_first(JSONL)
+    if not enr:
         raise SystemExit("enriched.jsonl が空です")
-    return json.loads(line[0])
+    return enr
 
 def ensure_api_json(cid):
     api_path = ITEMS / f"{cid}_api.json"
     if api_path.exists():
         return json.loads(api_path.read_text(encoding="utf-8"))
-    # 取得（既存の api_fetch_by_cid.py を利用）
-    js = sh(f'{sys.executable} fanza/api_fetch_by_cid.py --cid "{cid}"')
-    data = json.loads(js)
+    # 取得（api_fetch_by_cid をプロセス内で利用）
+    data = api_fetch_by_cid.lookup(cid) or {"error": "not_found", "cid": cid}
     api_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
     return data
 
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+fanza/record_archive.py のテスト（一時ディレクトリで完結する）
+
+  cd data_getter && python -m unittest discover -s tests
+"""
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "fanza"))
+import record_archive  # noqa: E402
+
+
+def rec(cid, date="2025-01-01", **kwargs):
+    return {"cid": cid, "date": date, "title": f"title {cid}", **kwargs}
+
+
+def write_jsonl(path, recs):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs), encoding="utf-8")
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def archive(self, **kwargs):
+        return record_archive.RecordArchive(self.tmp / "archive", **kwargs)
+
+
+class AppendTests(ArchiveTestCase):
+    def test_same_cid_at_history_tail_is_skipped(self):
+        a = self.archive()
+        self.assertEqual(a.append(rec("a1")), (True, True))
+        # 末尾と同じ CID は history に入らない（別の日なら daily には入る）
+        self.assertEqual(a.append(rec("a1", "2025-01-02")), (False, True))
+        self.assertEqual(a.append(rec("b1")), (True, True))
+        # 末尾でなければ同じ CID でも history に入る
+        self.assertEqual(a.append(rec("a1", "2025-01-03")), (True, True))
+        self.assertEqual(a.last_history_cid(), "a1")
+        self.assertEqual([r["cid"] for r in a.iter_records(stream="history")], ["a1", "b1", "a1"])
+
+    def test_same_day_and_cid_in_daily_is_skipped(self):
+        a = self.archive()
+        self.assertEqual(a.append(rec("a1"), history=False), (False, True))
+        self.assertEqual(a.append(rec("a1", title="changed"), history=False), (False, False))
+        self.assertTrue(a.has_daily("20250101", "a1"))
+        self.assertFalse(a.has_daily("20250102", "a1"))
+        self.assertEqual(a.stats()["records"], 1)
+
+    def test_nothing_written_when_both_skipped(self):
+        a = self.archive()
+        a.append(rec("a1"))
+        self.assertEqual(a.append(rec("a1")), (False, False))
+        self.assertEqual(a.stats()["records"], 1)
+        self.assertEqual(a.get("a1"), rec("a1"))
+
+    def test_cid_is_required(self):
+        with self.assertRaises(ValueError):
+            self.archive().append({"title": "no cid"})
+
+
+class SegmentTests(ArchiveTestCase):
+    def test_rolls_over_to_next_segment(self):
+        a = self.archive(segment_max=200)
+        recs = [rec(f"c{i:03d}", review_body="x" * 50 + str(i)) for i in range(20)]
+        for r in recs:
+            a.append(r)
+        st = a.stats()
+        self.assertGreater(st["segments"], 1)
+        for n in range(1, st["segments"]):
+            # 上限を超えた時点で次へ移るので、最後以外は上限以上になる
+            self.assertGreaterEqual(a.segment_path(n).stat().st_size, 200)
+        # セグメントをまたいでも追記順どおりに読める
+        self.assertEqual(list(a.iter_records()), recs)
+        self.assertEqual(a.get("c007"), recs[7])
+
+    def test_reopen_continues_in_last_segment(self):
+        a = self.archive(segment_max=10 ** 6)
+        a.append(rec("a1"))
+        b = self.archive(segment_max=10 ** 6)
+        b.append(rec("b1"))
+        self.assertEqual(b.stats()["segments"], 1)
+        self.assertEqual([r["cid"] for r in b.iter_records()], ["a1", "b1"])
+
+
+class ImportLegacyTests(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        self.history = self.tmp / "out" / "history.jsonl"
+        self.daily = self.tmp / "out" / "daily"
+        write_jsonl(self.history, [rec(f"h{i}") for i in range(5)])
+        write_jsonl(self.daily / "20250101.jsonl", [rec("h0")])
+        write_jsonl(self.daily / "20250102.jsonl", [rec("d1", "2025-01-02")])
+
+    def test_shared_body_between_history_and_daily(self):
+        a = self.archive()
+        self.assertEqual(a.import_legacy(self.history, self.daily), 6)
+        st = a.stats()
+        self.assertEqual((st["records"], st["history"], st["daily"]), (6, 5, 2))
+        self.assertTrue(a.imported())
+
+    def test_resumes_after_failure_without_duplicating_history(self):
+        a = self.archive()
+        original = a.import_jsonl
+
+        def fail_on_second_day(path, **kwargs):
+            if Path(path).stem == "20250102":
+                raise RuntimeError("boom")
+            return original(path, **kwargs)
+
+        a.import_jsonl = fail_on_second_day
+        with self.assertRaises(RuntimeError):
+            a.import_legacy(self.history, self.daily)
+        self.assertFalse(a.imported())
+
+        a.import_jsonl = original
+        self.assertEqual(a.import_legacy(self.history, self.daily), 1)
+        self.assertTrue(a.imported())
+        st = a.stats()
+        self.assertEqual((st["history"], st["daily"]), (5, 2))
+        self.assertEqual([r["cid"] for r in a.iter_records(stream="history")], [f"h{i}" for i in range(5)])
+
+        # 全部済んでいれば何も読まない
+        self.assertEqual(a.import_legacy(self.history, self.daily), 0)
+        self.assertEqual(a.stats()["history"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,12 +5,22 @@ FANZA videoc / amateur(content) 詳細ページから
 - name / label / sizes / review_body / series
 - sample_images（サンプル画像URL配列）
 JSON を stdout へ。
+ブラウザは browser_pool.py のプールを使う（常駐デーモンが起動していればそちらへ依頼）。
 使い方:
   python fanza/videoc_probe.py "https://video.dmm.co.jp/amateur/content/?id=sweet101" [--manual] [--save-cookies]
 """
-import sys, re, json, time, os, argparse
+import sys, re, json, time, argparse
+from pathlib import Path
 from urllib.parse import urlparse, parse_qs, unquote
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+from playwright.sync_api import TimeoutError as PWTimeout
+
+# browser_pool.py は data_getter/fanza にある（scrape/ からも同じものを使う）
+_HERE = Path(__file__).resolve().parent
+for _d in (_HERE, _HERE.parent / "data_getter" / "fanza"):
+    if (_d / "browser_pool.py").exists():
+        sys.path.insert(0, str(_d))
+        break
+from browser_pool import BrowserPool, daemon_call, pass_age_check
 
 UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0 Safari/537.36"
 FW2HW = str.maketrans("０１２３４５６７８９", "0123456789")
@@ -281,10 +291,20 @@ def open_sample_tab(page):
         if click_if_exists(page, sel): return True
     return False
 
-def lazy_scroll(page, steps=34, pause_ms=420):
+def lazy_scroll(page, steps=34, pause_ms=420, settle=3):
+    """下までスクロールして遅延読込させる。位置も画像数も settle 回続けて変わらなければ打ち切る"""
+    last, still = None, 0
     for _ in range(steps):
         page.mouse.wheel(0, 1600)
         page.wait_for_timeout(pause_ms)
+        try:
+            now = page.evaluate("() => [Math.round(window.scrollY), document.images.length]")
+        except Exception:
+            continue
+        still = still + 1 if now == last else 0
+        if still >= settle:
+            break
+        last = now
 
 def collect_samples(page, timeout_ms):
     imgs = set()
@@ -366,6 +386,37 @@ def collect_samples(page, timeout_ms):
 
     return sorted(imgs)
 
+def probe_page(page, url:str, samples:bool=True)->dict:
+    """
+    プールのページで詳細ページを開いて各項目を取る（トップ訪問・Cookie はプール側）。
+    samples=False ならサンプル画像の収集（スクロール待ち）を省く（sample_resolver で別に取る場合）
+    """
+    url = resolve_url(url or "")
+    cid = extract_cid(url) or ""
+    try:
+        page.goto(url, wait_until="networkidle", timeout=45000)
+    except:
+        try: page.goto(url, wait_until="domcontentloaded", timeout=30000)
+        except: pass
+
+    # 年齢認証対応
+    pass_age_check(page)
+
+    try: title = (page.locator("h1").first.inner_text(timeout=2000) or "").strip()
+    except: title = ""
+
+    return {
+        "cid": cid,
+        "url_resolved": url,
+        "title": title,
+        "name": get_name(page, title),
+        "label": get_label(page),
+        "series": get_series(page),
+        "sizes": get_sizes(page),
+        "review_body": collect_review(page),
+        "sample_images": collect_samples(page, timeout_ms=180000) if samples else [],
+    }
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("url", nargs="?", help="target URL")
@@ -374,66 +425,20 @@ def main():
     args = ap.parse_args()
 
     url = resolve_url(args.url or "")
-    cid = extract_cid(url) or ""
 
-    with sync_playwright() as p:
-        headless = not args.manual
-        browser = p.chromium.launch(headless=headless, args=["--no-sandbox","--disable-dev-shm-usage","--lang=ja-JP"])
-        ctx = browser.new_context(user_agent=UA, locale="ja-JP", extra_http_headers={"Referer":"https://video.dmm.co.jp/"})
-        try:
-            if os.path.exists("cookies.json"):
-                ctx.add_cookies(json.load(open("cookies.json","r",encoding="utf-8")))
-        except: pass
-        try:
-            ctx.add_cookies([
-                {"name":"ckcy","value":"1","domain":".dmm.co.jp","path":"/"},
-                {"name":"age_check_done","value":"1","domain":".dmm.co.jp","path":"/"},
-            ])
-        except: pass
+    # 常駐プール（browser_pool.py serve）があればそちらで実行
+    out = None
+    if not args.manual and not args.save_cookies:
+        out = daemon_call("probe", {"url": url})
 
-        page = ctx.new_page()
-        try:
-            page.goto("https://video.dmm.co.jp/", wait_until="domcontentloaded", timeout=20000)
-        except: pass
-        try:
-            page.goto(url, wait_until="networkidle", timeout=45000)
-        except:
-            try: page.goto(url, wait_until="domcontentloaded", timeout=30000)
-            except: pass
-
-        # 年齢認証対応
-        try:
-            h1 = (page.locator("h1").first.inner_text(timeout=1500) or "")
-        except: h1 = ""
-        if "年齢認証" in h1:
-            for q in ["はい","同意","I Agree"]:
-                try:
-                    page.get_by_role("link", name=re.compile(q)).first.click(timeout=2000)
-                    page.wait_for_load_state("networkidle", timeout=10000)
-                    break
+    if out is None:
+        with BrowserPool(size=1, headless=not args.manual) as pool:
+            out = pool.run(probe_page, url)
+            if args.save_cookies:
+                try: json.dump(pool.cookies(), open("cookies.json","w",encoding="utf-8"), ensure_ascii=False, indent=2)
                 except: pass
 
-        try: title = (page.locator("h1").first.inner_text(timeout=2000) or "").strip()
-        except: title = ""
-
-        out = {
-            "cid": cid,
-            "url_resolved": url,
-            "title": title,
-            "name": get_name(page, title),
-            "label": get_label(page),
-            "series": get_series(page),
-            "sizes": get_sizes(page),
-            "review_body": collect_review(page),
-            "sample_images": collect_samples(page, timeout_ms=180000),
-        }
-
-        print(json.dumps(out, ensure_ascii=False, indent=2))
-        if args.save_cookies:
-            try: json.dump(ctx.cookies(), open("cookies.json","w",encoding="utf-8"), ensure_ascii=False, indent=2)
-            except: pass
-        try: ctx.close(); browser.close()
-        except: pass
+    print(json.dumps(out, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
     main()